@@ -1,6 +1,12 @@
 import os
+import csv
+import hashlib
 import json
+import math
+import sqlite3
+import tempfile
 import pandas as pd
+from contextlib import contextmanager
 from datetime import datetime
 
 SUBMISSIONS_DIR = "submissions"
@@ -9,6 +15,23 @@ LEADERBOARD_DIR = "leaderboard"
 LEADERBOARD_MD = os.path.join(LEADERBOARD_DIR, "leaderboard.md")
 LEADERBOARD_HISTORY = os.path.join(LEADERBOARD_DIR, "leaderboard_history.csv")
 LEADERBOARD_JSON = os.path.join(LEADERBOARD_DIR, "leaderboard.json")
+LEADERBOARD_DB = os.path.join(LEADERBOARD_DIR, "leaderboard.db")
+
+# Bootstrap confidence intervals from scoring_script.py (empty when absent)
+CI_COLUMNS = [
+    f"{metric}_ci_{side}"
+    for metric in ["f1_ideal", "f1_perturbed", "robustness_gap"]
+    for side in ["low", "high"]
+]
+
+HISTORY_COLUMNS = [
+    "participant",
+    "f1_ideal",
+    "f1_perturbed",
+    "robustness_gap",
+    "timestamp",
+    *CI_COLUMNS
+]
 
 os.makedirs(LEADERBOARD_DIR, exist_ok=True)
 
@@ -20,31 +43,11 @@ def load_history():
     if os.path.exists(LEADERBOARD_HISTORY):
         df = pd.read_csv(LEADERBOARD_HISTORY)
     else:
-        df = pd.DataFrame(columns=[
-            "participant",
-            "f1_ideal",
-            "f1_perturbed",
-            "robustness_gap",
-            "timestamp"
-        ])
+        df = pd.DataFrame(columns=HISTORY_COLUMNS)
 
     return df
 
 
-# -------------------------------------------------
-# Append new score entries safely
-# -------------------------------------------------
-def append_scores(entries):
-    history_df = load_history()
-    new_df = pd.DataFrame(entries)
-
-    history_df = pd.concat([history_df, new_df], ignore_index=True)
-    history_df.to_csv(LEADERBOARD_HISTORY, index=False)
-
-    print("History updated →", LEADERBOARD_HISTORY)
-    return history_df
-
-
 # -------------------------------------------------
 # Keep BEST score per participant
 # Ranking Priority:
@@ -75,70 +78,398 @@ def get_best_scores(df):
 
 
 # -------------------------------------------------
-# Save best scores to leaderboard.json
+# Indexed store
+#
+# Every submission is appended to an SQLite table; a second table keeps the
+# best submission per participant, keyed by the ranking rules above and
+# indexed in rank order. An insert is one primary-key lookup plus at most
+# one upsert, so its cost does not grow with the number of submissions.
+# Missing values rank last, exactly as in get_best_scores(); exact ties
+# keep the earlier submission.
+#
+# Writers take an IMMEDIATE transaction, so local updates serialise on the
+# database lock and output files are written while it is held. Runners do
+# not share the file; CI runs are serialised by the workflow's concurrency
+# group instead.
+#
+# leaderboard_history.csv is the committed source of truth; leaderboard.db
+# is an index of it (git-ignored; CI carries it between runs in the
+# Actions cache). The store records the size and tail digest of the CSV
+# it last wrote. When the CSV no longer matches (cache miss, or a pull
+# brought new rows), the store is rebuilt from the CSV before new entries
+# are added. Checking costs O(1), not a scan of the history.
 # -------------------------------------------------
-def write_leaderboard_json(history_df):
-    best_df = get_best_scores(history_df)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    participant TEXT NOT NULL,
+    f1_ideal REAL,
+    f1_perturbed REAL,
+    robustness_gap REAL,
+    timestamp TEXT,
+    ts REAL,
+    f1_ideal_ci_low REAL,
+    f1_ideal_ci_high REAL,
+    f1_perturbed_ci_low REAL,
+    f1_perturbed_ci_high REAL,
+    robustness_gap_ci_low REAL,
+    robustness_gap_ci_high REAL
+);
+CREATE TABLE IF NOT EXISTS best (
+    participant TEXT PRIMARY KEY,
+    submission_id INTEGER NOT NULL REFERENCES submissions(id),
+    f1_key REAL NOT NULL,
+    gap_key REAL NOT NULL,
+    ts_key REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS best_rank ON best (f1_key DESC, gap_key DESC, ts_key DESC);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Sentinels below any real value (F1 >= 0, gap >= -1, epoch seconds)
+_MISSING_F1 = -1.0
+_MISSING_GAP = -1e9
+_MISSING_TS = -1e18
+
+
+def _number(value):
+    value = pd.to_numeric(value, errors="coerce")
+    return None if pd.isna(value) else float(value)
+
+
+def _epoch(timestamp):
+    ts = pd.to_datetime(timestamp, errors="coerce", utc=True)
+    return None if pd.isna(ts) else ts.timestamp()
+
+
+def rank_key(f1_perturbed, robustness_gap, ts):
+    """Larger is better: perturbed F1, then lower gap, then later timestamp."""
+    return (
+        _MISSING_F1 if f1_perturbed is None else f1_perturbed,
+        _MISSING_GAP if robustness_gap is None else -robustness_gap,
+        _MISSING_TS if ts is None else ts,
+    )
+
+
+class LeaderboardStore:
+
+    def __init__(self, path=LEADERBOARD_DB, timeout=60.0):
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+        # Databases created before confidence intervals were recorded
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(submissions)")}
+        for col in CI_COLUMNS:
+            if col not in existing:
+                self.conn.execute(f"ALTER TABLE submissions ADD COLUMN {col} REAL")
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+
+    def add(self, entry):
+        """Append one submission; True if it became its participant's best."""
+        timestamp = entry.get("timestamp")
+        return self._add(
+            entry["participant"],
+            _number(entry.get("f1_ideal")),
+            _number(entry.get("f1_perturbed")),
+            _number(entry.get("robustness_gap")),
+            None if timestamp is None else str(timestamp),
+            _epoch(timestamp),
+            [_number(entry.get(col)) for col in CI_COLUMNS],
+        )
+
+    def _add(self, participant, f1_ideal, f1_perturbed, gap, timestamp, ts, intervals):
+        cursor = self.conn.execute(
+            "INSERT INTO submissions "
+            "(participant, f1_ideal, f1_perturbed, robustness_gap, timestamp, ts, "
+            f"{', '.join(CI_COLUMNS)}) "
+            f"VALUES (?, ?, ?, ?, ?, ?{', ?' * len(CI_COLUMNS)})",
+            (participant, f1_ideal, f1_perturbed, gap, timestamp, ts, *intervals),
+        )
+        key = rank_key(f1_perturbed, gap, ts)
+
+        current = self.conn.execute(
+            "SELECT f1_key, gap_key, ts_key FROM best WHERE participant = ?",
+            (participant,),
+        ).fetchone()
+        if current is not None and key <= tuple(current):
+            return False
+
+        self.conn.execute(
+            "INSERT INTO best (participant, submission_id, f1_key, gap_key, ts_key) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(participant) DO UPDATE SET submission_id = excluded.submission_id, "
+            "f1_key = excluded.f1_key, gap_key = excluded.gap_key, ts_key = excluded.ts_key",
+            (participant, cursor.lastrowid, *key),
+        )
+        return True
+
+    def best(self):
+        """Best submission per participant, in rank order."""
+        return self.conn.execute(
+            "SELECT s.* FROM best b JOIN submissions s ON s.id = b.submission_id "
+            "ORDER BY b.f1_key DESC, b.gap_key DESC, b.ts_key DESC"
+        ).fetchall()
+
+    def reset(self):
+        self.conn.execute("DELETE FROM best")
+        self.conn.execute("DELETE FROM submissions")
+
+    def in_sync(self, path):
+        """True if ``path`` is the history CSV this store last wrote."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'history'").fetchone()
+        return row is not None and row["value"] == _file_stamp(path)
+
+    def mark_synced(self, path):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('history', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (_file_stamp(path),),
+        )
+
+    def history(self):
+        return self.conn.execute("SELECT * FROM submissions ORDER BY id")
+
+    def import_history_csv(self, path):
+        """Add every row of a leaderboard_history.csv; returns the row count."""
+        df = pd.read_csv(path)
+
+        def column(name):
+            if name not in df.columns:
+                return [None] * len(df)
+            values = pd.to_numeric(df[name], errors="coerce")
+            return [None if pd.isna(v) else float(v) for v in values]
+
+        ts = pd.to_datetime(df["timestamp"], errors="coerce", utc=True)
+        rows = zip(
+            df["participant"].astype(str),
+            column("f1_ideal"),
+            column("f1_perturbed"),
+            column("robustness_gap"),
+            [None if pd.isna(t) else str(t) for t in df["timestamp"]],
+            [None if pd.isna(t) else t.timestamp() for t in ts],
+            zip(*[column(col) for col in CI_COLUMNS]),
+        )
+        for row in rows:
+            self._add(*row)
+        return len(df)
+
+
+# -------------------------------------------------
+# Output formatting
+# -------------------------------------------------
+def _display_times(timestamps):
+    """Timestamps as get_best_scores() renders them, parsed in one call."""
+    return [str(ts) for ts in pd.to_datetime(pd.Series(timestamps, dtype=object), errors="coerce")]
+
+
+def _interval(row, metric):
+    low, high = row[f"{metric}_ci_low"], row[f"{metric}_ci_high"]
+    return None if low is None or high is None else [low, high]
+
+
+def _fmt(value, spec=""):
+    value = math.nan if value is None else value
+    return format(value, spec) if spec else str(value)
+
+
+def _atomic_write(path, text):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
 
+
+# -------------------------------------------------
+# Save best scores to leaderboard.json
+# -------------------------------------------------
+def write_leaderboard_json(store):
     leaderboard = {}
 
-    for row in best_df.itertuples(index=False):
-        leaderboard[row.participant] = {
-            "participant": row.participant,
-            "f1_ideal": float(row.f1_ideal),
-            "f1_perturbed": float(row.f1_perturbed),
-            "robustness_gap": float(row.robustness_gap),
-            "timestamp": str(row.timestamp)
+    best = store.best()
+    times = _display_times([row["timestamp"] for row in best])
+    for row, ts in zip(best, times):
+        leaderboard[row["participant"]] = {
+            "participant": row["participant"],
+            "f1_ideal": float(_fmt(row["f1_ideal"])),
+            "f1_perturbed": float(_fmt(row["f1_perturbed"])),
+            "robustness_gap": float(_fmt(row["robustness_gap"])),
+            "timestamp": ts,
+            **{
+                f"{metric}_ci": _interval(row, metric)
+                for metric in ["f1_ideal", "f1_perturbed", "robustness_gap"]
+            }
         }
 
-    with open(LEADERBOARD_JSON, "w") as f:
-        json.dump(leaderboard, f, indent=4)
-
+    _atomic_write(LEADERBOARD_JSON, json.dumps(leaderboard, indent=4))
     print("Best leaderboard saved →", LEADERBOARD_JSON)
 
 
 # -------------------------------------------------
 # Write leaderboard markdown for GitHub
+#
+# leaderboard.md holds the ranked best-per-participant table followed by
+# the full submission history. New submissions are appended to the end;
+# the ranking above the history is only rewritten when a participant's
+# best changes, and then the existing history section is copied over
+# verbatim instead of being re-rendered from the store.
 # -------------------------------------------------
-def write_leaderboard_markdown(history_df):
+HISTORY_MD_HEADER = (
+    "\n---\n"
+    "### 📜 Submission History\n\n"
+    "| Participant | F1 Ideal | F1 Perturbed | Gap | Timestamp |\n"
+    "|------------|----------|--------------|-----|-----------|\n"
+)
+
+
+def _ranking_markdown(store):
+    lines = [
+        "# 🏆 GNN Robustness Challenge Leaderboard\n\n",
+        "Best submission per participant (ranked by perturbed performance).\n\n",
+        "| Rank | Participant | F1 Ideal | F1 Perturbed | Perturbed CI | Robustness Gap | Gap CI | Timestamp |\n",
+        "|------|------------|----------|--------------|--------------|----------------|--------|-----------|\n",
+    ]
+
+    best = store.best()
+    if not best:
+        lines.append("| - | - | - | - | - | - | - | - |\n")
+    times = _display_times([row["timestamp"] for row in best])
+    for i, (row, ts) in enumerate(zip(best, times), start=1):
+        lines.append(
+            f"| {i} | {row['participant']} | "
+            f"{_fmt(row['f1_ideal'], '.6f')} | {_fmt(row['f1_perturbed'], '.6f')} | "
+            f"{_fmt_interval(row, 'f1_perturbed')} | "
+            f"{_fmt(row['robustness_gap'], '.6f')} | {_fmt_interval(row, 'robustness_gap')} | {ts} |\n"
+        )
+    return "".join(lines)
+
+
+def write_leaderboard_markdown(store):
+    """Rewrite leaderboard.md in full: ranking plus every submission in the store."""
+    history = "".join(_history_md_rows(_history_frame(store)))
+    _atomic_write(LEADERBOARD_MD, _ranking_markdown(store) + HISTORY_MD_HEADER + history)
+    print("Leaderboard markdown updated →", LEADERBOARD_MD)
+
+
+def _history_section(path):
+    """The history part of an existing leaderboard.md, or None if it has none."""
+    try:
+        with open(path, encoding="utf-8", newline="") as f:
+            text = f.read()
+    except OSError:
+        return None
+    at = text.find(HISTORY_MD_HEADER)
+    return None if at < 0 else text[at:]
+
+
+def _fmt_interval(row, metric):
+    interval = _interval(row, metric)
+    return "-" if interval is None else f"[{interval[0]:.3f}, {interval[1]:.3f}]"
 
-    history_df = history_df.copy()
-    history_df["timestamp"] = pd.to_datetime(history_df["timestamp"], errors="coerce")
-    history_df = history_df.sort_values(by="timestamp")
 
-    best_df = get_best_scores(history_df)
+def _history_md_rows(df):
+    """Markdown rows for a frame with the HISTORY_COLUMNS."""
+    numbers = {
+        col: [_fmt(None if pd.isna(v) else float(v)) for v in pd.to_numeric(df[col], errors="coerce")]
+        for col in ["f1_ideal", "f1_perturbed", "robustness_gap"]
+    }
+    times = _display_times(df["timestamp"])
+    return [
+        f"| {participant} | {ideal} | {perturbed} | {gap} | {ts} |\n"
+        for participant, ideal, perturbed, gap, ts in zip(
+            df["participant"], numbers["f1_ideal"], numbers["f1_perturbed"],
+            numbers["robustness_gap"], times,
+        )
+    ]
 
-    with open(LEADERBOARD_MD, "w", encoding="utf-8") as f:
 
-        f.write("# 🏆 GNN Robustness Challenge Leaderboard\n\n")
-        f.write("Best submission per participant (ranked by perturbed performance).\n\n")
+# -------------------------------------------------
+# Append-only history
+# -------------------------------------------------
+def _csv_header(path):
+    with open(path, newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def _file_stamp(path):
+    """Size plus a digest of the last 4 KiB: changes whenever rows are added or edited at the end."""
+    if not os.path.exists(path):
+        return "missing"
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 4096))
+        return f"{size}:{hashlib.sha256(f.read()).hexdigest()}"
+
+
+def append_history(entries, store, ranking_changed):
+    """
+    Add ``entries`` (already in ``store``) to leaderboard_history.csv and
+    leaderboard.md. leaderboard.md is appended to unless the ranking
+    changed, in which case its head is rewritten.
+    """
+    if os.path.exists(LEADERBOARD_HISTORY) and _csv_header(LEADERBOARD_HISTORY) != HISTORY_COLUMNS:
+        # Older layout: rewrite once from the store, which already holds entries
+        _write_history_csv(store)
+    else:
+        new_csv = not os.path.exists(LEADERBOARD_HISTORY)
+        with open(LEADERBOARD_HISTORY, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=HISTORY_COLUMNS, extrasaction="ignore",
+                                    lineterminator="\n")
+            if new_csv:
+                writer.writeheader()
+            writer.writerows(entries)
+    print("History updated →", LEADERBOARD_HISTORY)
+
+    rows = "".join(_history_md_rows(pd.DataFrame(entries, columns=HISTORY_COLUMNS)))
+    section = _history_section(LEADERBOARD_MD)
+    if section is None:
+        # Missing or older layout
+        write_leaderboard_markdown(store)
+    elif ranking_changed:
+        _atomic_write(LEADERBOARD_MD, _ranking_markdown(store) + section + rows)
+        print("Leaderboard markdown updated →", LEADERBOARD_MD)
+    else:
+        with open(LEADERBOARD_MD, "a", encoding="utf-8", newline="") as f:
+            f.write(rows)
+        print("Leaderboard markdown history appended →", LEADERBOARD_MD)
 
-        f.write("| Rank | Participant | F1 Ideal | F1 Perturbed | Robustness Gap | Timestamp |\n")
-        f.write("|------|------------|----------|--------------|----------------|-----------|\n")
 
-        if best_df.empty:
-            f.write("| - | - | - | - | - | - |\n")
-        else:
-            for i, row in enumerate(best_df.itertuples(index=False), start=1):
-                f.write(
-                    f"| {i} | {row.participant} | "
-                    f"{row.f1_ideal:.6f} | {row.f1_perturbed:.6f} | "
-                    f"{row.robustness_gap:.6f} | {row.timestamp} |\n"
-                )
+def _history_frame(store):
+    return pd.DataFrame([dict(row) for row in store.history()], columns=HISTORY_COLUMNS)
 
-        f.write("\n---\n")
-        f.write("### 📜 Submission History\n\n")
 
-        f.write("| Participant | F1 Ideal | F1 Perturbed | Gap | Timestamp |\n")
-        f.write("|------------|----------|--------------|-----|-----------|\n")
+def _write_history_csv(store):
+    _atomic_write(LEADERBOARD_HISTORY, _history_frame(store).to_csv(index=False))
 
-        for row in history_df.itertuples(index=False):
-            f.write(
-                f"| {row.participant} | {row.f1_ideal} | "
-                f"{row.f1_perturbed} | {row.robustness_gap} | {row.timestamp} |\n"
-            )
 
-    print("Leaderboard markdown updated →", LEADERBOARD_MD)
+def rebuild_outputs(store):
+    """Regenerate every output file from the store."""
+    _write_history_csv(store)
+    write_leaderboard_json(store)
+    write_leaderboard_markdown(store)
+    store.mark_synced(LEADERBOARD_HISTORY)
 
 
 # -------------------------------------------------
@@ -149,7 +480,7 @@ def update_leaderboard(scores_file):
     if not scores_file or not os.path.exists(scores_file):
         print("No scores.json found")
         return
- 
+
     with open(scores_file, "r") as f:
         scores = json.load(f)
 
@@ -164,14 +495,35 @@ def update_leaderboard(scores_file):
             "timestamp": s.get(
                 "timestamp",
                 datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-            )
+            ),
+            **{col: s.get(col) for col in CI_COLUMNS}
         }
         new_entries.append(entry)
 
-    history_df = append_scores(new_entries)
-
-    write_leaderboard_json(history_df)
-    write_leaderboard_markdown(history_df)
+    store = LeaderboardStore()
+    try:
+        with store.transaction():
+            # Store missing or out of date: rebuild it from the committed history
+            if not store.in_sync(LEADERBOARD_HISTORY):
+                store.reset()
+                if os.path.exists(LEADERBOARD_HISTORY):
+                    print(f"Imported {store.import_history_csv(LEADERBOARD_HISTORY)} history rows")
+                for entry in new_entries:
+                    store.add(entry)
+                rebuild_outputs(store)
+                return
+
+            changed = [entry["participant"] for entry in new_entries if store.add(entry)]
+            refresh = bool(changed) or not os.path.exists(LEADERBOARD_JSON)
+            append_history(new_entries, store, refresh)
+            store.mark_synced(LEADERBOARD_HISTORY)
+
+            if refresh:
+                write_leaderboard_json(store)
+            else:
+                print("No participant's best changed; ranking and leaderboard.json unchanged")
+    finally:
+        store.close()
 
 
 # -------------------------------------------------
@@ -182,6 +534,17 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--scores", type=str, default=None)
+    parser.add_argument("--rebuild", action="store_true",
+                        help="re-index leaderboard_history.csv and regenerate all leaderboard files")
     args = parser.parse_args()
 
-    update_leaderboard(args.scores)
+    if args.rebuild:
+        store = LeaderboardStore()
+        with store.transaction():
+            store.reset()
+            if os.path.exists(LEADERBOARD_HISTORY):
+                print(f"Imported {store.import_history_csv(LEADERBOARD_HISTORY)} history rows")
+            rebuild_outputs(store)
+        store.close()
+    else:
+        update_leaderboard(args.scores)
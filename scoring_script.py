@@ -1,187 +1,679 @@
 import os
+import numpy as np
 import pandas as pd
-from sklearn.metrics import f1_score
 import base64
 import io
 import json
 import argparse
+import multiprocessing as mp
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-# ----------------------------
-# CLI arguments
-# ----------------------------
-parser = argparse.ArgumentParser()
-parser.add_argument("--save-scores", type=str, default="scores.json")
-parser.add_argument("--participant", type=str, default="unknown")
-args = parser.parse_args()
-
-PARTICIPANT_NAME = args.participant
-SCORES_JSON_FILE = args.save_scores
+try:
+    from cryptography.hazmat.primitives import hashes, padding, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding as rsa_padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+except ImportError:  # only needed for encrypted submissions
+    serialization = None
 
 # ----------------------------
 # Constants
 # ----------------------------
 PRIVATE_LABELS_ENV = "TEST_LABELS_B64"
+PRIVATE_KEY_ENV = "PRIVATE_KEY"
 SUBMISSIONS_FOLDER = "submissions"
 LEADERBOARD_FILE = "leaderboard.csv"
-EXPECTED_FILES = ["ideal_submission.enc", "perturbed_submission.enc"]
+# Read from <name>.enc (see below) when present, else from the plain CSV
+EXPECTED_FILES = ["ideal_submission.csv", "perturbed_submission.csv"]
+
+ID_COLUMNS = ["graph_index", "id"]
+LABEL_COLUMNS = ["label", "target"]
+CHUNK_ROWS = 1_000_000
 
-print("Running scoring_script.py...")
 
 # ----------------------------
-# Load private labels
+# Hidden labels, decoded once
+#
+# IDs are kept sorted with their labels as integer class codes. When the
+# IDs are dense enough a lookup table maps an ID straight to its row, so
+# aligning a submission is one gather instead of a merge.
 # ----------------------------
-truth = None
-labels_b64 = os.getenv(PRIVATE_LABELS_ENV)
+class TruthLabels:
 
-if labels_b64:
-    try:
-        decoded = base64.b64decode(labels_b64)
-        truth = pd.read_csv(io.BytesIO(decoded))
+    def __init__(self, ids, labels):
+        ids = np.asarray(ids, dtype=np.int64)
+        labels = np.asarray(labels)
+
+        order = np.argsort(ids, kind="stable")
+        ids, labels = ids[order], labels[order]
+        keep = np.ones(len(ids), dtype=bool)
+        keep[1:] = ids[1:] != ids[:-1]
+        if not keep.all():
+            print(f"Truth has {int((~keep).sum())} duplicate IDs; keeping the first label")
+
+        self.ids = ids[keep]
+        self.classes, self.codes = np.unique(labels[keep], return_inverse=True)
+
+        self._table = None
+        if len(self.ids) and self.ids[0] >= 0 and self.ids[-1] < 4 * len(self.ids) + 1024:
+            self._table = np.full(self.ids[-1] + 1, -1, dtype=np.int64)
+            self._table[self.ids] = np.arange(len(self.ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_frame(cls, truth):
+        truth = truth.copy()
         truth.columns = truth.columns.str.strip().str.lower()
-        print("Loaded private labels successfully")
-    except Exception as e:
-        print("Failed to decode private labels:", e)
-        truth = None
-else:
-    print("Private labels unavailable. Scoring skipped.")
-
-# ----------------------------
-# Detect truth column
-# ----------------------------
-truth_col = None
-if truth is not None:
-    if "label" in truth.columns:
-        truth_col = "label"
-    elif "target" in truth.columns:
-        truth_col = "target"
+        id_col = _pick(truth.columns, ID_COLUMNS, "ID")
+        label_col = _pick(truth.columns, LABEL_COLUMNS, "label")
+
+        ids = pd.to_numeric(truth[id_col], errors="coerce").to_numpy(dtype=float)
+        labels = pd.to_numeric(truth[label_col], errors="coerce").to_numpy(dtype=float)
+        valid = _integral(ids) & np.isfinite(labels)
+        return cls(ids[valid], labels[valid])
+
+    @classmethod
+    def from_csv(cls, source):
+        return cls.from_frame(pd.read_csv(source))
+
+    def positions(self, ids):
+        """Row of every ID in ``ids`` (float array), -1 where unknown or not an ID."""
+        ids = np.asarray(ids, dtype=float)
+        out = np.full(len(ids), -1, dtype=np.int64)
+        valid = _integral(ids)
+        key = ids[valid].astype(np.int64)
+
+        if self._table is not None:
+            inside = (key >= 0) & (key < len(self._table))
+            found = np.full(len(key), -1, dtype=np.int64)
+            found[inside] = self._table[key[inside]]
+        else:
+            found = np.searchsorted(self.ids, key)
+            hit = found < len(self.ids)
+            hit[hit] = self.ids[found[hit]] == key[hit]
+            found[~hit] = -1
+
+        out[valid] = found
+        return out
+
+
+def _integral(values):
+    return np.isfinite(values) & (np.floor(values) == values)
+
+
+def _pick(columns, candidates, what):
+    for col in candidates:
+        if col in columns:
+            return col
+    raise ValueError(f"No {what} column (expected one of {candidates})")
+
+
+# ----------------------------
+# Load private labels
+# ----------------------------
+def load_truth():
+    truth = None
+    labels_b64 = os.getenv(PRIVATE_LABELS_ENV)
+
+    if labels_b64:
+        try:
+            decoded = base64.b64decode(labels_b64)
+            truth = TruthLabels.from_csv(io.BytesIO(decoded))
+            print(f"Loaded private labels successfully ({len(truth)} IDs)")
+        except Exception as e:
+            print("Failed to decode private labels:", e)
+            truth = None
     else:
-        print("Truth file missing 'label' or 'target' column")
-        truth = None
+        print("Private labels unavailable. Scoring skipped.")
+
+    return truth
+
 
 # ----------------------------
-# Evaluate submissions
+# Encrypted submissions, decrypted in memory
+#
+# Participants encrypt every CSV with
+#   openssl enc -aes-256-cbc -pbkdf2 -pass file:aes_key.hex
+# and wrap aes_key.hex with the organiser's RSA public key
+# (openssl pkeyutl -encrypt, PKCS#1 v1.5) as aes_key.enc. Here the key is
+# unwrapped with the private key and every .enc file is decrypted as a
+# stream feeding the CSV parser: no decrypted key or prediction ever
+# touches disk. <x>_submission.enc uses aes_key_<x>.enc when the
+# participant wrapped one key per file, else aes_key.enc. An aes_key.enc
+# wrapped for another public key may still unwrap (to random bytes, by
+# PKCS#1 v1.5 implicit rejection); it then fails as an unreadable CSV.
 # ----------------------------
-scores = []
+PBKDF2_ITERATIONS = 10_000      # openssl enc -pbkdf2 default
+STREAM_BLOCK = 1 << 20
+SALT_MAGIC = b"Salted__"
+
+
+def load_private_key(pem, password=None):
+    """RSA private key from PEM bytes."""
+    if serialization is None:
+        raise ImportError("Decrypting submissions needs the cryptography package")
+    return serialization.load_pem_private_key(pem, password=password)
+
+
+def unwrap_key(wrapped, private_key):
+    """Passphrase of ``openssl enc -pass file:`` from an RSA-wrapped key file's bytes."""
+    plain = private_key.decrypt(wrapped, rsa_padding.PKCS1v15())
+    # openssl reads the first line of the pass file, without its newline
+    return plain.split(b"\n", 1)[0]
+
+
+class DecryptedStream(io.RawIOBase):
+    """Plaintext of an ``openssl enc -aes-256-cbc -pbkdf2`` stream, read block by block."""
+
+    def __init__(self, raw, passphrase, iterations=PBKDF2_ITERATIONS):
+        header = raw.read(16)
+        if len(header) < 16 or not header.startswith(SALT_MAGIC):
+            raise ValueError("Not an openssl enc file (no salt header)")
+        material = PBKDF2HMAC(hashes.SHA256(), 48, header[8:], iterations).derive(passphrase)
+        self._decryptor = Cipher(algorithms.AES(material[:32]), modes.CBC(material[32:])).decryptor()
+        self._unpadder = padding.PKCS7(128).unpadder()
+        self._raw = raw
+        self._pending = memoryview(b"")
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            block = self._raw.read(STREAM_BLOCK)
+            if block:
+                plain = self._unpadder.update(self._decryptor.update(block))
+            else:
+                # Raises ValueError on a wrong key (bad padding)
+                plain = self._unpadder.update(self._decryptor.finalize())
+                plain += self._unpadder.finalize()
+                self._done = True
+            self._pending = memoryview(plain)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+def open_encrypted(path, passphrase):
+    """Binary file object over the decrypted contents of ``path``."""
+    raw = open(path, "rb")
+    try:
+        return io.BufferedReader(DecryptedStream(raw, passphrase), STREAM_BLOCK)
+    except BaseException:
+        raw.close()
+        raise
 
-if not os.path.exists(SUBMISSIONS_FOLDER):
-    print("submissions folder not found")
-else:
-    print("Files in submissions:", os.listdir(SUBMISSIONS_FOLDER))
 
-    for fname in EXPECTED_FILES:
-        path = os.path.join(SUBMISSIONS_FOLDER, fname)
+def _wrapped_key_path(folder, fname):
+    own = os.path.join(folder, f"aes_key_{fname.split('_')[0]}.enc")
+    return own if os.path.exists(own) else os.path.join(folder, "aes_key.enc")
 
-        if not os.path.exists(path):
-            print(f"Missing submission: {fname}")
-            scores.append({"submission": fname, "f1_score": None})
-            continue
 
-        sub = pd.read_csv(path)
-        sub.columns = sub.columns.str.strip().str.lower()
+def _open_submission(folder, fname, private_key, passphrases):
+    """
+    ``(source, label)`` for one expected file: a decrypting stream when
+    ``<name>.enc`` and a private key are available, else the plain CSV path.
+    ``(None, None)`` when the submission is missing.
+    """
+    encrypted = os.path.join(folder, fname[:-len(".csv")] + ".enc")
+    if private_key is not None and os.path.exists(encrypted):
+        key_path = _wrapped_key_path(folder, fname)
+        if key_path not in passphrases:
+            if not os.path.exists(key_path):
+                raise ValueError(f"{os.path.basename(encrypted)} has no {os.path.basename(key_path)}")
+            with open(key_path, "rb") as f:
+                passphrases[key_path] = unwrap_key(f.read(), private_key)
+        return open_encrypted(encrypted, passphrases[key_path]), os.path.basename(encrypted)
 
-        print(f"\nProcessing {fname} | rows={len(sub)}")
+    path = os.path.join(folder, fname)
+    return (path, fname) if os.path.exists(path) else (None, None)
 
-        if truth is None:
-            scores.append({"submission": fname, "f1_score": None})
-            continue
 
-        # Detect ID column
-        if "graph_index" in truth.columns and "graph_index" in sub.columns:
-            id_col = "graph_index"
-        elif "id" in truth.columns and "id" in sub.columns:
-            id_col = "id"
-        else:
-            print(f"ID column mismatch in {fname}")
-            scores.append({"submission": fname, "f1_score": None})
-            continue
+# ----------------------------
+# Macro F1 from confusion matrices
+# ----------------------------
+def macro_f1_from_confusion(confusion):
+    """
+    Same as sklearn's ``f1_score(average="macro")``: averaged over every
+    class that occurs in the truth or the predictions, 0 for a class
+    without true or predicted positives. ``confusion`` is ``[K, K]`` or a
+    stack ``[..., K, K]``.
+    """
+    tp = np.diagonal(confusion, axis1=-2, axis2=-1).astype(float)
+    support = confusion.sum(axis=-1) + confusion.sum(axis=-2)
+    present = support > 0
+    f1 = np.where(present, 2 * tp / np.maximum(support, 1), 0.0)
+    score = f1.sum(axis=-1) / np.maximum(present.sum(axis=-1), 1)
+    return float(score) if np.ndim(score) == 0 else score
+
+
+def encode_cells(truth, preds_list):
+    """
+    Confusion-matrix cell of every truth row for each prediction array in
+    ``preds_list`` (-1 where there is no prediction), over a label set
+    shared by all of them. Returns ``(cells_list, num_labels)``.
+    """
+    predicted = [p[np.isfinite(p)] for p in preds_list]
+    labels = np.union1d(truth.classes, np.concatenate(predicted)) if predicted else truth.classes
+    k = len(labels)
+    true_idx = np.searchsorted(labels, truth.classes)[truth.codes]
+
+    cells_list = []
+    for preds in preds_list:
+        cells = np.full(len(truth), -1, dtype=np.int64)
+        valid = np.isfinite(preds)
+        cells[valid] = true_idx[valid] * k + np.searchsorted(labels, preds[valid])
+        cells_list.append(cells)
+    return cells_list, k
+
+
+def macro_f1(cells, num_labels):
+    confusion = np.bincount(cells[cells >= 0], minlength=num_labels * num_labels)
+    return macro_f1_from_confusion(confusion.reshape(num_labels, num_labels))
 
-        pred_col = "label" if "label" in sub.columns else "target"
 
-        # Clean ID dtype
-        truth[id_col] = pd.to_numeric(truth[id_col], errors="coerce")
-        sub[id_col] = pd.to_numeric(sub[id_col], errors="coerce")
+# ----------------------------
+# Bootstrap confidence intervals
+#
+# All resamples are drawn as one index matrix [B, n] over the truth rows
+# (in slices that keep B*n bounded) and turned into B confusion matrices
+# with a single bincount per submission. Submissions scored together share
+# the index matrix, so their differences (the robustness gap) are paired.
+# ----------------------------
+BOOTSTRAP_RESAMPLES = 2000
+BOOTSTRAP_BUDGET = 1 << 24
+
+
+def bootstrap_macro_f1(cells_list, num_labels, num_resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    """Macro F1 of every submission on every resample, ``[len(cells_list), B]``."""
+    n = len(cells_list[0])
+    kk = num_labels * num_labels
+    rng = np.random.default_rng(seed)
+    out = np.zeros((len(cells_list), num_resamples))
+    step = max(1, BOOTSTRAP_BUDGET // max(n, 1))
+
+    # Few cells (the usual binary case): compact int8 cells counted one
+    # cell at a time beat an offset bincount over the whole matrix
+    small = kk <= 64
+    if small:
+        cells_list = [cells.astype(np.int8) for cells in cells_list]
+
+    for start in range(0, num_resamples, step):
+        b = min(step, num_resamples - start)
+        idx = rng.integers(0, n, size=(b, n))
+        offset = (np.arange(b) * kk)[:, None]
+        for j, cells in enumerate(cells_list):
+            drawn = cells[idx]
+            if small:
+                confusion = np.stack(
+                    [np.count_nonzero(drawn == c, axis=1) for c in range(kk)], axis=1
+                )
+            else:
+                confusion = np.bincount((drawn + offset)[drawn >= 0], minlength=b * kk)
+            out[j, start:start + b] = macro_f1_from_confusion(
+                confusion.reshape(b, num_labels, num_labels)
+            )
+    return out
+
+
+def confidence_interval(samples, level=0.95):
+    tail = (1 - level) / 2 * 100
+    low, high = np.percentile(samples, [tail, 100 - tail])
+    return round(float(low), 6), round(float(high), 6)
 
-        truth_clean = truth.dropna(subset=[id_col]).copy()
-        sub_clean = sub.dropna(subset=[id_col]).copy()
 
-        truth_clean[id_col] = truth_clean[id_col].astype(int)
-        sub_clean[id_col] = sub_clean[id_col].astype(int)
+# ----------------------------
+# Score one submission
+# ----------------------------
+def align_submission(source, truth, chunksize=CHUNK_ROWS):
+    """
+    Stream a submission CSV (path or file object) against ``truth``.
+
+    Returns the prediction for every truth row (NaN where there is none)
+    and row statistics. Predictions are aligned by ID lookup. The first row
+    of a repeated ID counts, later ones are reported as duplicates; IDs not
+    in the truth and non-numeric predictions are reported and skipped.
+    """
+    aligned = np.full(len(truth), np.nan)
+    seen = np.zeros(len(truth), dtype=bool)
+    stats = {"rows": 0, "duplicates": 0, "unknown_ids": 0, "invalid_predictions": 0}
+
+    reader = pd.read_csv(
+        source,
+        usecols=lambda c: c.strip().lower() in ID_COLUMNS + LABEL_COLUMNS,
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        chunk.columns = chunk.columns.str.strip().str.lower()
+        ids = pd.to_numeric(chunk[_pick(chunk.columns, ID_COLUMNS, "ID")], errors="coerce")
+        preds = pd.to_numeric(chunk[_pick(chunk.columns, LABEL_COLUMNS, "prediction")], errors="coerce")
+        ids, preds = ids.to_numpy(dtype=float), preds.to_numpy(dtype=float)
+        stats["rows"] += len(ids)
+
+        pos = truth.positions(ids)
+        known = pos >= 0
+        stats["unknown_ids"] += int((~known).sum())
+        pos, preds = pos[known], preds[known]
+
+        # First occurrence wins, within the chunk and across chunks. With
+        # repeated indices the last assignment sticks, so writing in
+        # reverse leaves each ID's first row.
+        first = np.empty(len(truth), dtype=np.int64)
+        order = np.arange(len(pos))
+        first[pos[::-1]] = order[::-1]
+        keep = (first[pos] == order) & ~seen[pos]
+        stats["duplicates"] += len(pos) - int(keep.sum())
+        pos, preds = pos[keep], preds[keep]
+        seen[pos] = True
+
+        valid = np.isfinite(preds)
+        stats["invalid_predictions"] += int((~valid).sum())
+        aligned[pos[valid]] = preds[valid]
+
+    return aligned, stats
+
+
+def _score(source, truth, name=None, chunksize=CHUNK_ROWS):
+    name = name or (source if isinstance(source, str) else "submission")
+    preds, stats = align_submission(source, truth, chunksize)
+    matched = int(np.isfinite(preds).sum())
+
+    result = {
+        "submission": name,
+        "f1_score": None,
+        "matched": matched,
+        "missing": len(truth) - matched,
+        **stats,
+    }
+    if matched:
+        (cells,), k = encode_cells(truth, [preds])
+        result["f1_score"] = round(macro_f1(cells, k), 6)
+    return result, preds
+
+
+def score_submission(source, truth, name=None, chunksize=CHUNK_ROWS):
+    """
+    Result dict for one submission: macro F1 over the matched rows plus
+    counts of duplicate, unknown and missing IDs and invalid predictions
+    (see ``align_submission``).
+    """
+    return _score(source, truth, name, chunksize)[0]
+
+
+def score_files(sources, truth, chunksize=CHUNK_ROWS):
+    """Score every submission in ``sources`` against labels decoded once."""
+    return [score_submission(src, truth, chunksize=chunksize) for src in sources]
+
+
+def describe(result):
+    name = os.path.basename(str(result["submission"]))
+    f1 = "N/A" if result["f1_score"] is None else f"{result['f1_score']:.6f}"
+    print(f"{name} → F1: {f1} | rows={result['rows']} matched={result['matched']}")
+    for key in ["duplicates", "unknown_ids", "invalid_predictions", "missing"]:
+        if result.get(key):
+            print(f"  {key.replace('_', ' ')}: {result[key]}")
 
-        merged = truth_clean.merge(
-            sub_clean,
-            on=id_col,
-            suffixes=("_true", "_pred"),
-            how="inner"
-        )
 
-        print("Merged rows:", len(merged))
+# ----------------------------
+# Score one participant folder
+# ----------------------------
+def score_participant(folder, truth, participant, timestamp=None, verbose=True,
+                      bootstrap=BOOTSTRAP_RESAMPLES, seed=0, level=0.95, private_key=None):
+    """
+    Leaderboard entry plus per-file results for one submissions folder.
+    With ``bootstrap`` resamples the entry also carries ``<metric>_ci_low``
+    / ``<metric>_ci_high`` for f1_ideal, f1_perturbed and robustness_gap.
+    With ``private_key``, encrypted submissions are decrypted in memory.
+    """
+    results = []
+    preds = {}
+    passphrases = {}
 
-        if merged.empty:
-            print(f"No matching IDs for {fname}")
-            scores.append({"submission": fname, "f1_score": None})
+    for fname in EXPECTED_FILES:
+        try:
+            source, label = _open_submission(folder, fname, private_key, passphrases)
+        except ValueError as e:
+            # Wrapped key missing or not decryptable with our private key
+            if verbose:
+                print(f"Could not decrypt {fname}: {e}")
+            results.append({"submission": fname, "f1_score": None})
             continue
 
-        y_true_col = f"{truth_col}_true"
-        y_pred_col = f"{pred_col}_pred"
+        if source is None:
+            if verbose:
+                print(f"Missing submission: {fname}")
+            results.append({"submission": fname, "f1_score": None})
+            continue
 
-        score = f1_score(
-            merged[y_true_col],
-            merged[y_pred_col],
-            average="macro"
-        )
+        if truth is None:
+            if not isinstance(source, str):
+                source.close()
+            results.append({"submission": fname, "f1_score": None})
+            continue
 
-        print(f"{fname} → F1: {score:.6f}")
+        try:
+            result, preds[fname] = _score(source, truth, name=fname)
+        except ValueError as e:
+            if verbose:
+                print(f"Could not score {label}: {e}")
+            result = {"submission": fname, "f1_score": None}
+        else:
+            if verbose:
+                describe(result)
+        finally:
+            if not isinstance(source, str):
+                source.close()
+        results.append(result)
+
+    f1_ideal = next((r["f1_score"] for r in results if r["submission"] == "ideal_submission.csv"), None)
+    f1_perturbed = next((r["f1_score"] for r in results if r["submission"] == "perturbed_submission.csv"), None)
+
+    robustness_gap = (
+        round(f1_ideal - f1_perturbed, 6)
+        if isinstance(f1_ideal, float) and isinstance(f1_perturbed, float)
+        else "N/A"
+    )
+
+    entry = {
+        "participant": participant,
+        "f1_ideal": "N/A" if f1_ideal is None else f1_ideal,
+        "f1_perturbed": "N/A" if f1_perturbed is None else f1_perturbed,
+        "robustness_gap": robustness_gap,
+        "timestamp": timestamp or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC"),
+        "branch": os.getenv("GITHUB_REF_NAME", "local_run")
+    }
+
+    scored = [f for f in EXPECTED_FILES if f in preds and np.isfinite(preds[f]).any()]
+    if bootstrap and scored:
+        cells, k = encode_cells(truth, [preds[f] for f in scored])
+        samples = dict(zip(scored, bootstrap_macro_f1(cells, k, bootstrap, seed)))
+        if "ideal_submission.csv" in samples and "perturbed_submission.csv" in samples:
+            samples["gap"] = samples["ideal_submission.csv"] - samples["perturbed_submission.csv"]
+
+        for metric, key in [("f1_ideal", "ideal_submission.csv"),
+                            ("f1_perturbed", "perturbed_submission.csv"),
+                            ("robustness_gap", "gap")]:
+            if key in samples:
+                low, high = confidence_interval(samples[key], level)
+                entry[f"{metric}_ci_low"], entry[f"{metric}_ci_high"] = low, high
+                if verbose:
+                    print(f"{metric}: {entry[metric]} [{low:.6f}, {high:.6f}] "
+                          f"({level:.0%} bootstrap, {bootstrap} resamples)")
+
+    return entry, results
 
-        scores.append({
-            "submission": fname,
-            "f1_score": round(float(score), 6)
-        })
 
 # ----------------------------
-# Prepare leaderboard entry
+# Atomic outputs
 # ----------------------------
-timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-
-f1_ideal = next((s["f1_score"] for s in scores if s["submission"] == "ideal_submission.csv"), "N/A")
-f1_perturbed = next((s["f1_score"] for s in scores if s["submission"] == "perturbed_submission.csv"), "N/A")
+def _atomic_write(path, write):
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def save_entries(entries, scores_file, leaderboard_file=LEADERBOARD_FILE):
+    """
+    Append ``entries`` to the leaderboard CSV and write them to the scores
+    JSON. Only the new rows are written, in a single call; the existing
+    file is rewritten (atomically) just when a batch brings new columns.
+    The scores JSON is replaced in one step.
+    """
+    df_new = pd.DataFrame(entries)
+    columns = list(df_new.columns)
+    if os.path.exists(leaderboard_file) and os.path.getsize(leaderboard_file):
+        header = list(pd.read_csv(leaderboard_file, nrows=0).columns)
+        added = [c for c in columns if c not in header]
+        if added:
+            df_old = pd.read_csv(leaderboard_file, dtype=str, keep_default_na=False)
+            _atomic_write(leaderboard_file,
+                          lambda f: df_old.reindex(columns=header + added).to_csv(f, index=False))
+        rows = df_new.reindex(columns=header + added).to_csv(index=False, header=False)
+        with open(leaderboard_file, "a", newline="") as f:
+            f.write(rows)
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        _atomic_write(leaderboard_file, lambda f: df_new.to_csv(f, index=False))
+    print("Leaderboard updated →", leaderboard_file)
 
-robustness_gap = (
-    round(f1_ideal - f1_perturbed, 6)
-    if isinstance(f1_ideal, float) and isinstance(f1_perturbed, float)
-    else "N/A"
-)
+    _atomic_write(scores_file, lambda f: json.dump(entries, f, indent=2))
+    print("Scores JSON saved →", scores_file)
 
-leaderboard_entry = {
-    "participant": PARTICIPANT_NAME,
-    "f1_ideal": f1_ideal,
-    "f1_perturbed": f1_perturbed,
-    "robustness_gap": robustness_gap,
-    "timestamp": timestamp,
-    "branch": os.getenv("GITHUB_REF_NAME", "local_run")
-}
 
 # ----------------------------
-# Save leaderboard CSV (APPEND MODE)
+# Batch mode: every participant folder in one process
+#
+# Layout: <batch_dir>/<participant>/{ideal,perturbed}_submission.{csv,enc}
+# (+ aes_key*.enc). The labels are decoded once in the parent; forked
+# workers inherit them. Key objects do not pickle, so every worker loads
+# the private key once from its PEM bytes.
 # ----------------------------
-if os.path.exists(LEADERBOARD_FILE):
-    df_existing = pd.read_csv(LEADERBOARD_FILE)
-    df_new = pd.concat([df_existing, pd.DataFrame([leaderboard_entry])], ignore_index=True)
-else:
-    df_new = pd.DataFrame([leaderboard_entry])
+_WORKER_TRUTH = None
+_WORKER_KEY = None
 
-# Optional sorting
-if "f1_ideal" in df_new.columns:
-    df_new = df_new.sort_values(by="f1_ideal", ascending=False)
 
-df_new.to_csv(LEADERBOARD_FILE, index=False)
-print("Leaderboard updated →", LEADERBOARD_FILE)
+def _init_worker(truth, private_key_pem=None):
+    global _WORKER_TRUTH, _WORKER_KEY
+    _WORKER_TRUTH = truth
+    _WORKER_KEY = load_private_key(private_key_pem) if private_key_pem else None
+
+
+def _score_folder(folder, participant, timestamp, bootstrap, seed):
+    return score_participant(folder, _WORKER_TRUTH, participant, timestamp, verbose=False,
+                             bootstrap=bootstrap, seed=seed, private_key=_WORKER_KEY)
+
+
+def score_batch(batch_dir, truth, num_workers=None, timestamp=None,
+                bootstrap=BOOTSTRAP_RESAMPLES, seed=0, private_key_pem=None):
+    """Leaderboard entries and per-file results of every participant folder."""
+    participants = sorted(
+        name for name in os.listdir(batch_dir)
+        if os.path.isdir(os.path.join(batch_dir, name)) and not name.startswith(".")
+    )
+    folders = [os.path.join(batch_dir, name) for name in participants]
+    timestamp = timestamp or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+    num_workers = min(num_workers or os.cpu_count() or 1, max(1, len(folders)))
+
+    if num_workers <= 1:
+        _init_worker(truth, private_key_pem)
+        outcomes = [_score_folder(f, p, timestamp, bootstrap, seed)
+                    for f, p in zip(folders, participants)]
+    else:
+        methods = mp.get_all_start_methods()
+        context = mp.get_context("fork" if "fork" in methods else None)
+        with ProcessPoolExecutor(num_workers, mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(truth, private_key_pem)) as pool:
+            n = len(folders)
+            outcomes = list(pool.map(
+                _score_folder, folders, participants,
+                [timestamp] * n, [bootstrap] * n, [seed] * n,
+            ))
+
+    for participant, (entry, results) in zip(participants, outcomes):
+        f1 = [r["f1_score"] for r in results]
+        issues = sum(r.get(k, 0) for r in results
+                     for k in ["duplicates", "unknown_ids", "invalid_predictions"])
+        print(f"{participant:<24} ideal={entry['f1_ideal']} perturbed={entry['f1_perturbed']}"
+              + (f" | {issues} problem rows" if issues else "")
+              + ("" if all(v is not None for v in f1) else " | incomplete"))
+
+    return [entry for entry, _ in outcomes], [results for _, results in outcomes]
+
+
+def main():
+    # ----------------------------
+    # CLI arguments
+    # ----------------------------
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--save-scores", type=str, default="scores.json")
+    parser.add_argument("--participant", type=str, default="unknown")
+    parser.add_argument("--labels", type=str, default=None,
+                        help=f"plain labels CSV to use instead of ${PRIVATE_LABELS_ENV}")
+    parser.add_argument("--private-key", type=str, default=None,
+                        help=f"PEM file to decrypt *.enc submissions, instead of ${PRIVATE_KEY_ENV}")
+    parser.add_argument("--submissions", type=str, default=SUBMISSIONS_FOLDER)
+    parser.add_argument("--batch", type=str, default=None,
+                        help="directory of participant folders to score in one run")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--bootstrap", type=int, default=BOOTSTRAP_RESAMPLES,
+                        help="bootstrap resamples for confidence intervals (0 disables)")
+    parser.add_argument("--bootstrap-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("Running scoring_script.py...")
+
+    truth = TruthLabels.from_csv(args.labels) if args.labels else load_truth()
+
+    private_key_pem = os.getenv(PRIVATE_KEY_ENV, "").encode() or None
+    if args.private_key:
+        with open(args.private_key, "rb") as f:
+            private_key_pem = f.read()
+    if private_key_pem is None:
+        print("Private key unavailable. Encrypted submissions are skipped.")
+
+    # ----------------------------
+    # Evaluate submissions
+    # ----------------------------
+    if args.batch:
+        if not os.path.isdir(args.batch):
+            raise SystemExit(f"Batch directory not found: {args.batch}")
+        entries, _ = score_batch(args.batch, truth, args.workers,
+                                 bootstrap=args.bootstrap, seed=args.bootstrap_seed,
+                                 private_key_pem=private_key_pem)
+    elif not os.path.exists(args.submissions):
+        print("submissions folder not found")
+        entries = [score_participant(args.submissions, None, args.participant)[0]]
+    else:
+        print("Files in submissions:", os.listdir(args.submissions))
+        private_key = load_private_key(private_key_pem) if private_key_pem else None
+        entries = [score_participant(args.submissions, truth, args.participant,
+                                     bootstrap=args.bootstrap, seed=args.bootstrap_seed,
+                                     private_key=private_key)[0]]
+
+    # ----------------------------
+    # Save leaderboard CSV + scores JSON
+    # ----------------------------
+    save_entries(entries, args.save_scores)
+    print("Scoring complete.")
 
-# ----------------------------
-# Save scores JSON
-# ----------------------------
-with open(SCORES_JSON_FILE, "w") as f:
-    json.dump([leaderboard_entry], f, indent=2)
 
-print("Scores JSON saved →", SCORES_JSON_FILE)
-print("Scoring complete.")
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
+import numpy as np
 import torch
 import pandas as pd
 import torch.nn.functional as F
 from torch_geometric.loader import DataLoader
+import argparse
+import copy
 import os
 
+from checkpoint import load_model, load_training_state, save_model, save_training_state
 from dataset import TopologicalDataset
 from model import GINModel
+from packed_loader import PackedLoader
+from profiling import NULL_PROFILER, Profiler
 
 # ----------------------------
 # Paths (root of repo)
@@ -14,115 +20,322 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 REPO_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, ".."))
 
 DATA_DIR = os.path.join(REPO_ROOT, "data")
+TU_ROOT = os.path.join(DATA_DIR, "TUDataset")
 SUBMISSIONS_DIR = os.path.join(REPO_ROOT, "submissions")
 
-os.makedirs(SUBMISSIONS_DIR, exist_ok=True)
 
 # ----------------------------
 # Load data splits
+#   MUTAG → data/train.csv, data/test.csv (the challenge split)
+#   other → <root>/<name>/splits/, as written by synthetic.py
 # ----------------------------
-train_df = pd.read_csv(os.path.join(DATA_DIR, "train.csv"))
-test_df = pd.read_csv(os.path.join(DATA_DIR, "test.csv"))
+def split_dir(name="MUTAG", root=TU_ROOT):
+    return DATA_DIR if name == "MUTAG" else os.path.join(root, name, "splits")
 
-# ----------------------------
-# Dataset instances
-# ----------------------------
-# Training → ideal condition
-train_dataset = TopologicalDataset(
-    "MUTAG",
-    topo_config="degree",
-    mode="ideal"
-)
-
-# Evaluation → two conditions
-ideal_test_dataset = TopologicalDataset(
-    "MUTAG",
-    topo_config="degree",
-    mode="ideal"
-)
-
-perturbed_test_dataset = TopologicalDataset(
-    "MUTAG",
-    topo_config="degree",
-    mode="perturbed"
-)
 
-# ----------------------------
-# Prepare graph lists
-# ----------------------------
-train_graphs = [train_dataset[i] for i in train_df.graph_index]
-ideal_test_graphs = [ideal_test_dataset[i] for i in test_df.graph_index]
-perturbed_test_graphs = [perturbed_test_dataset[i] for i in test_df.graph_index]
+def load_splits(name="MUTAG", root=TU_ROOT):
+    directory = split_dir(name, root)
+    train_df = pd.read_csv(os.path.join(directory, "train.csv"))
+    test_df = pd.read_csv(os.path.join(directory, "test.csv"))
+    return train_df, test_df
+
+
+def validation_split(train_df, fraction=0.2, seed=0):
+    """``(train_df, val_df)``: ``fraction`` of every label's graphs held out, stratified."""
+    rng = np.random.default_rng([seed, 2])
+    held_out = []
+    for _, group in train_df.groupby("label", sort=True):
+        count = int(round(len(group) * fraction))
+        held_out.extend(rng.choice(group.index.values, size=count, replace=False).tolist())
+    val = train_df.index.isin(held_out)
+    return train_df[~val].reset_index(drop=True), train_df[val].reset_index(drop=True)
 
-train_loader = DataLoader(train_graphs, batch_size=32, shuffle=True)
-ideal_test_loader = DataLoader(ideal_test_graphs, batch_size=32)
-perturbed_test_loader = DataLoader(perturbed_test_graphs, batch_size=32)
 
 # ----------------------------
-# Model
+# Loaders
+#   "packed"     → batches gathered from the packed split, eval batches cached
+#   "full"       → whole split as one pre-collated batch (full-batch training)
+#   "dataloader" → torch_geometric DataLoader, re-collating every epoch
 # ----------------------------
-model = GINModel(
-    input_dim=train_dataset.num_features,
-    output_dim=train_dataset.num_classes
-)
+def make_loader(graphs, kind="packed", batch_size=32, shuffle=False, generator=None):
+    if kind == "dataloader":
+        return DataLoader(graphs, batch_size=batch_size, shuffle=shuffle, generator=generator)
+    if kind == "full":
+        return PackedLoader(graphs, batch_size=None)
+    if kind == "packed":
+        return PackedLoader(graphs, batch_size=batch_size, shuffle=shuffle, generator=generator)
+    raise ValueError(f"Unknown loader: {kind}")
 
-optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
 
 # ----------------------------
 # Training (Ideal Condition)
+#
+# checkpoint_dir → last.pt (training state, every checkpoint_every epochs
+#                  and at the end) and best.pt (model checkpoint, see
+#                  checkpoint.py); an existing last.pt is resumed, so
+#                  rerunning a killed command continues bit-exactly
+# val_loader     → validation loss after every epoch; the best weights
+#                  are restored at the end, and with patience training
+#                  stops once it has not improved by min_delta for that
+#                  many epochs
 # ----------------------------
-print("Training on IDEAL data...")
-for epoch in range(50):
-    model.train()
-    total_loss = 0
-
-    for data in train_loader:
-        optimizer.zero_grad()
-        out = model(data)
-        loss = F.nll_loss(out, data.y)
-        loss.backward()
-        optimizer.step()
-        total_loss += loss.item()
-
-    if (epoch + 1) % 10 == 0:
-        print(f"Epoch {epoch+1} | Loss: {total_loss:.4f}")
+def validation_loss(model, loader):
+    model.eval()
+    total, graphs = 0.0, 0
+    with torch.no_grad():
+        for data in loader:
+            total += F.nll_loss(model(data), data.y, reduction="sum").item()
+            graphs += data.num_graphs
+    return total / max(1, graphs)
+
+
+def train_model(model, loader, epochs=50, lr=0.01, log_every=10, profiler=None, optimizer=None,
+                val_loader=None, patience=None, min_delta=0.0, checkpoint_dir=None,
+                checkpoint_every=1, generator=None, metadata=None):
+    # Pass ``optimizer`` to continue an earlier run (its Adam state carries over)
+    profiler = profiler or NULL_PROFILER
+    optimizer = optimizer or torch.optim.Adam(model.parameters(), lr=lr)
+    profiler.watch(model, optimizer)
+
+    last_path = best_path = None
+    if checkpoint_dir:
+        last_path = os.path.join(checkpoint_dir, "last.pt")
+        best_path = os.path.join(checkpoint_dir, "best.pt")
+
+    start, state = 0, {"best_loss": float("inf"), "best_epoch": 0, "bad_epochs": 0,
+                       "stopped": False, "best_state": None}
+    if last_path and os.path.exists(last_path):
+        start, state = load_training_state(last_path, model, optimizer, generator)
+        print(f"Resumed from {last_path} after epoch {start}")
+
+    def save_state(epoch):
+        if last_path:
+            save_training_state(last_path, model, optimizer, epoch, generator, **state)
+
+    for epoch in range(start, epochs):
+        if state["stopped"]:
+            break
+        model.train()
+        total_loss = 0
+
+        for data in profiler.batches(loader):
+            optimizer.zero_grad()
+            with profiler.phase("forward") as counts:
+                out = model(data)
+                loss = F.nll_loss(out, data.y)
+                counts["graphs"] += data.num_graphs
+                counts["nodes"] += data.num_nodes
+            with profiler.phase("backward"):
+                loss.backward()
+            with profiler.phase("step"):
+                optimizer.step()
+            total_loss += loss.item()
+            profiler.batch_done(data)
+
+        profiler.epoch_done(epoch + 1, total_loss)
+        if log_every and (epoch + 1) % log_every == 0:
+            print(f"Epoch {epoch+1} | Loss: {total_loss:.4f}")
+
+        if val_loader is not None:
+            val_loss = validation_loss(model, val_loader)
+            if val_loss < state["best_loss"] - min_delta:
+                state.update(best_loss=val_loss, best_epoch=epoch + 1, bad_epochs=0,
+                             best_state=copy.deepcopy(model.state_dict()))
+                if best_path:
+                    save_model(best_path, model, epoch=epoch + 1, val_loss=val_loss,
+                               **(metadata or {}))
+            else:
+                state["bad_epochs"] += 1
+            if patience is not None and state["bad_epochs"] >= patience:
+                state["stopped"] = True
+                print(f"Early stopping after epoch {epoch+1}: validation loss has not "
+                      f"improved since epoch {state['best_epoch']} "
+                      f"({state['best_loss']:.4f})")
+
+        if state["stopped"] or epoch + 1 == epochs or (epoch + 1) % checkpoint_every == 0:
+            save_state(epoch + 1)
+
+    if state["best_state"] is not None:
+        model.load_state_dict(state["best_state"])
+    elif best_path:
+        # No validation: the final model is the best one
+        save_model(best_path, model, epoch=epochs, **(metadata or {}))
+    return model
+
 
 # ----------------------------
 # Prediction function
 # ----------------------------
-def predict(model, loader):
+def predict(model, loader, profiler=None):
+    profiler = profiler or NULL_PROFILER
     model.eval()
     preds = []
-    with torch.no_grad():
-        for data in loader:
+    with torch.no_grad(), profiler.phase("predict", trace=True) as counts:
+        for data in profiler.batches(loader):
             out = model(data)
             preds.extend(out.argmax(dim=1).tolist())
+            counts["graphs"] += data.num_graphs
+            counts["nodes"] += data.num_nodes
     return preds
 
-# ----------------------------
-# Evaluate in both conditions
-# ----------------------------
-print("Generating IDEAL predictions...")
-ideal_predictions = predict(model, ideal_test_loader)
 
-print("Generating PERTURBED predictions...")
-perturbed_predictions = predict(model, perturbed_test_loader)
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", type=str, default="MUTAG",
+                        help="TU dataset under --root, e.g. one written by synthetic.py")
+    parser.add_argument("--root", type=str, default=TU_ROOT)
+    parser.add_argument("--output-dir", type=str, default=None,
+                        help="default: submissions/ for MUTAG, results/<dataset>/ otherwise")
+    parser.add_argument("--topo-config", type=str, default="degree")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--lr", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--loader", choices=["packed", "full", "dataloader"], default="packed")
+    parser.add_argument("--csr", action="store_true",
+                        help="aggregate with a cached CSR adjacency (packed/full loaders)")
+    parser.add_argument("--save-checkpoint", type=str, default=None,
+                        help="save the trained model here (see inference.py)")
+    parser.add_argument("--checkpoint-dir", type=str, default=None,
+                        help="periodic training checkpoints; a rerun resumes from last.pt")
+    parser.add_argument("--checkpoint-every", type=int, default=1)
+    parser.add_argument("--patience", type=int, default=None,
+                        help="stop once validation loss has not improved for this many epochs")
+    parser.add_argument("--min-delta", type=float, default=0.0)
+    parser.add_argument("--val-fraction", type=float, default=0.2,
+                        help="share of the train split held out for --patience")
+    parser.add_argument("--predict-only", action="store_true",
+                        help="skip training and predict with <checkpoint-dir>/best.pt")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="append a JSONL trace of phase timings/throughput/memory")
+    parser.add_argument("--torch-profile", type=str, default=None,
+                        help="also record a torch.profiler trace into this directory")
+    args = parser.parse_args()
 
-# ----------------------------
-# Save submissions
-# ----------------------------
-ideal_submission_path = os.path.join(SUBMISSIONS_DIR, "ideal_submission.csv")
-perturbed_submission_path = os.path.join(SUBMISSIONS_DIR, "perturbed_submission.csv")
+    model = None
+    if args.predict_only:
+        if not args.checkpoint_dir:
+            parser.error("--predict-only needs --checkpoint-dir")
+        model, metadata = load_model(os.path.join(args.checkpoint_dir, "best.pt"))
+        args.topo_config = metadata.get("topo_config", args.topo_config)
+        print(f"Loaded {args.checkpoint_dir}/best.pt (epoch {metadata.get('epoch')}, "
+              f"topo_config={args.topo_config})")
+
+    profiler = NULL_PROFILER
+    if args.profile or args.torch_profile:
+        profiler = Profiler(args.profile, args.torch_profile, script="baseline",
+                            dataset=args.dataset, topo_config=args.topo_config, loader=args.loader)
+
+    if args.seed is not None:
+        torch.manual_seed(args.seed)
+
+    # Predictions for other datasets must not overwrite the challenge submissions
+    output_dir = args.output_dir or (
+        SUBMISSIONS_DIR if args.dataset == "MUTAG"
+        else os.path.join(REPO_ROOT, "results", args.dataset)
+    )
+    os.makedirs(output_dir, exist_ok=True)
+    train_df, test_df = load_splits(args.dataset, args.root)
+
+    # ----------------------------
+    # Dataset instances
+    # ----------------------------
+    with profiler.phase("precompute", trace=True):
+        # Training → ideal condition
+        train_dataset = TopologicalDataset(
+            args.dataset,
+            topo_config=args.topo_config,
+            mode="ideal",
+            root=args.root,
+            csr=args.csr
+        )
+
+        # Evaluation → two conditions
+        ideal_test_dataset = train_dataset
+
+        perturbed_test_dataset = TopologicalDataset(
+            args.dataset,
+            topo_config=args.topo_config,
+            mode="perturbed",
+            root=args.root,
+            csr=args.csr
+        )
+
+    stats = train_dataset.dedup_stats
+    if stats:
+        print(f"Features computed for {stats['unique']}/{stats['graphs']} unique graph structures "
+              f"({stats['dedup_rate']:.1%} deduplicated)")
+
+    # ----------------------------
+    # Select splits (vectorized gather into packed subsets)
+    # ----------------------------
+    with profiler.phase("indexing", trace=True):
+        val_loader = None
+        if args.patience is not None:
+            train_df, val_df = validation_split(train_df, args.val_fraction, args.seed or 0)
+            val_loader = make_loader(train_dataset.index_select(val_df.graph_index.values),
+                                     args.loader)
+        train_graphs = train_dataset.index_select(train_df.graph_index.values)
+        ideal_test_graphs = ideal_test_dataset.index_select(test_df.graph_index.values)
+        perturbed_test_graphs = perturbed_test_dataset.index_select(test_df.graph_index.values)
+
+        train_loader = make_loader(train_graphs, args.loader, shuffle=True)
+        ideal_test_loader = make_loader(ideal_test_graphs, args.loader)
+        perturbed_test_loader = make_loader(perturbed_test_graphs, args.loader)
+
+    # ----------------------------
+    # Model
+    # ----------------------------
+    if model is None:
+        model = GINModel(
+            input_dim=train_dataset.num_features,
+            output_dim=train_dataset.num_classes
+        )
+
+        print("Training on IDEAL data...")
+        train_model(model, train_loader, epochs=args.epochs, lr=args.lr, profiler=profiler,
+                    val_loader=val_loader, patience=args.patience, min_delta=args.min_delta,
+                    checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every,
+                    metadata={"dataset": args.dataset, "topo_config": args.topo_config,
+                              "lr": args.lr, "seed": args.seed})
+
+    if args.save_checkpoint and not args.predict_only:
+        save_model(args.save_checkpoint, model, dataset=args.dataset, topo_config=args.topo_config,
+                   epochs=args.epochs, lr=args.lr, seed=args.seed)
+        print(f"Saved checkpoint to: {args.save_checkpoint}")
+
+    # ----------------------------
+    # Evaluate in both conditions
+    # ----------------------------
+    print("Generating IDEAL predictions...")
+    ideal_predictions = predict(model, ideal_test_loader, profiler)
+
+    print("Generating PERTURBED predictions...")
+    perturbed_predictions = predict(model, perturbed_test_loader, profiler)
+
+    # ----------------------------
+    # Save submissions
+    # ----------------------------
+    ideal_submission_path = os.path.join(output_dir, "ideal_submission.csv")
+    perturbed_submission_path = os.path.join(output_dir, "perturbed_submission.csv")
+
+    pd.DataFrame({
+        "graph_index": test_df.graph_index,
+        "target": ideal_predictions
+    }).to_csv(ideal_submission_path, index=False)
+
+    pd.DataFrame({
+        "graph_index": test_df.graph_index,
+        "target": perturbed_predictions
+    }).to_csv(perturbed_submission_path, index=False)
+
+    print(f"Saved ideal submission to: {ideal_submission_path}")
+    print(f"Saved perturbed submission to: {perturbed_submission_path}")
 
-pd.DataFrame({
-    "graph_index": test_df.graph_index,
-    "target": ideal_predictions
-}).to_csv(ideal_submission_path, index=False)
+    if profiler.enabled:
+        print()
+        profiler.report()
+        profiler.close()
 
-pd.DataFrame({
-    "graph_index": test_df.graph_index,
-    "target": perturbed_predictions
-}).to_csv(perturbed_submission_path, index=False)
 
-print(f"Saved ideal submission to: {ideal_submission_path}")
-print(f"Saved perturbed submission to: {perturbed_submission_path}")
+if __name__ == "__main__":
+    main()
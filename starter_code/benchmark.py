@@ -0,0 +1,461 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import torch
+
+from baseline import REPO_ROOT, TU_ROOT, make_loader, predict, train_model
+from dataset import TopologicalDataset, compute_features
+from model import GINModel
+from synthetic import write_synthetic_tu
+
+# scoring_script.py and leaderboard_system.py live outside starter_code/
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "leaderboard"))
+
+# ----------------------------
+# Benchmark suite
+#
+# Times the hot paths of the pipeline on MUTAG and on larger synthetic
+# TU-format datasets generated locally, so scaling curves can be measured
+# offline:
+#   features    → TopologicalDataset._precompute per feature_map config,
+#                 tensor and networkx backends, with and without dedup
+#   dataset     → construction (cold / warm cache), __getitem__, collate
+#   training    → one train_model() epoch and predict(), per loader kind
+#   aggregation → each GINConv layer with COO edge_index vs the cached CSR
+#                 adj_t (forward, forward + backward), CSR build cost
+#   structure   → edge drop/add/rewire with incremental feature updates vs
+#                 recomputing the features of the perturbed graphs
+#   scoring     → scoring_script label decoding, score_submission
+#                 (parse + ID alignment + macro F1) and bootstrap CIs
+#   leaderboard → leaderboard_system.update_leaderboard: importing a
+#                 history CSV, then one incremental update
+#
+# Results are written as JSON; --compare flags every benchmark whose median
+# time grew by more than --threshold against a stored baseline run.
+# ----------------------------
+RESULTS_DIR = os.path.join(REPO_ROOT, "results", "benchmarks")
+
+SUITES = ["features", "dataset", "training", "aggregation", "structure", "scoring",
+          "leaderboard"]
+
+# Edge drop = add = rewire rate of the structure suite
+EDGE_RATES = [0.001, 0.01, 0.1]
+
+# Exact betweenness is O(n*m) per graph; the reference backend and exact
+# betweenness are only timed up to this many graphs
+REFERENCE_LIMIT = 2000
+
+# Bootstrap cost is resamples x rows; larger scoring inputs skip it
+BOOTSTRAP_ROWS_LIMIT = 100_000
+
+
+# ----------------------------
+# Synthetic MUTAG-like datasets
+# ----------------------------
+def datasets(sizes, synthetic_root):
+    """(name, root) of MUTAG followed by one synthetic dataset per size."""
+    out = [("MUTAG", TU_ROOT)]
+    for size in sizes:
+        name = f"SYNTH_{size}"
+        # MUTAG-like: 10-28 nodes, 7 node labels, 4 edge labels
+        write_synthetic_tu(synthetic_root, name, size, num_edge_labels=4, overwrite=True)
+        out.append((name, synthetic_root))
+    return out
+
+
+# ----------------------------
+# Timing
+# ----------------------------
+def measure(fn, repeats=3, warmup=1, setup=None):
+    """Wall-clock seconds of ``repeats`` calls of ``fn`` (``setup`` runs untimed)."""
+    times = []
+    for i in range(warmup + repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            times.append(elapsed)
+    return times
+
+
+def record(results, name, dataset, size, times, **extra):
+    entry = {
+        "name": name,
+        "dataset": dataset,
+        "size": size,
+        "repeats": len(times),
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        **extra,
+    }
+    results.append(entry)
+    print(f"{name:<40} {dataset:<14} {entry['median_s'] * 1e3:>10.2f} ms")
+    return entry
+
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# ----------------------------
+# Suites
+# ----------------------------
+def bench_features(results, datasets, repeats, reference_limit=REFERENCE_LIMIT):
+    for name, root in datasets:
+        ds = TopologicalDataset(name, root=root, cache=False)
+        n = len(ds)
+
+        for config, features_list in ds.feature_map.items():
+            if not features_list:
+                continue
+            for backend in ["tensor", "networkx"]:
+                exact_betweenness = "betweenness" in features_list
+                if n > reference_limit and (backend == "networkx" or exact_betweenness):
+                    continue
+                ds.dedup = False
+                times = measure(
+                    lambda: ds._precompute(features_list, backend, 0),
+                    repeats=repeats, warmup=0,
+                )
+                record(results, f"features/{backend}/{config}", name, n, times,
+                       graphs_per_s=n / statistics.median(times))
+
+                # Per-graph features once per isomorphism class
+                ds.dedup = True
+                times = measure(
+                    lambda: ds._precompute(features_list, backend, 0),
+                    repeats=repeats, warmup=0,
+                )
+                if ds.dedup_stats:
+                    record(results, f"features/{backend}/{config}/dedup", name, n, times,
+                           graphs_per_s=n / statistics.median(times),
+                           dedup_rate=ds.dedup_stats["dedup_rate"])
+
+
+def bench_dataset(results, datasets, repeats):
+    for name, root in datasets:
+        # Cold: features recomputed; warm: loaded from the feature cache
+        cold = measure(
+            lambda: TopologicalDataset(name, topo_config="local", root=root, cache=False),
+            repeats=repeats, warmup=0,
+        )
+        n = len(TopologicalDataset(name, topo_config="local", root=root))
+        record(results, "dataset/construct_cold/local", name, n, cold)
+
+        warm = measure(
+            lambda: TopologicalDataset(name, topo_config="local", root=root),
+            repeats=repeats,
+        )
+        record(results, "dataset/construct_warm/local", name, n, warm)
+
+        perturbed = measure(
+            lambda: TopologicalDataset(name, topo_config="local", mode="perturbed", root=root),
+            repeats=repeats,
+        )
+        record(results, "dataset/construct_perturbed/local", name, n, perturbed)
+
+        ds = TopologicalDataset(name, topo_config="local", root=root)
+        times = measure(lambda: [ds[i] for i in range(n)], repeats=repeats)
+        record(results, "dataset/getitem", name, n, times, graphs_per_s=n / statistics.median(times))
+
+        order = torch.arange(n)
+        times = measure(lambda: ds.collate(order), repeats=repeats)
+        record(results, "dataset/collate_all", name, n, times)
+
+
+def bench_training(results, datasets, repeats, loaders=("packed", "dataloader")):
+    for name, root in datasets:
+        ds = TopologicalDataset(name, topo_config="local", root=root)
+        n = len(ds)
+
+        for kind in loaders:
+            torch.manual_seed(0)
+            model = GINModel(input_dim=ds.num_features, output_dim=ds.num_classes)
+            train_loader = make_loader(ds, kind, shuffle=True)
+            test_loader = make_loader(ds, kind)
+
+            times = measure(
+                lambda: train_model(model, train_loader, epochs=1, log_every=0),
+                repeats=repeats,
+            )
+            record(results, f"training/epoch/{kind}", name, n, times,
+                   graphs_per_s=n / statistics.median(times))
+
+            times = measure(lambda: predict(model, test_loader), repeats=repeats)
+            record(results, f"training/predict/{kind}", name, n, times,
+                   graphs_per_s=n / statistics.median(times))
+
+
+def bench_aggregation(results, datasets, repeats):
+    for name, root in datasets:
+        ds = TopologicalDataset(name, topo_config="local", root=root, csr=True)
+        n = len(ds)
+
+        times = measure(ds._build_csr, repeats=repeats)
+        record(results, "aggregation/build_csr", name, n, times)
+
+        batch = ds.collate(torch.arange(n))
+        torch.manual_seed(0)
+        model = GINModel(input_dim=ds.num_features, output_dim=ds.num_classes)
+        with torch.no_grad():
+            hidden = model.conv1(batch.x, batch.edge_index)
+
+        for layer, x in [("conv1", batch.x), ("conv2", hidden)]:
+            conv = getattr(model, layer)
+
+            def forward(adj):
+                with torch.no_grad():
+                    conv(x, adj)
+
+            def backward(adj):
+                conv(x.requires_grad_(), adj).sum().backward()
+
+            for step, fn in [("forward", forward), ("backward", backward)]:
+                coo = measure(lambda: fn(batch.edge_index), repeats=repeats)
+                csr = measure(lambda: fn(batch.adj_t), repeats=repeats)
+                record(results, f"aggregation/{layer}/{step}/coo", name, n, coo)
+                record(results, f"aggregation/{layer}/{step}/csr", name, n, csr,
+                       speedup=statistics.median(coo) / statistics.median(csr))
+
+
+def bench_structure(results, datasets, repeats, rates=EDGE_RATES):
+    for name, root in datasets:
+        for config in ["local", "all_approx"]:
+            ds = TopologicalDataset(name, topo_config=config, root=root)
+            n = len(ds)
+            ds.undirected_adjacency()
+
+            for rate in rates:
+                perturbed = ds.with_edge_perturbation(rate, rate, rate)
+                graph_of_edge = torch.repeat_interleave(torch.arange(n), perturbed.edge_ptr.diff())
+                edge_index = perturbed.edge_index + perturbed.node_ptr[graph_of_edge]
+                recompute = measure(
+                    lambda: compute_features(edge_index, perturbed.node_ptr, perturbed.edge_ptr,
+                                             ds.features_list, ds.backend, 0, ds.feature_params),
+                    repeats=repeats, warmup=0,
+                )
+                record(results, f"structure/recompute/{config}/{rate:g}", name, n, recompute)
+
+                times = measure(lambda: ds.with_edge_perturbation(rate, rate, rate), repeats=repeats)
+                record(results, f"structure/incremental/{config}/{rate:g}", name, n, times,
+                       edits=perturbed.edits_applied,
+                       speedup=statistics.median(recompute) / statistics.median(times))
+
+
+def synthetic_scoring_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.permutation(rows)
+    truth = pd.DataFrame({"graph_index": ids, "label": rng.integers(0, 2, rows)})
+    sub = pd.DataFrame({"graph_index": rng.permutation(ids), "target": rng.integers(0, 2, rows)})
+    return truth, sub
+
+
+def bench_scoring(results, rows_list, repeats):
+    from scoring_script import (
+        BOOTSTRAP_RESAMPLES, TruthLabels, align_submission, bootstrap_macro_f1,
+        encode_cells, score_submission,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in rows_list:
+            truth, sub = synthetic_scoring_frames(rows)
+            truth_path = os.path.join(tmp, f"truth_{rows}.csv")
+            sub_path = os.path.join(tmp, f"sub_{rows}.csv")
+            truth.to_csv(truth_path, index=False)
+            sub.to_csv(sub_path, index=False)
+
+            times = measure(lambda: TruthLabels.from_csv(truth_path), repeats=repeats)
+            record(results, "scoring/decode_labels", "synthetic", rows, times)
+
+            labels = TruthLabels.from_csv(truth_path)
+            times = measure(lambda: score_submission(sub_path, labels), repeats=repeats)
+            record(results, "scoring/score_file", "synthetic", rows, times,
+                   rows_per_s=rows / statistics.median(times))
+
+            # Paired ideal/perturbed intervals, as scored per participant
+            if rows <= BOOTSTRAP_ROWS_LIMIT:
+                preds, _ = align_submission(sub_path, labels)
+                cells, k = encode_cells(labels, [preds, preds])
+                times = measure(
+                    lambda: bootstrap_macro_f1(cells, k, BOOTSTRAP_RESAMPLES), repeats=repeats
+                )
+                record(results, "scoring/bootstrap", "synthetic", rows, times,
+                       resamples=BOOTSTRAP_RESAMPLES)
+
+
+def bench_leaderboard(results, history_sizes, repeats):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            # The module creates ./leaderboard on import and writes there
+            with quiet():
+                import leaderboard_system
+
+            scores_file = os.path.join(tmp, "scores.json")
+            with open(scores_file, "w") as f:
+                json.dump([{
+                    "participant": "bench",
+                    "f1_ideal": 0.8,
+                    "f1_perturbed": 0.7,
+                    "robustness_gap": 0.1,
+                    "timestamp": "2026-01-01 00:00:00 UTC",
+                }], f)
+
+            for rows in history_sizes:
+                rng = np.random.default_rng(rows)
+                ideal = rng.random(rows).round(6)
+                perturbed = (ideal - rng.random(rows) * 0.2).round(6)
+                history = pd.DataFrame({
+                    "participant": [f"p{i % max(1, rows // 4)}" for i in range(rows)],
+                    "f1_ideal": ideal,
+                    "f1_perturbed": perturbed,
+                    "robustness_gap": (ideal - perturbed).round(6),
+                    "timestamp": pd.date_range("2025-01-01", periods=rows, freq="min")
+                                   .strftime("%Y-%m-%d %H:%M:%S UTC"),
+                })
+
+                def reset():
+                    for path in [leaderboard_system.LEADERBOARD_DB,
+                                 leaderboard_system.LEADERBOARD_HISTORY_MD]:
+                        if os.path.exists(path):
+                            os.remove(path)
+                    history.to_csv(leaderboard_system.LEADERBOARD_HISTORY, index=False)
+
+                def run():
+                    with quiet():
+                        leaderboard_system.update_leaderboard(scores_file)
+
+                # First update imports the CSV history into the store
+                times = measure(run, repeats=repeats, setup=reset)
+                record(results, "leaderboard/migrate", "synthetic", rows, times)
+
+                # Steady state: one submission into an existing store
+                reset()
+                run()
+                times = measure(run, repeats=repeats)
+                record(results, "leaderboard/update", "synthetic", rows, times)
+        finally:
+            os.chdir(cwd)
+
+
+# ----------------------------
+# Run / compare
+# ----------------------------
+def run_benchmarks(suites=SUITES, sizes=(1000, 10000), score_rows=(10_000, 1_000_000),
+                   history_rows=(100, 10_000), repeats=3, synthetic_root=None,
+                   reference_limit=REFERENCE_LIMIT):
+    torch.set_num_threads(1)
+    synthetic_root = synthetic_root or os.path.join(RESULTS_DIR, "synthetic")
+    graph_suites = {"features", "dataset", "training", "aggregation", "structure"}
+    graph_sets = datasets(sizes, synthetic_root) if graph_suites & set(suites) else []
+
+    results = []
+    if "features" in suites:
+        bench_features(results, graph_sets, repeats, reference_limit)
+    if "dataset" in suites:
+        bench_dataset(results, graph_sets, repeats)
+    if "training" in suites:
+        bench_training(results, graph_sets, repeats)
+    if "aggregation" in suites:
+        bench_aggregation(results, graph_sets, repeats)
+    if "structure" in suites:
+        bench_structure(results, graph_sets, repeats)
+    if "scoring" in suites:
+        bench_scoring(results, score_rows, repeats)
+    if "leaderboard" in suites:
+        bench_leaderboard(results, history_rows, repeats)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "threads": torch.get_num_threads(),
+            "repeats": repeats,
+        },
+        "results": results,
+    }
+
+
+def _key(entry):
+    return entry["name"], entry["dataset"], entry["size"]
+
+
+def compare(current, baseline, threshold=0.2, min_seconds=1e-3):
+    """
+    Entries of ``current`` whose median time exceeds the baseline's by more
+    than ``threshold`` (relative) and ``min_seconds`` (absolute, timer noise).
+    """
+    base = {_key(e): e for e in baseline["results"]}
+    regressions = []
+
+    for entry in current["results"]:
+        ref = base.get(_key(entry))
+        if ref is None:
+            continue
+        ratio = entry["median_s"] / max(ref["median_s"], 1e-12)
+        slower = entry["median_s"] - ref["median_s"]
+        status = "REGRESSION" if ratio > 1 + threshold and slower > min_seconds else "ok"
+        print(f"{status:<10} {entry['name']:<40} {entry['dataset']:<14} "
+              f"{ref['median_s'] * 1e3:>10.2f} → {entry['median_s'] * 1e3:>10.2f} ms "
+              f"(x{ratio:.2f})")
+        if status != "ok":
+            regressions.append({**entry, "baseline_median_s": ref["median_s"], "ratio": ratio})
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--sizes", nargs="*", type=int, default=[1000, 10000],
+                        help="synthetic dataset sizes (graphs), in addition to MUTAG")
+    parser.add_argument("--score-rows", nargs="+", type=int, default=[10_000, 1_000_000])
+    parser.add_argument("--history-rows", nargs="+", type=int, default=[100, 10_000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--reference-limit", type=int, default=REFERENCE_LIMIT,
+                        help="largest dataset timed with networkx / exact betweenness")
+    parser.add_argument("--synthetic-root", type=str, default=None)
+    parser.add_argument("--output", type=str, default=os.path.join(RESULTS_DIR, "latest.json"))
+    parser.add_argument("--compare", type=str, default=None, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        args.suites, args.sizes, args.score_rows, args.history_rows,
+        repeats=args.repeats, synthetic_root=args.synthetic_root,
+        reference_limit=args.reference_limit,
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults → {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparing against {args.compare} (threshold {args.threshold:.0%})")
+        regressions = compare(report, baseline, args.threshold)
+        print(f"{len(regressions)} regression(s)")
+        sys.exit(1 if regressions else 0)
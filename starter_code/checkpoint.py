@@ -0,0 +1,78 @@
+import os
+
+import torch
+
+from model import GINModel
+
+# ----------------------------
+# Model checkpoints
+#
+# A checkpoint is a plain dict: the GINModel constructor arguments, its
+# state_dict and free-form metadata (dataset, topo_config, training
+# settings), so predictions can be produced later without retraining.
+# Loaded with weights_only=True; metadata must be plain Python values.
+#
+# A training state (save_training_state) additionally holds the optimizer
+# state, the epoch and the RNG states (global torch RNG, plus the loader's
+# generator if it has one), so a killed run resumes bit-exactly.
+# Files are written to a temporary name and renamed: a kill mid-write
+# leaves the previous checkpoint intact.
+# ----------------------------
+def _save(entry, path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save(entry, tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def _check(entry, path):
+    if entry.get("model") != GINModel.__name__:
+        raise ValueError(f"{path} is not a GINModel checkpoint")
+
+
+def save_model(path, model, **metadata):
+    return _save({
+        "model": type(model).__name__,
+        "config": dict(model.config),
+        "state_dict": model.state_dict(),
+        "metadata": metadata,
+    }, path)
+
+
+def load_model(path):
+    """``(model, metadata)`` from a checkpoint written by ``save_model``; model in eval mode."""
+    entry = torch.load(path, map_location="cpu", weights_only=True)
+    _check(entry, path)
+    model = GINModel(**entry["config"])
+    model.load_state_dict(entry["state_dict"])
+    return model.eval(), entry["metadata"]
+
+
+def save_training_state(path, model, optimizer, epoch, generator=None, **state):
+    """Everything needed to continue training after ``epoch`` epochs; ``state`` is the trainer's own."""
+    return _save({
+        "model": type(model).__name__,
+        "config": dict(model.config),
+        "state_dict": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "epoch": epoch,
+        "rng": torch.get_rng_state(),
+        "generator": None if generator is None else generator.get_state(),
+        "state": state,
+    }, path)
+
+
+def load_training_state(path, model, optimizer, generator=None):
+    """Restore a ``save_training_state`` file into ``model``/``optimizer``; ``(epoch, state)``."""
+    entry = torch.load(path, map_location="cpu", weights_only=True)
+    _check(entry, path)
+    if entry["config"] != model.config:
+        raise ValueError(f"{path} was written for {entry['config']}, not {model.config}")
+    model.load_state_dict(entry["state_dict"])
+    optimizer.load_state_dict(entry["optimizer"])
+    torch.set_rng_state(entry["rng"])
+    if generator is not None and entry["generator"] is not None:
+        generator.set_state(entry["generator"])
+    return entry["epoch"], entry["state"]
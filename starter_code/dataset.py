@@ -1,53 +1,106 @@
+import copy
+
+import numpy as np
 import torch
-import networkx as nx
+from torch_geometric.data import Batch, Data
 from torch_geometric.datasets import TUDataset
 
-# ----------------------------
-# Topological feature functions
-# ----------------------------
-def compute_topological_features(data, features_list):
-    edge_index = data.edge_index.cpu().numpy()
-    G = nx.Graph()
-    G.add_edges_from(edge_index.T)
-
-    # Ensure isolated nodes are included
-    for i in range(data.num_nodes):
-        if i not in G:
-            G.add_node(i)
-
-    features = []
-    nodes = sorted(G.nodes())
-
-    if 'degree' in features_list:
-        features.append(
-            torch.tensor([G.degree(n) for n in nodes], dtype=torch.float).unsqueeze(1)
-        )
+import topo_cache
+from dedup import ORDER_DEPENDENT_FEATURES, deduplicate
+from perturbation import load_snapshot, perturb_features, save_snapshot
+from structural import INCREMENTAL_FEATURES, perturb_structure, undirected_adjacency
+from topo_features import (
+    FEATURE_ORDER,
+    TENSOR_FEATURES,
+    approximation_error,
+    compute_topological_features,
+    compute_topological_features_batched,
+    compute_topological_features_packed,
+    counts_to_ptr,
+    gather_ranges,
+    pack_graphs,
+)
 
-    if 'clustering' in features_list:
-        c = nx.clustering(G)
-        features.append(
-            torch.tensor([c[n] for n in nodes], dtype=torch.float).unsqueeze(1)
-        )
+FEATURE_MAP = {
+    "none": [],
+    "degree": ["degree"],
+    "local": ["degree", "clustering"],
+    "global": ["betweenness", "pagerank", "core"],
+    "all": ["degree", "clustering", "betweenness", "pagerank", "core"],
+    # Bounded-cost variants for graphs too large for exact centralities
+    "betweenness_approx": ["betweenness_approx"],
+    "pagerank_fast": ["pagerank_fast"],
+    "global_approx": ["betweenness_approx", "pagerank_fast", "core"],
+    "all_approx": ["degree", "clustering", "betweenness_approx", "pagerank_fast", "core"],
+}
+
+
+def compute_features(edge_index, node_ptr, edge_ptr, features_list, backend="tensor",
+                     num_workers=0, params=None):
+    """
+    Packed ``[num_nodes, num_features]`` topological features of block-diagonal
+    graphs (global node ids, see ``pack_graphs``), columns in FEATURE_ORDER.
+    """
+    features_list = [f for f in FEATURE_ORDER if f in features_list]
 
-    if 'betweenness' in features_list:
-        b = nx.betweenness_centrality(G)
-        features.append(
-            torch.tensor([b[n] for n in nodes], dtype=torch.float).unsqueeze(1)
+    if backend == "networkx":
+        return compute_topological_features_packed(
+            edge_index, node_ptr, edge_ptr, features_list, num_workers, params
         )
 
-    if 'pagerank' in features_list:
-        p = nx.pagerank(G)
-        features.append(
-            torch.tensor([p[n] for n in nodes], dtype=torch.float).unsqueeze(1)
+    if backend != "tensor":
+        raise ValueError(f"Unknown backend: {backend}")
+
+    fast = [f for f in features_list if f in TENSOR_FEATURES]
+    slow = [f for f in features_list if f not in TENSOR_FEATURES]
+
+    columns = {}
+    if fast:
+        block = compute_topological_features_batched(edge_index, node_ptr, fast, params)
+        columns.update(zip(fast, block.unbind(dim=1)))
+    if slow:
+        block = compute_topological_features_packed(
+            edge_index, node_ptr, edge_ptr, slow, num_workers, params
         )
+        columns.update(zip(slow, block.unbind(dim=1)))
+
+    return torch.stack([columns[f] for f in features_list], dim=1)
 
-    if 'core' in features_list:
-        core = nx.core_number(G)
-        features.append(
-            torch.tensor([core[n] for n in nodes], dtype=torch.float).unsqueeze(1)
+
+def compute_features_deduplicated(edge_index, node_ptr, edge_ptr, features_list, backend="tensor",
+                                  num_workers=0, params=None):
+    """
+    ``compute_features`` with the per-graph (NetworkX) features evaluated
+    once per isomorphism class (see dedup.py) and read back through each
+    graph's node mapping; vectorized tensor features gain nothing from it.
+    Returns ``(features, stats)``, stats None when nothing was deduplicated.
+    """
+    features_list = [f for f in FEATURE_ORDER if f in features_list]
+    shared = [
+        f for f in features_list
+        if f not in ORDER_DEPENDENT_FEATURES and (backend == "networkx" or f not in TENSOR_FEATURES)
+    ]
+    direct = [f for f in features_list if f not in shared]
+
+    columns, stats = {}, None
+    if shared:
+        representatives, node_map, stats = deduplicate(edge_index, node_ptr, edge_ptr)
+        nodes = gather_ranges(node_ptr, representatives)
+        edges = gather_ranges(edge_ptr, representatives)
+        row = torch.full((int(node_ptr[-1]),), -1, dtype=torch.long)
+        row[nodes] = torch.arange(nodes.numel())
+        block = compute_features(
+            row[edge_index[:, edges]],
+            counts_to_ptr(node_ptr[representatives + 1] - node_ptr[representatives]),
+            counts_to_ptr(edge_ptr[representatives + 1] - edge_ptr[representatives]),
+            shared, backend, num_workers, params,
         )
+        columns.update(zip(shared, block[row[node_map]].unbind(dim=1)))
+    if direct:
+        block = compute_features(edge_index, node_ptr, edge_ptr, direct, backend, num_workers, params)
+        columns.update(zip(direct, block.unbind(dim=1)))
 
-    return torch.cat(features, dim=1) if features else None
+    return torch.stack([columns[f] for f in features_list], dim=1), stats
 
 
 # ----------------------------
@@ -61,6 +114,52 @@ class TopologicalDataset:
     mode = "perturbed"
         Adds feature noise + distribution shift
         Used to evaluate robustness/generalization
+        Applied once to the packed feature matrix; the noise of every graph
+        is keyed on (seed, graph_index), so the perturbed set is identical
+        across runs, batch orders and worker counts. perturbed_snapshot=path
+        loads a frozen copy written by save_perturbed_snapshot()
+
+    mode = "structural"
+        Perturbs the topology instead: seeded edge drop / add / rewire at
+        rates edge_drop, edge_add, rewire (see structural.py), keyed on
+        (seed, graph_index) like the feature noise. Degree, clustering and
+        core columns are updated for the touched nodes only; other
+        topological features are recomputed for the touched graphs
+
+    Storage is packed InMemoryDataset-style: one contiguous node feature
+    matrix (topological columns already appended), one edge array and
+    per-graph offsets. Items are views into it.
+
+    backend = "tensor"
+        Computes degree/clustering/pagerank/core for the whole dataset at
+        once; remaining features fall back to NetworkX per graph
+
+    backend = "networkx"
+        Reference path, one NetworkX graph per sample
+
+    feature_params = {...}
+        Cost/accuracy knobs for the approximate features ("betweenness_approx",
+        "pagerank_fast"); see topo_features.DEFAULT_FEATURE_PARAMS
+
+    num_workers = N
+        Spread the per-graph NetworkX features (betweenness, or everything
+        with backend="networkx") over N processes
+
+    cache = True
+        Reuse features from <root>/<name>/topo_cache/ when the dataset, backend,
+        feature list, raw files and feature code are unchanged
+
+    dedup = True
+        Compute the per-graph NetworkX features (betweenness, everything
+        with backend="networkx") once per isomorphism class of graphs (WL
+        hash + verified node mapping, see dedup.py) and copy them to the
+        duplicates; dedup_stats reports the dedup rate
+
+    csr = True
+        Also keep every graph's adjacency as CSR (edges sorted by target),
+        built once; collate() then attaches the batch adjacency as
+        ``adj_t`` and GINModel aggregates with a sparse matmul. Structure is
+        shared by subsets and perturbed copies
     """
 
     def __init__(self,
@@ -68,62 +167,312 @@ class TopologicalDataset:
                  topo_config="none",
                  mode="ideal",
                  noise_std=0.05,
-                 feature_shift=0.3):
+                 feature_shift=0.3,
+                 backend="tensor",
+                 cache=True,
+                 root="../data/TUDataset",
+                 num_workers=0,
+                 feature_params=None,
+                 seed=0,
+                 perturbed_snapshot=None,
+                 csr=False,
+                 dedup=True,
+                 edge_drop=0.1,
+                 edge_add=0.1,
+                 rewire=0.1):
 
-        self.dataset = TUDataset(root="../data/TUDataset", name=name)
+        self.dataset = TUDataset(root=root, name=name)
         self.mode = mode
         self.noise_std = noise_std
         self.feature_shift = feature_shift
+        self.seed = seed
+        self.feature_params = feature_params
+        self.backend = backend
+        self.num_workers = num_workers
+        self.dedup = dedup
+        self.dedup_stats = None
 
-        self.feature_map = {
-            "none": [],
-            "degree": ["degree"],
-            "local": ["degree", "clustering"],
-            "global": ["betweenness", "pagerank", "core"],
-            "all": ["degree", "clustering", "betweenness", "pagerank", "core"],
-        }
+        self.feature_map = FEATURE_MAP
+
+        self._pack_source()
+        self.csr_col = self.in_degree = None
+        self._adjacency = None
+        if csr:
+            self._build_csr()
+
+        features_list = self.features_list = self.feature_map[topo_config]
+        packed = None
+        if features_list:
+            cached = (topo_cache.load(root, name, features_list, feature_params, backend)
+                      if cache else None)
+            if cached is None:
+                packed, _ = self._precompute(features_list, backend, num_workers)
+                if cache:
+                    topo_cache.store(root, name, features_list, packed, self.node_ptr,
+                                     feature_params, backend)
+            else:
+                packed, _ = cached
+
+        # Attach topological features once, for the whole dataset
+        if packed is not None:
+            self.x = packed.clone() if self.x is None else torch.cat([self.x, packed], dim=1)
+            self.topo_features = list(self.x[:, -packed.size(1):].split(self._num_nodes))
+        else:
+            self.topo_features = [None] * len(self)
+
+        # ----------------------------
+        # Perturbed condition (whole feature matrix at once)
+        # ----------------------------
+        if mode == "perturbed":
+            if perturbed_snapshot is not None:
+                self.x = load_snapshot(
+                    perturbed_snapshot, self.node_ptr, self.graph_index,
+                    feature_shift, noise_std, seed,
+                )["x"]
+            else:
+                self.x = perturb_features(
+                    self.x, self.node_ptr, self.graph_index, feature_shift, noise_std, seed
+                )
+        elif mode == "structural":
+            self._perturb_structure(edge_drop, edge_add, rewire, seed)
+
+    def _pack_source(self):
+        slices = getattr(self.dataset, "slices", None)
+
+        if slices is not None and "x" in slices and getattr(self.dataset, "_indices", None) is None:
+            store = self.dataset._data
+            self.x = store.x
+            self.edge_index = store.edge_index
+            self.edge_attr = store.get("edge_attr")
+            self.y = store.y
+            self.node_ptr = slices["x"].long()
+            self.edge_ptr = slices["edge_index"].long()
+        else:
+            batch = Batch.from_data_list(list(self.dataset))
+            graph_of_edge = batch.batch[batch.edge_index[0]]
+            self.x = batch.x
+            self.edge_index = batch.edge_index - batch.ptr[graph_of_edge]
+            self.edge_attr = batch.get("edge_attr")
+            self.y = batch.y
+            self.node_ptr = batch.ptr
+            self.edge_ptr = counts_to_ptr(
+                torch.bincount(graph_of_edge, minlength=batch.num_graphs)
+            )
+
+        self.graph_index = torch.arange(self.node_ptr.numel() - 1)
+        self._index_bounds()
 
-        # Precompute topological features (fast for MUTAG)
-        self.topo_features = []
-        for data in self.dataset:
-            self.topo_features.append(
-                compute_topological_features(data, self.feature_map[topo_config])
+    def _build_csr(self):
+        # Sorting by global (target, source) keeps every graph's edges inside
+        # its own edge range, so edge_ptr also delimits the CSR columns
+        num_nodes = int(self.node_ptr[-1])
+        graph_of_edge = torch.repeat_interleave(torch.arange(len(self)), self.edge_ptr.diff())
+        offset = self.node_ptr[graph_of_edge]
+        src, dst = self.edge_index[0] + offset, self.edge_index[1] + offset
+        order = torch.argsort(dst * num_nodes + src)
+        self.csr_col = self.edge_index[0, order]
+        self.in_degree = torch.bincount(dst, minlength=num_nodes)
+
+    def _index_bounds(self):
+        # Python ints for cheap per-item slicing
+        self._nodes = self.node_ptr.tolist()
+        self._edges = self.edge_ptr.tolist()
+        self._num_nodes = self.node_ptr.diff().tolist()
+
+    def _precompute(self, features_list, backend, num_workers):
+        """Packed ``[num_nodes, num_features]`` features and per-graph node offsets."""
+        edge_index, node_ptr, edge_ptr = pack_graphs(self.dataset)
+        if self.dedup:
+            packed, self.dedup_stats = compute_features_deduplicated(
+                edge_index, node_ptr, edge_ptr, features_list, backend, num_workers,
+                self.feature_params,
             )
+            return packed, node_ptr
+        packed = compute_features(
+            edge_index, node_ptr, edge_ptr, features_list, backend, num_workers,
+            self.feature_params,
+        )
+        return packed, node_ptr
+
+    def approximation_report(self, sample_size=32, seed=0):
+        """Error of the approximate features against exact ones on a graph sample."""
+        return approximation_error(self.dataset, self.feature_params, sample_size, seed)
 
     def __len__(self):
-        return len(self.dataset)
+        return len(self._num_nodes)
 
     def __getitem__(self, idx):
-        data = self.dataset[idx].clone()
-        topo = self.topo_features[idx]
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        n0, n1 = self._nodes[idx], self._nodes[idx + 1]
+        e0, e1 = self._edges[idx], self._edges[idx + 1]
 
-        # Attach topological features
-        if topo is not None:
-            data.x = topo if data.x is None else torch.cat([data.x, topo], dim=1)
+        data = Data(
+            x=None if self.x is None else self.x[n0:n1],
+            edge_index=self.edge_index[:, e0:e1],
+            y=self.y[idx:idx + 1],
+            # Not "graph_index": PyG offsets any *index* attribute when batching
+            graph_id=self.graph_index[idx:idx + 1],
+            num_nodes=n1 - n0,
+        )
+        if self.edge_attr is not None:
+            data.edge_attr = self.edge_attr[e0:e1]
 
-        # ----------------------------
-        # Ideal condition
-        # ----------------------------
-        if self.mode == "ideal":
-            return data
+        # Perturbed features were materialised at construction
+        return data
 
-        # ----------------------------
-        # Perturbed condition
-        # ----------------------------
-        if self.mode == "perturbed":
-            if data.x is not None:
-                # Distribution shift
-                data.x = data.x + self.feature_shift
+    def with_perturbation(self, feature_shift, noise_std, seed=0):
+        """Perturbed copy of a clean dataset (or subset) at another noise level."""
+        if self.mode != "ideal":
+            raise ValueError("with_perturbation() expects an ideal dataset")
 
-                # Gaussian noise
-                noise = torch.randn_like(data.x) * self.noise_std
-                data.x = data.x + noise
+        perturbed = copy.copy(self)
+        perturbed.mode = "perturbed"
+        perturbed.feature_shift = feature_shift
+        perturbed.noise_std = noise_std
+        perturbed.seed = seed
+        perturbed.x = perturb_features(
+            self.x, self.node_ptr, self.graph_index, feature_shift, noise_std, seed
+        )
+        return perturbed
 
-        return data
+    def with_edge_perturbation(self, edge_drop=0.1, edge_add=0.1, rewire=0.1, seed=0):
+        """Structurally perturbed copy of a clean dataset (or subset), see mode="structural"."""
+        if self.mode != "ideal":
+            raise ValueError("with_edge_perturbation() expects an ideal dataset")
+
+        # The clean adjacency is kept here, so replicates share it
+        adjacency = self.undirected_adjacency()
+        perturbed = copy.copy(self)
+        perturbed.mode = "structural"
+        perturbed._perturb_structure(edge_drop, edge_add, rewire, seed, adjacency)
+        return perturbed
+
+    def undirected_adjacency(self):
+        """Symmetric loop-free CSR of all graphs (see structural.py), kept per edge set."""
+        if self._adjacency is None or self._adjacency[0] is not self.edge_index:
+            self._adjacency = (self.edge_index, *undirected_adjacency(
+                self.edge_index, self.node_ptr, self.edge_ptr
+            ))
+        return self._adjacency[1:]
+
+    def _perturb_structure(self, edge_drop, edge_add, rewire, seed, adjacency=None):
+        self.edge_drop, self.edge_add, self.rewire, self.seed = edge_drop, edge_add, rewire, seed
+        features_list = [f for f in FEATURE_ORDER if f in self.features_list]
+        first = self.num_features - len(features_list)
+        columns = {f: first + i for i, f in enumerate(features_list) if f in INCREMENTAL_FEATURES}
+
+        original = self.x
+        self.edge_index, self.edge_attr, self.edge_ptr, self.x, touched, self.edits_applied = (
+            perturb_structure(
+                self.edge_index, self.edge_attr, self.node_ptr, self.edge_ptr, self.graph_index,
+                self.x, columns, edge_drop, edge_add, rewire, seed,
+                adjacency or self.undirected_adjacency(),
+            )
+        )
+        self._index_bounds()
+
+        # Global features (betweenness, pagerank) of the touched graphs only
+        rest = [f for f in features_list if f not in columns]
+        if rest and touched.numel():
+            nodes = gather_ranges(self.node_ptr, touched)
+            edges = gather_ranges(self.edge_ptr, touched)
+            node_ptr = counts_to_ptr(self.node_ptr[touched + 1] - self.node_ptr[touched])
+            edge_counts = self.edge_ptr[touched + 1] - self.edge_ptr[touched]
+            edge_index = self.edge_index[:, edges] + torch.repeat_interleave(node_ptr[:-1], edge_counts)
+            block = compute_features(
+                edge_index, node_ptr, counts_to_ptr(edge_counts), rest,
+                self.backend, self.num_workers, self.feature_params,
+            )
+            if self.x is original:
+                self.x = self.x.clone()
+            for i, f in enumerate(rest):
+                self.x[nodes, first + features_list.index(f)] = block[:, i]
+
+        if features_list:
+            self.topo_features = list(self.x[:, first:].split(self._num_nodes))
+        if self.csr_col is not None:
+            self._build_csr()
+
+    def save_perturbed_snapshot(self, path):
+        """Write the perturbed feature matrix so later runs can reload it verbatim."""
+        if self.mode != "perturbed":
+            raise ValueError("Only perturbed datasets have a snapshot to save")
+        save_snapshot(
+            path, self.x, self.node_ptr, self.graph_index,
+            self.feature_shift, self.noise_std, self.seed,
+        )
+
+    # ----------------------------
+    # Vectorized split selection
+    # ----------------------------
+    def _gather(self, indices):
+        idx = torch.from_numpy(np.array(indices, dtype=np.int64)).flatten()
+        node_counts = self.node_ptr[idx + 1] - self.node_ptr[idx]
+        edge_counts = self.edge_ptr[idx + 1] - self.edge_ptr[idx]
+        nodes = gather_ranges(self.node_ptr, idx)
+        edges = gather_ranges(self.edge_ptr, idx)
+
+        return idx, node_counts, edge_counts, {
+            "x": None if self.x is None else self.x[nodes],
+            "edge_index": self.edge_index[:, edges],
+            "edge_attr": None if self.edge_attr is None else self.edge_attr[edges],
+            "y": self.y[idx],
+            "graph_index": self.graph_index[idx],
+            "csr_col": None if self.csr_col is None else self.csr_col[edges],
+            "in_degree": None if self.in_degree is None else self.in_degree[nodes],
+        }
+
+    def index_select(self, indices):
+        """
+        Packed copy holding only the graphs in ``indices`` (in that order),
+        e.g. ``dataset.index_select(train_df.graph_index)``.
+        """
+        _, node_counts, edge_counts, tensors = self._gather(indices)
+
+        subset = copy.copy(self)
+        for key, value in tensors.items():
+            setattr(subset, key, value)
+        subset.node_ptr = counts_to_ptr(node_counts)
+        subset.edge_ptr = counts_to_ptr(edge_counts)
+        subset._index_bounds()
+
+        width = 0 if self.topo_features[0] is None else self.topo_features[0].size(1)
+        subset.topo_features = (
+            list(subset.x[:, -width:].split(subset._num_nodes)) if width else [None] * len(subset)
+        )
+        return subset
+
+    def collate(self, indices):
+        """The graphs in ``indices`` as one ``Batch``, without per-item copies."""
+        _, node_counts, edge_counts, tensors = self._gather(indices)
+        ptr = counts_to_ptr(node_counts)
+
+        edge_offset = torch.repeat_interleave(ptr[:-1], edge_counts)
+        tensors["edge_index"] = tensors["edge_index"] + edge_offset
+
+        tensors["graph_id"] = tensors.pop("graph_index")
+        csr_col, in_degree = tensors.pop("csr_col"), tensors.pop("in_degree")
+        if csr_col is not None:
+            num_nodes = int(ptr[-1])
+            # Valid by construction (rows sorted, columns in range)
+            tensors["adj_t"] = torch.sparse_csr_tensor(
+                counts_to_ptr(in_degree), csr_col + edge_offset,
+                torch.ones(csr_col.numel()),
+                (num_nodes, num_nodes), check_invariants=False,
+            )
+
+        batch = Batch(
+            batch=torch.repeat_interleave(torch.arange(node_counts.numel()), node_counts),
+            ptr=ptr,
+            **{k: v for k, v in tensors.items() if v is not None},
+        )
+        return batch
 
     @property
     def num_features(self):
-        return self[0].x.shape[1]
+        return 0 if self.x is None else self.x.shape[1]
 
     @property
     def num_classes(self):
@@ -0,0 +1,171 @@
+import networkx as nx
+import numpy as np
+import torch
+
+from perturbation import _splitmix64
+
+# ----------------------------
+# Isomorphism-aware deduplication
+#
+# Topological features depend on graph structure only, so structurally
+# identical graphs (frequent in molecule collections) need them computed
+# once. Graphs of a packed dataset are grouped by a Weisfeiler-Lehman hash
+# computed for all graphs at once; every graph is then mapped onto its
+# group's representative through the canonical node order (nodes sorted by
+# final WL colour). A mapping is only accepted once the relabelled edge
+# multiset equals the representative's, so ties between symmetric nodes
+# fall back to VF2 and hash collisions start a new group: features read
+# back through the mapping are those of an isomorphic graph, never of a
+# merely similar one.
+# ----------------------------
+WL_ITERATIONS = 3
+
+# Features whose values depend on node labelling, not only on structure
+# (betweenness_approx samples its pivots from the node list)
+ORDER_DEPENDENT_FEATURES = {"betweenness_approx"}
+
+
+def _segment_sum(values, ptr):
+    """Wrapping uint64 sum of ``values[ptr[i]:ptr[i + 1]]`` for every segment."""
+    out = np.zeros(ptr.size - 1, dtype=np.uint64)
+    nonempty = np.diff(ptr) > 0
+    if values.size:
+        out[nonempty] = np.add.reduceat(values, ptr[:-1][nonempty])
+    return out
+
+
+def wl_colors(edge_index, node_ptr, edge_ptr, iterations=WL_ITERATIONS):
+    """
+    WL node colours and graph hashes of a packed dataset (global
+    ``edge_index``, see ``pack_graphs``) as uint64 arrays ``(node, graph)``.
+    Neighbour colours are aggregated by a hashed sum, so every round is a
+    handful of vectorized passes over all graphs.
+    """
+    num_nodes = int(node_ptr[-1])
+    src, dst = edge_index[0].numpy(), edge_index[1].numpy()
+    order = np.argsort(dst, kind="stable")
+    src_by_dst = src[order]
+    in_ptr = np.concatenate([[0], np.cumsum(np.bincount(dst, minlength=num_nodes))])
+    out_degree = np.bincount(src, minlength=num_nodes).astype(np.uint64)
+
+    with np.errstate(over="ignore"):
+        color = _splitmix64(out_degree * np.uint64(0x100000001B3) + np.uint64(in_ptr.size))
+        for i in range(iterations):
+            neighbours = _segment_sum(_splitmix64(color[src_by_dst]), in_ptr)
+            color = _splitmix64(color ^ _splitmix64(neighbours + np.uint64(i)))
+
+        sizes = np.diff(node_ptr.numpy()).astype(np.uint64)
+        edges = np.diff(edge_ptr.numpy()).astype(np.uint64)
+        graph = _segment_sum(_splitmix64(color), node_ptr.numpy())
+        graph = _splitmix64(graph ^ _splitmix64(sizes * np.uint64(0x9E3779B97F4A7C15) + edges))
+    return color, graph
+
+
+def _canonical_position(color, node_ptr):
+    # Position of every node when its graph's nodes are sorted by colour
+    num_graphs = node_ptr.numel() - 1
+    graph_of_node = np.repeat(np.arange(num_graphs), np.diff(node_ptr.numpy()))
+    order = np.lexsort((color, graph_of_node))
+    position = np.empty_like(order)
+    position[order] = np.arange(order.size) - node_ptr.numpy()[graph_of_node[order]]
+    return order, position, graph_of_node
+
+
+def _sorted_edge_keys(edge_index, node_map, node_ptr, edge_ptr, graphs):
+    """Per graph of ``graphs``, its edges relabelled by ``node_map`` as sorted local keys."""
+    ptr = edge_ptr.numpy()
+    counts = np.diff(ptr)[graphs]
+    starts = np.repeat(ptr[graphs] - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+    positions = starts + np.arange(int(counts.sum()))
+    owner = np.repeat(np.arange(graphs.size), counts)
+
+    src = node_map[edge_index[0].numpy()[positions]]
+    dst = node_map[edge_index[1].numpy()[positions]]
+    base = node_ptr.numpy()[np.searchsorted(node_ptr.numpy(), src, side="right") - 1]
+    width = max(1, int(np.diff(node_ptr.numpy()).max(initial=1)))
+    key = (src - base) * width + (dst - base)
+    return key[np.lexsort((key, owner))], np.concatenate([[0], np.cumsum(counts)])
+
+
+def _vf2_map(edge_index, node_ptr, edge_ptr, color, g, rep):
+    # Node-coloured VF2 between graph g and representative rep (global ids)
+    def graph(i):
+        n0, n1 = int(node_ptr[i]), int(node_ptr[i + 1])
+        e0, e1 = int(edge_ptr[i]), int(edge_ptr[i + 1])
+        G = nx.Graph()
+        G.add_nodes_from((n, {"c": int(color[n])}) for n in range(n0, n1))
+        G.add_edges_from(edge_index[:, e0:e1].T.tolist())
+        return G
+
+    mapping = nx.vf2pp_isomorphism(graph(g), graph(rep), node_label="c")
+    if mapping is None:
+        return None
+    return np.array([mapping[n] for n in range(int(node_ptr[g]), int(node_ptr[g + 1]))])
+
+
+def deduplicate(edge_index, node_ptr, edge_ptr, iterations=WL_ITERATIONS):
+    """
+    Group the graphs of a packed dataset (global ``edge_index``) into
+    isomorphism classes.
+
+    Returns ``(representatives, node_map, stats)``: the sorted graph ids
+    whose features are computed, the global id of every node's counterpart
+    in its graph's representative, and counts for the dedup report.
+    """
+    num_graphs = node_ptr.numel() - 1
+    color, graph_hash = wl_colors(edge_index, node_ptr, edge_ptr, iterations)
+    order, position, graph_of_node = _canonical_position(color, node_ptr)
+
+    # First graph of every hash is the candidate representative
+    _, first, inverse = np.unique(graph_hash, return_index=True, return_inverse=True)
+    rep = first[inverse.reshape(-1)]
+    node_map = order[node_ptr.numpy()[rep[graph_of_node]] + position]
+
+    # Accept a canonical mapping only if it carries the edges onto the representative's
+    members = np.flatnonzero(rep != np.arange(num_graphs))
+    mapped, ptr = _sorted_edge_keys(edge_index, node_map, node_ptr, edge_ptr, members)
+    target, _ = _sorted_edge_keys(
+        edge_index, np.arange(int(node_ptr[-1])), node_ptr, edge_ptr, rep[members]
+    )
+    mismatch = np.zeros(members.size, dtype=bool)
+    if mapped.size:
+        owner = np.repeat(np.arange(members.size), np.diff(ptr))
+        mismatch[owner[mapped != target]] = True
+
+    stats = {"vf2_fallbacks": 0, "wl_collisions": 0}
+    reps_by_hash = {}
+    for g in members[mismatch].tolist():
+        stats["vf2_fallbacks"] += 1
+        nodes = slice(int(node_ptr[g]), int(node_ptr[g + 1]))
+        candidates = reps_by_hash.setdefault(int(graph_hash[g]), [int(rep[g])])
+        for candidate in candidates:
+            counterpart = _vf2_map(edge_index, node_ptr, edge_ptr, color, g, candidate)
+            if counterpart is not None and _same_edges(
+                edge_index, node_ptr, edge_ptr, g, candidate, counterpart
+            ):
+                rep[g], node_map[nodes] = candidate, counterpart
+                break
+        else:
+            # Same hash, different structure: g represents a new class
+            stats["wl_collisions"] += 1
+            candidates.append(g)
+            rep[g], node_map[nodes] = g, np.arange(nodes.start, nodes.stop)
+
+    representatives = np.unique(rep)
+    stats.update({
+        "graphs": num_graphs,
+        "unique": int(representatives.size),
+        "dedup_rate": 1.0 - representatives.size / max(1, num_graphs),
+    })
+    return torch.from_numpy(representatives), torch.from_numpy(node_map), stats
+
+
+def _same_edges(edge_index, node_ptr, edge_ptr, g, rep, counterpart):
+    # Edge multiset of g relabelled by counterpart equals that of rep
+    def keys(i, relabel):
+        e0, e1 = int(edge_ptr[i]), int(edge_ptr[i + 1])
+        edges = relabel(edge_index[:, e0:e1].numpy()) - int(node_ptr[rep])
+        return np.sort(edges[0] * int(node_ptr[-1]) + edges[1])
+
+    n0 = int(node_ptr[g])
+    return np.array_equal(keys(g, lambda e: counterpart[e - n0]), keys(rep, lambda e: e))
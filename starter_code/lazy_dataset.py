@@ -0,0 +1,466 @@
+import json
+import os
+import shutil
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+from torch_geometric.data import Data
+
+import topo_cache
+from dataset import FEATURE_MAP, compute_features
+from perturbation import perturb_features
+from topo_features import counts_to_ptr
+
+# ----------------------------
+# Lazy / streaming TU datasets
+#
+# For collections too large to hold in memory. The raw TU files are read
+# once, by streaming, into a memory-mapped index under <root>/<name>/packed/
+# (node/edge offsets, labels, local edge lists); after that a graph is a
+# slice of the index and nothing scales with the dataset size in RAM.
+#
+# Topological features are computed per shard of ``shard_size`` consecutive
+# graphs with the same code as TopologicalDataset. Features are per graph,
+# so every item equals the eager dataset's (perturbed items too: the noise is
+# keyed on graph_index). A full topo_cache entry is used when present;
+# otherwise computed shards can be persisted under topo_cache/shards/.
+#
+# LazyTopologicalDataset   map-style, shards kept in an LRU cache bounded
+#                          by ``cache_mb``; best with sequential access
+# StreamingTopologicalDataset
+#                          IterableDataset, one shard in memory per
+#                          DataLoader worker, shards split across workers
+# ----------------------------
+INDEX_DIR = "packed"
+INDEX_VERSION = 1
+CHUNK_ROWS = 1 << 22
+
+
+def index_dir(root, name):
+    return os.path.join(root, name, INDEX_DIR)
+
+
+def _chunks(path, chunksize=CHUNK_ROWS):
+    for chunk in pd.read_csv(path, header=None, sep=",", skipinitialspace=True,
+                             dtype=np.int64, chunksize=chunksize):
+        yield chunk.to_numpy()
+
+
+def _add_counts(totals, ids):
+    # Sorted ids → counts added at their offset, growing ``totals`` as needed
+    counts = np.bincount(ids - ids[0], minlength=ids[-1] - ids[0] + 1)
+    end = ids[0] + counts.size
+    if end > totals.size:
+        totals = np.concatenate([totals, np.zeros(end - totals.size, dtype=np.int64)])
+    totals[ids[0]:end] += counts
+    return totals
+
+
+def build_index(root, name, chunksize=CHUNK_ROWS):
+    """
+    Stream ``<root>/<name>/raw`` into the packed index, reproducing
+    TUDataset's processing (0-based ids, self-loops dropped, edges coalesced,
+    one-hot node labels, compacted graph labels). Returns its directory.
+    """
+    prefix = os.path.join(root, name, "raw", name)
+    target = index_dir(root, name)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    # Graph indicator → node offsets
+    node_counts = np.zeros(0, dtype=np.int64)
+    last = 0
+    for chunk in _chunks(f"{prefix}_graph_indicator.txt", chunksize):
+        ids = chunk[:, 0] - 1
+        if ids[0] < last or (np.diff(ids) < 0).any():
+            raise ValueError(f"{name}: graph_indicator is not sorted by graph")
+        last = ids[-1]
+        node_counts = _add_counts(node_counts, ids)
+    node_ptr = counts_to_ptr(torch.from_numpy(node_counts)).numpy()
+    num_nodes = int(node_ptr[-1])
+
+    # Node labels, stored raw; one-hot per column on access
+    label_min = label_max = None
+    if os.path.exists(f"{prefix}_node_labels.txt"):
+        with open(os.path.join(tmp, "node_labels.bin"), "wb") as f:
+            for chunk in _chunks(f"{prefix}_node_labels.txt", chunksize):
+                lo, hi = chunk.min(axis=0), chunk.max(axis=0)
+                label_min = lo if label_min is None else np.minimum(label_min, lo)
+                label_max = hi if label_max is None else np.maximum(label_max, hi)
+                f.write(chunk.astype(np.int64).tobytes())
+
+    # Graph labels → 0..num_classes-1
+    labels = np.concatenate(list(_chunks(f"{prefix}_graph_labels.txt", chunksize)))[:, 0]
+    classes, y = np.unique(labels, return_inverse=True)
+
+    # Edge labels follow _A.txt row by row; TUDataset keeps them one-hot as edge_attr
+    edge_labels = f"{prefix}_edge_labels.txt"
+    edge_min = edge_classes = None
+    if os.path.exists(edge_labels):
+        lo = hi = None
+        for chunk in _chunks(edge_labels, chunksize):
+            lo = chunk.min(axis=0) if lo is None else np.minimum(lo, chunk.min(axis=0))
+            hi = chunk.max(axis=0) if hi is None else np.maximum(hi, chunk.max(axis=0))
+        edge_min, edge_classes = lo, (hi - lo + 1).tolist()
+        edge_chunks = _chunks(edge_labels, chunksize)
+
+    # Edges → self-loops dropped, coalesced, local ids, grouped by graph
+    edge_counts = np.zeros(node_counts.size, dtype=np.int64)
+    num_edges = 0
+    with open(os.path.join(tmp, "edges.bin"), "wb") as f, \
+            open(os.path.join(tmp, "edge_attr.bin"), "wb") as fa:
+
+        def emit(rows):
+            nonlocal edge_counts, num_edges
+            rows = rows[rows[:, 0] != rows[:, 1]]
+            if not rows.size:
+                return
+            key, inverse = np.unique(rows[:, 0] * num_nodes + rows[:, 1], return_inverse=True)
+            u, v = key // num_nodes, key % num_nodes
+            graph = np.searchsorted(node_ptr, u, side="right") - 1
+            edge_counts = _add_counts(edge_counts, graph)
+            local = np.stack([u, v], axis=1) - node_ptr[graph][:, None]
+            f.write(local.astype(np.int32).tobytes())
+            num_edges += local.shape[0]
+
+            if edge_classes is not None:
+                onehot = np.concatenate([
+                    np.eye(k, dtype=np.float32)[rows[:, 2 + c] - edge_min[c]]
+                    for c, k in enumerate(edge_classes)
+                ], axis=1)
+                # coalesce() sums the attributes of duplicate edges
+                attr = np.zeros((key.size, onehot.shape[1]), dtype=np.float32)
+                np.add.at(attr, inverse, onehot)
+                fa.write(attr.tobytes())
+
+        # The last graph of a chunk may continue in the next one
+        carry = None
+        last = 0
+        for chunk in _chunks(f"{prefix}_A.txt", chunksize):
+            chunk = chunk - 1
+            if edge_classes is not None:
+                chunk = np.concatenate([chunk, next(edge_chunks)], axis=1)
+            rows = chunk if carry is None else np.concatenate([carry, chunk])
+            graph = np.searchsorted(node_ptr, rows[:, 0], side="right") - 1
+            if graph[0] < last or (np.diff(graph) < 0).any():
+                raise ValueError(f"{name}: edges in _A.txt are not grouped by graph")
+            last = graph[-1]
+            cut = np.searchsorted(graph, last)
+            emit(rows[:cut])
+            carry = rows[cut:]
+        if carry is not None:
+            emit(carry)
+
+    np.save(os.path.join(tmp, "node_ptr.npy"), node_ptr)
+    np.save(os.path.join(tmp, "edge_ptr.npy"), counts_to_ptr(torch.from_numpy(edge_counts)).numpy())
+    np.save(os.path.join(tmp, "y.npy"), y.astype(np.int64))
+
+    meta = {
+        "version": INDEX_VERSION,
+        "fingerprint": topo_cache.raw_fingerprint(root, name),
+        "num_graphs": int(node_counts.size),
+        "num_nodes": num_nodes,
+        "num_edges": int(num_edges),
+        "num_classes": int(classes.size),
+        "label_min": None if label_min is None else label_min.tolist(),
+        "label_classes": None if label_min is None else (label_max - label_min + 1).tolist(),
+        "edge_attr_dim": 0 if edge_classes is None else sum(edge_classes),
+    }
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(target, ignore_errors=True)
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # Another process finished the same index first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+class TUIndex:
+    """Memory-mapped packed index of a TU dataset; rebuilt when the raw files change."""
+
+    def __init__(self, root, name):
+        directory = index_dir(root, name)
+        meta = self._meta(directory)
+        if (meta is None or meta.get("version") != INDEX_VERSION
+                or meta["fingerprint"] != topo_cache.raw_fingerprint(root, name)):
+            build_index(root, name)
+            meta = self._meta(directory)
+        self.meta = meta
+
+        self.node_ptr = np.load(os.path.join(directory, "node_ptr.npy"), mmap_mode="r")
+        self.edge_ptr = np.load(os.path.join(directory, "edge_ptr.npy"), mmap_mode="r")
+        self.y = np.load(os.path.join(directory, "y.npy"), mmap_mode="r")
+        # np.memmap refuses empty files
+        self.edges = np.zeros((0, 2), dtype=np.int32)
+        if meta["num_edges"]:
+            self.edges = np.memmap(os.path.join(directory, "edges.bin"), dtype=np.int32,
+                                   mode="r", shape=(meta["num_edges"], 2))
+
+        self.edge_attr = None
+        if meta["edge_attr_dim"] and meta["num_edges"]:
+            self.edge_attr = np.memmap(os.path.join(directory, "edge_attr.bin"), dtype=np.float32,
+                                       mode="r", shape=(meta["num_edges"], meta["edge_attr_dim"]))
+
+        self.labels = None
+        if meta["label_min"] is not None:
+            self.label_min = np.array(meta["label_min"], dtype=np.int64)
+            self.label_classes = meta["label_classes"]
+            self.labels = np.memmap(os.path.join(directory, "node_labels.bin"), dtype=np.int64,
+                                    mode="r", shape=(meta["num_nodes"], len(self.label_classes)))
+
+    @staticmethod
+    def _meta(directory):
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __len__(self):
+        return self.meta["num_graphs"]
+
+    @property
+    def num_label_features(self):
+        return 0 if self.labels is None else sum(self.label_classes)
+
+    def node_labels(self, n0, n1):
+        """One-hot node labels of rows ``n0:n1`` (TUDataset's ``x``), or None."""
+        if self.labels is None:
+            return None
+        labels = torch.from_numpy(self.labels[n0:n1] - self.label_min)
+        return torch.cat([
+            torch.nn.functional.one_hot(labels[:, c], k).float()
+            for c, k in enumerate(self.label_classes)
+        ], dim=1)
+
+    def block(self, start, stop):
+        """Graphs ``start:stop`` as (global edge_index, node_ptr, edge_ptr), offsets from 0."""
+        node_ptr = torch.from_numpy(self.node_ptr[start:stop + 1] - self.node_ptr[start])
+        edge_ptr = torch.from_numpy(self.edge_ptr[start:stop + 1] - self.edge_ptr[start])
+        e0, e1 = int(self.edge_ptr[start]), int(self.edge_ptr[stop])
+        local = torch.from_numpy(self.edges[e0:e1].T.astype(np.int64))
+        graph_of_edge = torch.repeat_interleave(torch.arange(stop - start), edge_ptr.diff())
+        return local + node_ptr[graph_of_edge], node_ptr, edge_ptr
+
+
+# ----------------------------
+# Shared shard machinery
+# ----------------------------
+class _ShardedSource:
+
+    def __init__(self, name="MUTAG", topo_config="none", mode="ideal", noise_std=0.05,
+                 feature_shift=0.3, backend="tensor", cache=True, root="../data/TUDataset",
+                 num_workers=0, feature_params=None, seed=0, shard_size=1024):
+        if mode not in ("ideal", "perturbed"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.name = name
+        self.root = root
+        self.mode = mode
+        self.noise_std = noise_std
+        self.feature_shift = feature_shift
+        self.seed = seed
+        self.backend = backend
+        self.num_workers = num_workers
+        self.feature_params = feature_params
+        self.shard_size = shard_size
+
+        self.index = TUIndex(root, name)
+        self.features_list = FEATURE_MAP[topo_config]
+
+        # Full packed entry if an eager run already computed it; else per-shard files
+        self._packed = None
+        self._shard_dir = None
+        if self.features_list and cache:
+            cached = topo_cache.load(root, name, self.features_list, feature_params, backend)
+            if cached is not None:
+                self._packed = cached[0]
+            else:
+                self._shard_dir = topo_cache.shard_dir(root, name, self.features_list,
+                                                       feature_params, backend)
+
+    @property
+    def num_shards(self):
+        return -(-len(self.index) // self.shard_size)
+
+    def _topo(self, start, stop):
+        n0, n1 = int(self.index.node_ptr[start]), int(self.index.node_ptr[stop])
+        if self._packed is not None:
+            return self._packed[n0:n1].clone()
+        if self._shard_dir is not None:
+            features = topo_cache.load_shard(self._shard_dir, start)
+            if features is not None and features.size(0) == n1 - n0:
+                return features
+
+        features = compute_features(*self.index.block(start, stop), self.features_list,
+                                    self.backend, self.num_workers, self.feature_params)
+        if self._shard_dir is not None:
+            topo_cache.store_shard(self._shard_dir, start, features)
+        return features
+
+    def _shard_x(self, shard):
+        """Feature matrix of every node in ``shard``, as TopologicalDataset would hold it."""
+        start = shard * self.shard_size
+        stop = min(start + self.shard_size, len(self.index))
+        n0, n1 = int(self.index.node_ptr[start]), int(self.index.node_ptr[stop])
+
+        x = self.index.node_labels(n0, n1)
+        if self.features_list:
+            topo = self._topo(start, stop)
+            x = topo if x is None else torch.cat([x, topo], dim=1)
+
+        if self.mode == "perturbed":
+            node_ptr = torch.from_numpy(self.index.node_ptr[start:stop + 1] - n0)
+            x = perturb_features(x, node_ptr, torch.arange(start, stop),
+                                 self.feature_shift, self.noise_std, self.seed)
+        return x
+
+    def _item(self, idx, shard_x):
+        start = (idx // self.shard_size) * self.shard_size
+        base = int(self.index.node_ptr[start])
+        n0, n1 = int(self.index.node_ptr[idx]), int(self.index.node_ptr[idx + 1])
+        e0, e1 = int(self.index.edge_ptr[idx]), int(self.index.edge_ptr[idx + 1])
+
+        data = Data(
+            x=None if shard_x is None else shard_x[n0 - base:n1 - base],
+            edge_index=torch.from_numpy(
+                np.ascontiguousarray(self.index.edges[e0:e1].T, dtype=np.int64)
+            ),
+            y=torch.from_numpy(self.index.y[idx:idx + 1].copy()),
+            # Not "graph_index": PyG offsets any *index* attribute when batching
+            graph_id=torch.tensor([idx]),
+            num_nodes=n1 - n0,
+        )
+        if self.index.edge_attr is not None:
+            data.edge_attr = torch.from_numpy(self.index.edge_attr[e0:e1].copy())
+        return data
+
+    @property
+    def num_features(self):
+        return self.index.num_label_features + len(self.features_list)
+
+    @property
+    def num_classes(self):
+        return self.index.meta["num_classes"]
+
+
+# ----------------------------
+# Map-style, LRU-cached
+# ----------------------------
+class ShardCache:
+    """LRU of shard tensors, evicting least recently used ones beyond ``max_bytes``."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, compute):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+        self.misses += 1
+        value = compute(key)
+        size = 0 if value is None else value.numel() * value.element_size()
+        self._entries[key] = (value, size)
+        self.bytes += size
+        # Always keep the entry just computed
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+
+class LazyTopologicalDataset(_ShardedSource):
+    """
+    Drop-in for TopologicalDataset items, with features computed on first
+    access. Memory is bounded by ``cache_mb`` (per DataLoader worker process)
+    plus the OS page cache of the memory-mapped index.
+    """
+
+    def __init__(self, *args, cache_mb=256, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shards = ShardCache(cache_mb << 20)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, idx):
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self._item(idx, self.shards.get(idx // self.shard_size, self._shard_x))
+
+
+# ----------------------------
+# Streaming
+# ----------------------------
+class StreamingTopologicalDataset(_ShardedSource, IterableDataset):
+    """
+    Yields the graphs of ``indices`` (default: all) shard by shard. With
+    shuffle=True shard order and the order inside each shard are permuted per
+    epoch (seeded by ``shuffle_seed`` and ``set_epoch``). DataLoader workers
+    take disjoint shards, so every graph is yielded once per epoch.
+    """
+
+    def __init__(self, *args, indices=None, shuffle=False, shuffle_seed=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.indices = None if indices is None else np.unique(np.asarray(indices, dtype=np.int64))
+        self.shuffle = shuffle
+        self.shuffle_seed = shuffle_seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.index) if self.indices is None else self.indices.size
+
+    def _shard_members(self, shard):
+        start = shard * self.shard_size
+        stop = min(start + self.shard_size, len(self.index))
+        if self.indices is None:
+            return np.arange(start, stop)
+        lo, hi = np.searchsorted(self.indices, [start, stop])
+        return self.indices[lo:hi]
+
+    def __iter__(self):
+        if self.indices is None:
+            shards = np.arange(self.num_shards)
+        else:
+            shards = np.unique(self.indices // self.shard_size)
+
+        rng = np.random.default_rng([self.shuffle_seed, self.epoch])
+        if self.shuffle:
+            shards = rng.permutation(shards)
+
+        worker = get_worker_info()
+        if worker is not None:
+            shards = shards[worker.id::worker.num_workers]
+
+        for shard in shards.tolist():
+            members = self._shard_members(shard)
+            if self.shuffle:
+                members = rng.permutation(members)
+            shard_x = self._shard_x(shard)
+            for idx in members.tolist():
+                yield self._item(idx, shard_x)
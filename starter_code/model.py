@@ -3,38 +3,59 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch_geometric.nn import GINConv, global_mean_pool
 
-class GINModel(nn.Module):
-    def __init__(self, input_dim, hidden_dim=32, output_dim=2):
-        super().__init__()
 
-        self.conv1 = GINConv(
-            nn.Sequential(
-                nn.Linear(input_dim, hidden_dim),
-                nn.ReLU(),
-                nn.Linear(hidden_dim, hidden_dim)
-            )
+def adjacency(data):
+    """The batch's CSR ``adj_t`` when the dataset built one (csr=True), else ``edge_index``."""
+    adj_t = getattr(data, "adj_t", None)
+    return data.edge_index if adj_t is None else adj_t
+
+
+def _gin_layer(in_dim, hidden_dim):
+    return GINConv(
+        nn.Sequential(
+            nn.Linear(in_dim, hidden_dim),
+            nn.ReLU(),
+            nn.Linear(hidden_dim, hidden_dim)
         )
+    )
 
-        self.conv2 = GINConv(
-            nn.Sequential(
-                nn.Linear(hidden_dim, hidden_dim),
-                nn.ReLU(),
-                nn.Linear(hidden_dim, hidden_dim)
-            )
+
+class GINModel(nn.Module):
+    def __init__(self, input_dim, hidden_dim=32, output_dim=2, num_layers=2, dropout=0.5):
+        super().__init__()
+        if num_layers < 2:
+            raise ValueError("GINModel needs num_layers >= 2")
+        # Constructor arguments, stored with checkpoints
+        self.config = {"input_dim": input_dim, "hidden_dim": hidden_dim, "output_dim": output_dim,
+                       "num_layers": num_layers, "dropout": dropout}
+
+        self.conv1 = _gin_layer(input_dim, hidden_dim)
+        self.conv2 = _gin_layer(hidden_dim, hidden_dim)
+        # Layers past the second; empty at the default depth, so state_dict
+        # keys (and checkpoints) of 2-layer models are unchanged
+        self.extra_convs = nn.ModuleList(
+            _gin_layer(hidden_dim, hidden_dim) for _ in range(num_layers - 2)
         )
 
         self.lin = nn.Sequential(
             nn.Linear(hidden_dim, hidden_dim),
             nn.ReLU(),
-            nn.Dropout(0.5),
+            nn.Dropout(dropout),
             nn.Linear(hidden_dim, output_dim)
         )
 
+    # Data/Batch objects are opaque to TorchScript; scripted callers use classify()
+    @torch.jit.unused
     def forward(self, data):
-        x, edge_index, batch = data.x, data.edge_index, data.batch
+        return self.classify(data.x, adjacency(data), data.batch, data.num_graphs)
+
+    def classify(self, x, edge_index, batch, num_graphs: int):
+        # edge_index: COO [2, E], or a sparse CSR adj_t (aggregation by spmm)
         x = self.conv1(x, edge_index)
         x = self.conv2(x, edge_index)
-        x = global_mean_pool(x, batch)
+        for conv in self.extra_convs:
+            x = conv(x, edge_index)
+        x = global_mean_pool(x, batch, num_graphs)
         x = self.lin(x)
         return F.log_softmax(x, dim=1)
 
@@ -0,0 +1,43 @@
+import torch
+
+
+# ----------------------------
+# Loader over a packed TopologicalDataset split
+#
+# Drop-in for torch_geometric's DataLoader when the split is already packed
+# (see TopologicalDataset.index_select). Nothing is re-collated from Data
+# objects: each batch is one vectorized gather of a graph-index slice from
+# the packed tensors. Unshuffled batches are built once and reused on every
+# pass; batch_size=None serves the whole split as a single cached Batch.
+# ----------------------------
+class PackedLoader:
+
+    def __init__(self, dataset, batch_size=32, shuffle=False, generator=None):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.generator = generator
+
+        self._cached = None
+        if self.batch_size is None or not self.shuffle:
+            order = torch.arange(len(dataset))
+            self._cached = [dataset.collate(chunk) for chunk in self._chunks(order)]
+
+    def _chunks(self, order):
+        if self.batch_size is None or self.batch_size >= len(order):
+            return [order]
+        return list(order.split(self.batch_size))
+
+    def __len__(self):
+        if self.batch_size is None:
+            return 1
+        return -(-len(self.dataset) // self.batch_size)
+
+    def __iter__(self):
+        if self._cached is not None:
+            yield from self._cached
+            return
+
+        order = torch.randperm(len(self.dataset), generator=self.generator)
+        for chunk in self._chunks(order):
+            yield self.dataset.collate(chunk)
@@ -0,0 +1,122 @@
+import numpy as np
+import torch
+
+# ----------------------------
+# Counter-based Gaussian noise
+#
+# Every noise value is a pure function of (seed, graph_index, node, column):
+# a SplitMix64 hash of those coordinates feeds a Box-Muller transform. The
+# perturbed features of a graph are therefore identical whether it is
+# perturbed alone, inside any batch, in any order or in any worker process.
+# ----------------------------
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _splitmix64(z):
+    with np.errstate(over="ignore"):
+        z = z + _GOLDEN_GAMMA
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _unit(z):
+    """Top 53 bits of a uint64 as a float in [0, 1)."""
+    return (z >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def counter_normal(seed, graph_index, local_index, num_cols):
+    """
+    Standard normal ``[num_rows, num_cols]`` float64 array where row ``i``
+    belongs to node ``local_index[i]`` of graph ``graph_index[i]``.
+    """
+    graph_index = np.asarray(graph_index, dtype=np.uint64)
+    local_index = np.asarray(local_index, dtype=np.uint64)
+
+    key = _splitmix64(_splitmix64(np.uint64(seed)) ^ graph_index)
+    counter = local_index[:, None] * np.uint64(num_cols) + np.arange(num_cols, dtype=np.uint64)
+
+    with np.errstate(over="ignore"):
+        base = key[:, None] + counter * np.uint64(2) * _GOLDEN_GAMMA
+        u1 = 1.0 - _unit(_splitmix64(base))
+        u2 = _unit(_splitmix64(base + _GOLDEN_GAMMA))
+
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+def counter_uniform(seed, graph_index, stream, counter):
+    """
+    Uniform ``[0, 1)`` float64 array, value ``i`` keyed on (seed,
+    ``graph_index[i]``, ``stream``, ``counter[i]``); streams are independent.
+    """
+    graph_index = np.asarray(graph_index, dtype=np.uint64)
+    counter = np.asarray(counter, dtype=np.uint64)
+
+    key = _splitmix64(_splitmix64(np.uint64(seed)) ^ graph_index)
+    key = _splitmix64(key ^ _splitmix64(np.uint64(stream) + np.uint64(1)))
+    with np.errstate(over="ignore"):
+        return _unit(_splitmix64(key + counter * _GOLDEN_GAMMA))
+
+
+# ----------------------------
+# Perturbation stage
+# ----------------------------
+def perturb_features(x, node_ptr, graph_index, feature_shift, noise_std, seed=0):
+    """
+    Apply distribution shift + Gaussian noise to a packed feature matrix.
+
+    ``x`` holds the nodes of ``len(graph_index)`` graphs back to back, graph
+    ``i`` owning rows ``node_ptr[i]:node_ptr[i + 1]`` and being identified by
+    ``graph_index[i]`` for seeding. Returns a new tensor.
+    """
+    if x is None:
+        return x
+
+    counts = node_ptr.diff()
+    graph_of_node = torch.repeat_interleave(torch.as_tensor(graph_index), counts)
+    local_index = torch.arange(x.size(0)) - torch.repeat_interleave(node_ptr[:-1], counts)
+
+    noise = counter_normal(seed, graph_of_node.numpy(), local_index.numpy(), x.size(1))
+    return x + feature_shift + torch.from_numpy(noise).to(x.dtype) * noise_std
+
+
+def perturb_batch(batch, feature_shift, noise_std, seed=0):
+    """
+    Perturb a collated ``Batch`` in one pass. Needs ``batch.graph_id``
+    (set on every ``TopologicalDataset`` item and ``collate`` batch) to key
+    the noise per graph.
+    """
+    batch = batch.clone()
+    batch.x = perturb_features(
+        batch.x, batch.ptr, batch.graph_id, feature_shift, noise_std, seed
+    )
+    return batch
+
+
+# ----------------------------
+# Frozen snapshots
+# ----------------------------
+def save_snapshot(path, x, node_ptr, graph_index, feature_shift, noise_std, seed):
+    torch.save({
+        "x": x.contiguous(),
+        "node_ptr": node_ptr,
+        "graph_index": graph_index,
+        "feature_shift": feature_shift,
+        "noise_std": noise_std,
+        "seed": seed,
+    }, path)
+
+
+def load_snapshot(path, node_ptr, graph_index, feature_shift, noise_std, seed):
+    """Perturbed features from ``path``; checks they belong to the same graphs and noise setting."""
+    snapshot = torch.load(path, weights_only=True)
+    if not (torch.equal(snapshot["node_ptr"], node_ptr)
+            and torch.equal(snapshot["graph_index"], graph_index)):
+        raise ValueError(f"Snapshot {path} does not match this dataset's graphs")
+    stored = (snapshot["feature_shift"], snapshot["noise_std"], snapshot["seed"])
+    if stored != (feature_shift, noise_std, seed):
+        raise ValueError(
+            f"Snapshot {path} was written with (feature_shift, noise_std, seed)={stored}, "
+            f"not {(feature_shift, noise_std, seed)}"
+        )
+    return snapshot
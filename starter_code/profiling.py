@@ -0,0 +1,242 @@
+import contextlib
+import json
+import sys
+import time
+from collections import defaultdict
+
+import torch
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# ----------------------------
+# Training / evaluation instrumentation
+#
+# Profiler times named phases (precompute, indexing, collate, forward,
+# backward, step, predict), counts the graphs and nodes that went through
+# them and appends one JSON line per epoch / top-level phase to a trace
+# file, with peak RSS and tensor memory at that point. With
+# torch_trace_dir set it also drives torch.profiler and labels every phase
+# with record_function, so the phases show up in the TensorBoard trace.
+#
+# Code paths take ``profiler=None`` and fall back to NULL_PROFILER, whose
+# methods do nothing, so instrumentation costs nothing when switched off.
+# ----------------------------
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def tensor_bytes(obj):
+    """Bytes held by the tensors of a Data/Batch, module or optimizer."""
+    if isinstance(obj, torch.Tensor):
+        if obj.layout == torch.sparse_csr:
+            return sum(tensor_bytes(t) for t in (obj.crow_indices(), obj.col_indices(), obj.values()))
+        return obj.numel() * obj.element_size()
+    if isinstance(obj, torch.nn.Module):
+        return sum(
+            tensor_bytes(p) + (0 if p.grad is None else tensor_bytes(p.grad))
+            for p in obj.parameters()
+        ) + sum(tensor_bytes(b) for b in obj.buffers())
+    if isinstance(obj, torch.optim.Optimizer):
+        return sum(
+            tensor_bytes(v) for state in obj.state.values()
+            for v in state.values() if isinstance(v, torch.Tensor)
+        )
+    if hasattr(obj, "stores"):
+        return sum(
+            tensor_bytes(v) for store in obj.stores
+            for v in store.values() if isinstance(v, torch.Tensor)
+        )
+    return 0
+
+
+class Profiler:
+
+    enabled = True
+
+    def __init__(self, trace_path=None, torch_trace_dir=None, **context):
+        self.context = context
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.graphs = defaultdict(int)
+        self.nodes = defaultdict(int)
+        self.peak_batch_bytes = 0
+        self._window = defaultdict(float)
+        self._window_graphs = 0
+        self._window_nodes = 0
+        self._window_start = time.perf_counter()
+        self._watched = []
+
+        self._trace = open(trace_path, "a") if trace_path else None
+
+        self._torch = None
+        if torch_trace_dir:
+            self._torch = torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU],
+                schedule=torch.profiler.schedule(wait=1, warmup=1, active=5, repeat=1),
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(torch_trace_dir),
+                record_shapes=True,
+                profile_memory=True,
+            )
+            self._torch.start()
+
+    # ----------------------------
+    # Phases
+    # ----------------------------
+    @contextlib.contextmanager
+    def phase(self, name, trace=False):
+        """
+        Time the enclosed block as ``name``. Yields a dict whose "graphs" /
+        "nodes" entries the block can increment for throughput. With
+        trace=True the phase is written to the trace as its own event.
+        """
+        counts = {"graphs": 0, "nodes": 0}
+        label = torch.profiler.record_function(name) if self._torch else contextlib.nullcontext()
+        start = time.perf_counter()
+        with label:
+            yield counts
+        elapsed = time.perf_counter() - start
+
+        self.totals[name] += elapsed
+        self.calls[name] += 1
+        self.graphs[name] += counts["graphs"]
+        self.nodes[name] += counts["nodes"]
+        self._window[name] += elapsed
+
+        if trace:
+            self.emit("phase", name=name, seconds=elapsed, **self._rates(elapsed, **counts))
+
+    def batches(self, loader):
+        """Iterate ``loader``, timing every batch fetch as "collate"."""
+        iterator = iter(loader)
+        while True:
+            start = time.perf_counter()
+            try:
+                data = next(iterator)
+            except StopIteration:
+                return
+            elapsed = time.perf_counter() - start
+            self.totals["collate"] += elapsed
+            self.calls["collate"] += 1
+            self._window["collate"] += elapsed
+            yield data
+
+    def batch_done(self, data):
+        """Count a training batch and advance torch.profiler's schedule."""
+        self._window_graphs += data.num_graphs
+        self._window_nodes += data.num_nodes
+        self.peak_batch_bytes = max(self.peak_batch_bytes, tensor_bytes(data))
+        if self._torch is not None:
+            self._torch.step()
+
+    def watch(self, *objs):
+        """Modules/optimizers whose tensor memory is reported with every event."""
+        self._watched.extend(objs)
+
+    # ----------------------------
+    # Trace
+    # ----------------------------
+    def _rates(self, seconds, graphs=0, nodes=0):
+        if not seconds or not graphs:
+            return {}
+        return {"graphs_per_s": graphs / seconds, "nodes_per_s": nodes / seconds}
+
+    def memory(self):
+        out = {
+            "peak_rss_mb": peak_rss_mb(),
+            "model_mb": sum(tensor_bytes(o) for o in self._watched) / (1 << 20),
+            "peak_batch_mb": self.peak_batch_bytes / (1 << 20),
+        }
+        if torch.cuda.is_available():
+            out["cuda_peak_mb"] = torch.cuda.max_memory_allocated() / (1 << 20)
+        return out
+
+    def emit(self, event, **fields):
+        if self._trace is None:
+            return
+        entry = {"event": event, "time": time.time(), **self.context, **fields, **self.memory()}
+        self._trace.write(json.dumps(entry) + "\n")
+        self._trace.flush()
+
+    def epoch_done(self, epoch, loss):
+        seconds = time.perf_counter() - self._window_start
+        self.emit(
+            "epoch",
+            epoch=epoch,
+            loss=loss,
+            seconds=seconds,
+            phases=dict(self._window),
+            **self._rates(seconds, self._window_graphs, self._window_nodes),
+        )
+        self._window = defaultdict(float)
+        self._window_graphs = 0
+        self._window_nodes = 0
+        self._window_start = time.perf_counter()
+
+    def summary(self):
+        phases = {}
+        for name in self.totals:
+            phases[name] = {
+                "calls": self.calls[name],
+                "total_s": self.totals[name],
+                **self._rates(self.totals[name], self.graphs[name], self.nodes[name]),
+            }
+        return {"phases": phases, **self.memory()}
+
+    def report(self):
+        # Phases may nest (predict includes its collate), so no shares
+        summary = self.summary()
+        print(f"{'phase':<12} {'calls':>7} {'total s':>10} {'graphs/s':>10}")
+        for name, p in sorted(summary["phases"].items(), key=lambda kv: -kv[1]["total_s"]):
+            rate = f"{p['graphs_per_s']:.0f}" if "graphs_per_s" in p else "-"
+            print(f"{name:<12} {p['calls']:>7} {p['total_s']:>10.4f} {rate:>10}")
+        print(f"peak RSS {summary['peak_rss_mb'] or 0:.1f} MB | model {summary['model_mb']:.2f} MB "
+              f"| largest batch {summary['peak_batch_mb']:.2f} MB")
+
+    def close(self):
+        if self._torch is not None:
+            self._torch.stop()
+            self._torch = None
+        self.emit("summary", phases=self.summary()["phases"])
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NullProfiler:
+
+    enabled = False
+
+    def phase(self, name, trace=False):
+        return contextlib.nullcontext({"graphs": 0, "nodes": 0})
+
+    def batches(self, loader):
+        return iter(loader)
+
+    def batch_done(self, data):
+        pass
+
+    def watch(self, *objs):
+        pass
+
+    def emit(self, event, **fields):
+        pass
+
+    def epoch_done(self, epoch, loss):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
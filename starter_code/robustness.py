@@ -0,0 +1,255 @@
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from torch_geometric.data import Batch
+
+from baseline import REPO_ROOT, TU_ROOT, load_splits, make_loader, train_model
+from dataset import TopologicalDataset
+from model import GINModel
+from perturbation import counter_normal
+from profiling import NULL_PROFILER
+
+# ----------------------------
+# Robustness curves over a (feature_shift, noise_std) grid
+#
+# The test split is collated once. Every grid cell x replicate is a copy of
+# that batch whose features are x + shift + std * noise_r, and many copies
+# are joined into one disjoint-union batch (edge_index / batch offset per
+# copy), so the whole grid costs a handful of forward passes of the
+# unmodified model. Replicate r draws its noise with seed + r through the
+# same counter-based generator as perturb_features: replicate 0 of the cell
+# (0.3, 0.05) is exactly the perturbed set baseline.py and sweep.py score.
+# ----------------------------
+RESULTS_FILE = os.path.join(REPO_ROOT, "results", "robustness.csv")
+
+# Nodes per forward pass; bounds activation memory of the stacked batch
+MAX_PASS_NODES = 1 << 20
+
+COLUMNS = [
+    "topo_config",
+    "seed",
+    "noise_std",
+    "feature_shift",
+    "replicate",
+    "f1_ideal",
+    "f1_perturbed",
+    "robustness_gap",
+]
+
+
+def replicate_noise(dataset, seeds):
+    """``[R, num_nodes, num_features]`` standard normal noise, one slab per seed."""
+    counts = dataset.node_ptr.diff()
+    graph_of_node = torch.repeat_interleave(dataset.graph_index, counts).numpy()
+    local_index = (
+        torch.arange(dataset.x.size(0)) - torch.repeat_interleave(dataset.node_ptr[:-1], counts)
+    ).numpy()
+    return torch.stack([
+        torch.from_numpy(
+            counter_normal(s, graph_of_node, local_index, dataset.x.size(1))
+        ).to(dataset.x.dtype)
+        for s in seeds
+    ])
+
+
+def stack_batch(base, xs):
+    """``len(xs)`` copies of ``base`` as one Batch, copy ``v`` carrying features ``xs[v]``."""
+    copies = len(xs)
+    offsets = torch.arange(copies)
+    edge_index = base.edge_index.unsqueeze(0) + (offsets * base.num_nodes).view(-1, 1, 1)
+    batch = base.batch.unsqueeze(0) + (offsets * base.num_graphs).view(-1, 1)
+    return Batch(
+        x=torch.cat(xs),
+        edge_index=edge_index.transpose(0, 1).reshape(2, -1),
+        batch=batch.flatten(),
+    )
+
+
+def macro_f1(y_true, preds):
+    """sklearn's macro F1 of every row of ``preds`` ``[V, G]`` against ``y_true`` ``[G]``."""
+    rows, graphs = preds.shape
+    k = int(max(y_true.max(), preds.max())) + 1
+    flat = (torch.arange(rows).view(-1, 1) * k + y_true) * k + preds
+    cells = torch.bincount(flat.flatten(), minlength=rows * k * k).view(rows, k, k).double()
+
+    tp = cells.diagonal(dim1=1, dim2=2)
+    denom = cells.sum(dim=2) + cells.sum(dim=1)
+    # sklearn averages over the labels present in y_true or y_pred
+    present = denom > 0
+    f1 = 2 * tp / denom.clamp(min=1)
+    return (f1 * present).sum(dim=1) / present.sum(dim=1)
+
+
+def robustness_surface(model, dataset, feature_shifts, noise_stds, replicates=4, seed=0,
+                       max_nodes=MAX_PASS_NODES, profiler=None):
+    """
+    F1 of ``model`` on every (feature_shift, noise_std, replicate) variant of
+    the ideal packed split ``dataset``. Returns one row per variant with the
+    clean-data F1 alongside, like the sweep results.
+    """
+    if dataset.mode != "ideal":
+        raise ValueError("robustness_surface() expects an ideal dataset")
+    profiler = profiler or NULL_PROFILER
+    model.eval()
+
+    base = dataset.collate(torch.arange(len(dataset)))
+    noise = replicate_noise(dataset, [seed + r for r in range(replicates)])
+
+    # Clean copy first, then every grid cell x replicate
+    variants = [(None, None, None)] + [
+        (float(s), float(n), r)
+        for s, n, r in itertools.product(feature_shifts, noise_stds, range(replicates))
+    ]
+    per_pass = max(1, max_nodes // max(1, base.num_nodes))
+
+    preds = []
+    with torch.no_grad(), profiler.phase("robustness", trace=True) as counts:
+        for start in range(0, len(variants), per_pass):
+            chunk = variants[start:start + per_pass]
+            xs = [
+                base.x if r is None else base.x + shift + noise[r] * std
+                for shift, std, r in chunk
+            ]
+            out = model(stack_batch(base, xs))
+            preds.append(out.argmax(dim=1).view(len(chunk), base.num_graphs))
+            counts["graphs"] += len(chunk) * base.num_graphs
+            counts["nodes"] += len(chunk) * base.num_nodes
+
+    f1 = macro_f1(base.y, torch.cat(preds)).tolist()
+    f1_ideal = f1[0]
+    return pd.DataFrame([
+        {
+            "noise_std": std,
+            "feature_shift": shift,
+            "replicate": r,
+            "f1_ideal": f1_ideal,
+            "f1_perturbed": score,
+            "robustness_gap": f1_ideal - score,
+        }
+        for (shift, std, r), score in zip(variants[1:], f1[1:])
+    ])
+
+
+# ----------------------------
+# Surface and area under the robustness curve
+# ----------------------------
+def surface(results):
+    """Mean F1 over replicates as a noise_std x feature_shift table."""
+    return results.pivot_table(
+        index="noise_std", columns="feature_shift", values="f1_perturbed", aggfunc="mean"
+    )
+
+
+# np.trapezoid is numpy >= 2.0; older releases only have np.trapz
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+def _normalised_area(values, coords, axis):
+    # Trapezoid mean over one grid axis; a single grid value is taken as is
+    if len(coords) < 2:
+        return values.take(0, axis=axis)
+    coords = np.asarray(coords, dtype=np.float64)
+    return _trapezoid(values, coords, axis=axis) / (coords[-1] - coords[0])
+
+
+def area_under_curve(results):
+    """
+    Normalised area under the robustness surface (trapezoid mean of F1 over
+    the shift and std ranges; 1.0 = perfect everywhere), as mean and std over
+    replicates, and relative to the clean F1.
+    """
+    cube = results.pivot_table(
+        index=["replicate", "noise_std"], columns="feature_shift", values="f1_perturbed"
+    )
+    stds = cube.index.get_level_values("noise_std").unique().sort_values()
+    values = cube.to_numpy().reshape(-1, len(stds), cube.shape[1])
+
+    area = _normalised_area(values, cube.columns, axis=2)
+    area = _normalised_area(area, stds, axis=1)
+
+    f1_ideal = float(results.f1_ideal.iloc[0])
+    return {
+        "f1_ideal": f1_ideal,
+        "aurc": float(area.mean()),
+        "aurc_std": float(area.std(ddof=1)) if area.size > 1 else 0.0,
+        "aurc_relative": float(area.mean()) / f1_ideal if f1_ideal else float("nan"),
+    }
+
+
+# ----------------------------
+# Curves per topo_config
+# ----------------------------
+def run_robustness(topo_configs, seeds, feature_shifts, noise_stds, replicates=4,
+                   epochs=50, lr=0.01, output=RESULTS_FILE, root=TU_ROOT):
+    train_df, test_df = load_splits("MUTAG", root)
+    frames = []
+
+    for topo_config, seed in itertools.product(topo_configs, seeds):
+        dataset = TopologicalDataset("MUTAG", topo_config=topo_config, root=root)
+        train = dataset.index_select(train_df.graph_index.values)
+        test = dataset.index_select(test_df.graph_index.values)
+
+        torch.manual_seed(seed)
+        model = GINModel(input_dim=dataset.num_features, output_dim=dataset.num_classes)
+        train_model(model, make_loader(train, shuffle=True), epochs=epochs, lr=lr, log_every=0)
+
+        start = time.perf_counter()
+        results = robustness_surface(model, test, feature_shifts, noise_stds, replicates)
+        summary = area_under_curve(results)
+        print(f"{topo_config:<14} seed={seed} ideal={summary['f1_ideal']:.4f} "
+              f"AURC={summary['aurc']:.4f}±{summary['aurc_std']:.4f} "
+              f"({len(results)} variants in {time.perf_counter() - start:.2f}s)")
+
+        results.insert(0, "seed", seed)
+        results.insert(0, "topo_config", topo_config)
+        frames.append(results)
+
+    results = pd.concat(frames, ignore_index=True)[COLUMNS]
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    results.to_csv(output, index=False)
+    return results
+
+
+def summarize(results):
+    """AURC per topo_config, averaged over seeds."""
+    rows = []
+    for (topo_config, seed), group in results.groupby(["topo_config", "seed"]):
+        rows.append({"topo_config": topo_config, "seed": seed, **area_under_curve(group)})
+    return pd.DataFrame(rows).groupby("topo_config").agg(
+        seeds=("seed", "nunique"),
+        f1_ideal=("f1_ideal", "mean"),
+        aurc=("aurc", "mean"),
+        aurc_std=("aurc_std", "mean"),
+        aurc_relative=("aurc_relative", "mean"),
+    ).reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topo-configs", nargs="+",
+                        default=["none", "degree", "local", "global", "all"])
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0])
+    parser.add_argument("--feature-shift", nargs="+", type=float,
+                        default=[0.0, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0])
+    parser.add_argument("--noise-std", nargs="+", type=float,
+                        default=[0.0, 0.05, 0.1, 0.2, 0.3, 0.5])
+    parser.add_argument("--replicates", type=int, default=8)
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--lr", type=float, default=0.01)
+    parser.add_argument("--root", type=str, default=TU_ROOT)
+    parser.add_argument("--output", type=str, default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    results = run_robustness(
+        args.topo_configs, args.seeds, sorted(args.feature_shift), sorted(args.noise_std),
+        replicates=args.replicates, epochs=args.epochs, lr=args.lr, output=args.output,
+        root=args.root,
+    )
+    print()
+    print(summarize(results).to_string(index=False))
+    print(f"\nRobustness curves → {args.output}")
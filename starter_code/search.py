@@ -0,0 +1,301 @@
+import argparse
+import csv
+import itertools
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.metrics import f1_score
+from baseline import (
+    REPO_ROOT, TU_ROOT, load_splits, make_loader, predict, train_model, validation_split
+)
+from checkpoint import save_model
+from dataset import TopologicalDataset
+from model import GINModel
+
+# ----------------------------
+# Hyperparameter search (asynchronous successive halving, ASHA)
+#
+# Trials are sampled without replacement from the grid
+#   topo_config x hidden_dim x num_layers x dropout x lr
+# and trained in rungs of growing epoch budgets (min_epochs * eta^k, the
+# last one capped at max_epochs). After every rung a trial is scored on a
+# stratified validation split carved from data/train.csv, ideal and
+# perturbed. Whenever a worker is free, a trial in the top 1/eta of its
+# rung (by perturbed F1) is promoted to the next rung; otherwise a new
+# trial starts. Weak trials are never promoted, so most of the budget goes
+# to the few that keep winning.
+#
+# Promotion continues training rather than restarting it: model, Adam and
+# RNG states (dropout and batch order) travel with the trial, so a trial
+# that reaches 45 epochs is the same model as one trained for 45 epochs in
+# one go. Test labels are never used.
+#
+# Output: one row per (trial, rung) in results/search.csv, and a ranking of
+# trials at the highest rung they reached (then perturbed F1, then
+# robustness gap).
+# ----------------------------
+RESULTS_FILE = os.path.join(REPO_ROOT, "results", "search.csv")
+
+SPACE = {
+    "topo_config": ["none", "degree", "local", "global", "all"],
+    "hidden_dim": [16, 32, 64, 128],
+    "num_layers": [2, 3, 4],
+    "dropout": [0.0, 0.25, 0.5],
+    "lr": [0.001, 0.003, 0.01, 0.03],
+}
+
+COLUMNS = [
+    "trial",
+    *SPACE,
+    "rung",
+    "epochs",
+    "f1_ideal",
+    "f1_perturbed",
+    "robustness_gap",
+    "train_seconds",
+]
+
+# Same sharing scheme as sweep.py: built in the parent, inherited by forked workers
+_DATASETS = {}
+
+
+def _dataset(topo_config, root=TU_ROOT):
+    if (root, topo_config) not in _DATASETS:
+        _DATASETS[root, topo_config] = TopologicalDataset("MUTAG", topo_config=topo_config,
+                                                          root=root)
+    return _DATASETS[root, topo_config]
+
+
+def rung_epochs(min_epochs, max_epochs, eta):
+    """Epoch budget of every rung: min_epochs * eta^k, the last one capped at max_epochs."""
+    rungs, epochs = [], min_epochs
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= eta
+    return rungs + [max_epochs]
+
+
+def sample_configs(space, num_trials, seed=0):
+    grid = list(itertools.product(*space.values()))
+    order = np.random.default_rng([seed, 3]).permutation(len(grid))[:num_trials]
+    return [dict(zip(space, grid[i])) for i in order.tolist()]
+
+
+def run_rung(trial, config, rung, epochs, state, noise_std, feature_shift, val_fraction, seed,
+             root=TU_ROOT):
+    """
+    Train trial ``trial`` up to ``epochs`` (continuing from ``state``, or
+    from scratch) and score it on the validation split. Returns
+    ``(row, state)``.
+    """
+    torch.set_num_threads(1)
+    dataset = _dataset(config["topo_config"], root)
+    train_df, val_df = validation_split(load_splits("MUTAG", root)[0], val_fraction, seed)
+    train = dataset.index_select(train_df.graph_index.values)
+    val = dataset.index_select(val_df.graph_index.values)
+
+    trial_seed = seed * 100_003 + trial
+    torch.manual_seed(trial_seed)
+    model = GINModel(
+        input_dim=dataset.num_features, hidden_dim=config["hidden_dim"],
+        output_dim=dataset.num_classes, num_layers=config["num_layers"],
+        dropout=config["dropout"],
+    )
+    optimizer = torch.optim.Adam(model.parameters(), lr=config["lr"])
+    generator = torch.Generator().manual_seed(trial_seed)
+    done, train_seconds = 0, 0.0
+    if state is not None:
+        model.load_state_dict(state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        torch.set_rng_state(state["rng"])
+        generator.set_state(state["generator"])
+        done, train_seconds = state["epochs"], state["train_seconds"]
+
+    start = time.perf_counter()
+    train_model(model, make_loader(train, shuffle=True, generator=generator),
+                epochs=epochs - done, lr=config["lr"], log_every=0, optimizer=optimizer)
+    train_seconds += time.perf_counter() - start
+
+    state = {
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "rng": torch.get_rng_state(),
+        "generator": generator.get_state(),
+        "epochs": epochs,
+        "train_seconds": train_seconds,
+    }
+
+    y_true = val.y.tolist()
+    f1_ideal = f1_score(y_true, predict(model, make_loader(val)), average="macro")
+    perturbed = val.with_perturbation(feature_shift, noise_std)
+    f1_perturbed = f1_score(y_true, predict(model, make_loader(perturbed)), average="macro")
+
+    row = {
+        "trial": trial,
+        **config,
+        "rung": rung,
+        "epochs": epochs,
+        "f1_ideal": round(float(f1_ideal), 6),
+        "f1_perturbed": round(float(f1_perturbed), 6),
+        "robustness_gap": round(float(f1_ideal - f1_perturbed), 6),
+        "train_seconds": round(train_seconds, 3),
+    }
+    return row, state
+
+
+def _score(row):
+    # Higher is better: perturbed F1, then a smaller robustness gap
+    return (row["f1_perturbed"], -row["robustness_gap"])
+
+
+class _Asha:
+    """Promotion bookkeeping: which (trial, rung) to run next."""
+
+    def __init__(self, configs, rungs, eta):
+        self.configs, self.rungs, self.eta = configs, rungs, eta
+        self.started = 0
+        self.results = [dict() for _ in rungs]      # rung → {trial: row}
+        self.promoted = [set() for _ in rungs]
+
+    def next_job(self):
+        # Prefer promotions, from the highest rung down
+        for rung in reversed(range(len(self.rungs) - 1)):
+            finished = self.results[rung]
+            top = sorted(finished, key=lambda t: _score(finished[t]), reverse=True)
+            for trial in top[:len(finished) // self.eta]:
+                if trial not in self.promoted[rung]:
+                    self.promoted[rung].add(trial)
+                    return trial, rung + 1
+        if self.started < len(self.configs):
+            self.started += 1
+            return self.started - 1, 0
+        return None
+
+    def record(self, row):
+        self.results[row["rung"]][row["trial"]] = row
+
+
+def ranking(results):
+    """Every trial at the highest rung it reached, best first."""
+    last = results.sort_values("rung").groupby("trial").tail(1)
+    return last.sort_values(
+        ["rung", "f1_perturbed", "robustness_gap"], ascending=[False, False, True]
+    ).reset_index(drop=True)
+
+
+def run_search(space=SPACE, num_trials=27, min_epochs=5, max_epochs=100, eta=3,
+               noise_std=0.05, feature_shift=0.3, val_fraction=0.2, seed=0,
+               num_workers=1, output=RESULTS_FILE, root=TU_ROOT):
+    """Run the search; returns ``(results, best_state)``, the latter of the top-ranked trial."""
+    if eta < 2 or min_epochs < 1 or max_epochs < min_epochs:
+        raise ValueError("Need eta >= 2 and 1 <= min_epochs <= max_epochs")
+    configs = sample_configs(space, num_trials, seed)
+    rungs = rung_epochs(min_epochs, max_epochs, eta)
+    asha = _Asha(configs, rungs, eta)
+    states = {}
+
+    print(f"{len(configs)} trials, rungs at {rungs} epochs, eta={eta}")
+    for topo_config in sorted({c["topo_config"] for c in configs}):
+        _dataset(topo_config, root)
+
+    def job(trial, rung):
+        return (trial, configs[trial], rung, rungs[rung], states.get(trial),
+                noise_std, feature_shift, val_fraction, seed, root)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+
+        def record(row, state):
+            asha.record(row)
+            states[row["trial"]] = state
+            writer.writerow(row)
+            f.flush()
+            print(f"trial {row['trial']:>3} rung {row['rung']} ({row['epochs']:>3} epochs) "
+                  f"{row['topo_config']:<8} h={row['hidden_dim']} L={row['num_layers']} "
+                  f"p={row['dropout']} lr={row['lr']} → ideal={row['f1_ideal']:.4f} "
+                  f"perturbed={row['f1_perturbed']:.4f}")
+
+        if num_workers <= 1:
+            while (next_job := asha.next_job()) is not None:
+                record(*run_rung(*job(*next_job)))
+        else:
+            methods = mp.get_all_start_methods()
+            context = mp.get_context("fork" if "fork" in methods else None)
+            with ProcessPoolExecutor(num_workers, mp_context=context) as pool:
+                running = set()
+                while True:
+                    while len(running) < num_workers and (next_job := asha.next_job()) is not None:
+                        running.add(pool.submit(run_rung, *job(*next_job)))
+                    if not running:
+                        break
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record(*future.result())
+
+    results = pd.read_csv(output)
+    best = int(ranking(results).trial.iloc[0])
+    return results, states[best]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topo-configs", nargs="+", default=SPACE["topo_config"])
+    parser.add_argument("--hidden-dims", nargs="+", type=int, default=SPACE["hidden_dim"])
+    parser.add_argument("--num-layers", nargs="+", type=int, default=SPACE["num_layers"])
+    parser.add_argument("--dropouts", nargs="+", type=float, default=SPACE["dropout"])
+    parser.add_argument("--lrs", nargs="+", type=float, default=SPACE["lr"])
+    parser.add_argument("--trials", type=int, default=27)
+    parser.add_argument("--min-epochs", type=int, default=5)
+    parser.add_argument("--max-epochs", type=int, default=100)
+    parser.add_argument("--eta", type=int, default=3,
+                        help="keep the top 1/eta of every rung")
+    parser.add_argument("--val-fraction", type=float, default=0.2,
+                        help="share of data/train.csv held out for validation")
+    parser.add_argument("--noise-std", type=float, default=0.05)
+    parser.add_argument("--feature-shift", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--root", type=str, default=TU_ROOT)
+    parser.add_argument("--output", type=str, default=RESULTS_FILE)
+    parser.add_argument("--save-checkpoint", type=str, default=None,
+                        help="save the top-ranked model here (see inference.py)")
+    args = parser.parse_args()
+
+    space = {
+        "topo_config": args.topo_configs,
+        "hidden_dim": args.hidden_dims,
+        "num_layers": args.num_layers,
+        "dropout": args.dropouts,
+        "lr": args.lrs,
+    }
+    results, best_state = run_search(
+        space, num_trials=args.trials, min_epochs=args.min_epochs, max_epochs=args.max_epochs,
+        eta=args.eta, noise_std=args.noise_std, feature_shift=args.feature_shift,
+        val_fraction=args.val_fraction, seed=args.seed, num_workers=args.workers,
+        output=args.output, root=args.root,
+    )
+    ranked = ranking(results)
+    print()
+    print(ranked.to_string(index=False))
+    print(f"\nResults table → {args.output}")
+
+    if args.save_checkpoint:
+        best = ranked.iloc[0]
+        dataset = _dataset(best.topo_config, args.root)
+        model = GINModel(
+            input_dim=dataset.num_features, hidden_dim=int(best.hidden_dim),
+            output_dim=dataset.num_classes, num_layers=int(best.num_layers),
+            dropout=float(best.dropout),
+        )
+        model.load_state_dict(best_state["model"])
+        save_model(args.save_checkpoint, model, dataset="MUTAG", topo_config=best.topo_config,
+                   epochs=int(best.epochs), lr=float(best.lr), seed=args.seed,
+                   search_trial=int(best.trial))
+        print(f"Saved checkpoint to: {args.save_checkpoint}")
@@ -0,0 +1,332 @@
+import numpy as np
+import torch
+
+from perturbation import counter_uniform
+from topo_features import gather_ranges
+
+# ----------------------------
+# Structural (edge-level) perturbation
+#
+# Seeded edits of each graph's undirected edges, at rates relative to its
+# edge count:
+#   edge_drop   every edge is removed with this probability
+#   rewire      every remaining edge keeps one endpoint and moves the other
+#               to a random node it is not yet linked to
+#   edge_add    about edge_add * num_edges random new edges
+# Every draw is counter-based, keyed on (seed, graph_index, edge or slot),
+# so a graph gets the same edits alone, in any subset and in any order.
+#
+# Topological features are then updated for the touched nodes only:
+#   degree      +-1 per endpoint
+#   clustering  triangles through u, v and their common neighbours
+#   core        subcore traversal (a single edge changes core numbers by at
+#               most one, only inside the subcore of its lower endpoint)
+# so an edit costs about the degrees around it, never a recompute. Other
+# features are recomputed by the caller for the touched graphs only.
+# ----------------------------
+INCREMENTAL_FEATURES = {"degree", "clustering", "core"}
+
+# Edit kinds, applied per graph in this order
+REMOVE, REWIRE, ADD = 0, 1, 2
+
+# counter_uniform streams
+_DROP, _REWIRE, _REWIRE_SIDE, _REWIRE_TARGET, _ADD_COUNT, _ADD_PAIR = range(6)
+
+
+def undirected_adjacency(edge_index, node_ptr, edge_ptr):
+    """
+    Symmetric, loop-free, deduplicated adjacency of a packed dataset (local
+    ``edge_index`` per graph) as numpy CSR ``(rowptr, col)`` in global ids.
+    """
+    num_nodes = int(node_ptr[-1])
+    graph_of_edge = torch.repeat_interleave(torch.arange(node_ptr.numel() - 1), edge_ptr.diff())
+    offset = node_ptr[graph_of_edge]
+    src, dst = (edge_index[0] + offset).numpy(), (edge_index[1] + offset).numpy()
+    key = np.sort(np.concatenate([src * num_nodes + dst, dst * num_nodes + src]))
+    key = key[np.concatenate([[True], key[1:] != key[:-1]])] if key.size else key
+    row, col = key // num_nodes, key % num_nodes
+    loop = row == col
+    row, col = row[~loop], col[~loop]
+    return np.concatenate([[0], np.cumsum(np.bincount(row, minlength=num_nodes))]), col
+
+
+def sample_edits(rowptr, col, node_ptr, graph_index, edge_drop=0.0, edge_add=0.0,
+                 rewire=0.0, seed=0):
+    """
+    Edits of a packed dataset with adjacency ``(rowptr, col)`` as an
+    ``[num_edits, 4]`` int64 array of ``(kind, a, b, c)`` in global node
+    ids, grouped by graph: ``(REMOVE, u, v, -)``, ``(REWIRE, keep, old,
+    new)``, ``(ADD, u, v, -)``. Edits that turn out invalid (self-loop,
+    existing edge) are skipped when applied.
+    """
+    node_ptr = node_ptr.numpy()
+    graph_ids = torch.as_tensor(graph_index).numpy()
+    sizes = np.diff(node_ptr)
+
+    # Undirected edges u < v, sorted, so rank is the edge's position in its graph
+    row = np.repeat(np.arange(rowptr.size - 1), np.diff(rowptr))
+    upper = row < col
+    u, v = row[upper], col[upper]
+    graph = np.searchsorted(node_ptr, u, side="right") - 1
+    edge_counts = np.bincount(graph, minlength=graph_ids.size)
+    rank = np.arange(u.size) - (np.cumsum(edge_counts) - edge_counts)[graph]
+    key = graph_ids[graph]
+
+    dropped = counter_uniform(seed, key, _DROP, rank) < edge_drop
+    rewired = ~dropped & (counter_uniform(seed, key, _REWIRE, rank) < rewire)
+
+    # Rewire: keep u or v, move the other end to a random node of the graph
+    ru, rv, rg, rk, rr = u[rewired], v[rewired], graph[rewired], key[rewired], rank[rewired]
+    flip = counter_uniform(seed, rk, _REWIRE_SIDE, rr) < 0.5
+    keep, old = np.where(flip, rv, ru), np.where(flip, ru, rv)
+    new = node_ptr[rg] + (counter_uniform(seed, rk, _REWIRE_TARGET, rr) * sizes[rg]).astype(np.int64)
+
+    # Add: stochastic rounding of edge_add * num_edges per graph
+    num_add = np.zeros(graph_ids.size, dtype=np.int64)
+    if edge_add > 0:
+        jitter = counter_uniform(seed, graph_ids, _ADD_COUNT, np.zeros(graph_ids.size))
+        num_add = np.floor(edge_add * edge_counts + jitter).astype(np.int64)
+    ag = np.repeat(np.arange(graph_ids.size), num_add)
+    aj = np.arange(ag.size) - np.repeat(np.cumsum(num_add) - num_add, num_add)
+    a, b = (
+        node_ptr[ag] + (counter_uniform(seed, graph_ids[ag], _ADD_PAIR, 2 * aj + side)
+                        * sizes[ag]).astype(np.int64)
+        for side in (0, 1)
+    )
+
+    num_drop = int(dropped.sum())
+    edits = np.stack([
+        np.repeat([REMOVE, REWIRE, ADD], [num_drop, keep.size, ag.size]),
+        np.concatenate([u[dropped], keep, a]),
+        np.concatenate([v[dropped], old, b]),
+        np.concatenate([np.full(num_drop, -1), new, np.full(ag.size, -1)]),
+    ], axis=1).astype(np.int64)
+    # Stable: kinds stay in REMOVE, REWIRE, ADD order inside each graph
+    return edits[np.argsort(np.concatenate([graph[dropped], rg, ag]), kind="stable")]
+
+
+# ----------------------------
+# Incremental degree / clustering / core number
+# ----------------------------
+class IncrementalTopology:
+    """
+    Mutable view of a packed undirected graph given as CSR ``(rowptr, col)``.
+    Neighbour sets are materialised on first touch. ``core`` and
+    ``triangles`` (per-node lists, when given) are kept current.
+    """
+
+    def __init__(self, rowptr, col, core=None, triangles=None):
+        self.rowptr, self.col = rowptr, col
+        self.core = core
+        self.tri = triangles
+        self.touched = set()
+        # (min, max) -> present
+        self.toggled = {}
+        self._adj = {}
+
+    def neighbours(self, node):
+        nbrs = self._adj.get(node)
+        if nbrs is None:
+            nbrs = self._adj[node] = set(self.col[self.rowptr[node]:self.rowptr[node + 1]].tolist())
+        return nbrs
+
+    def has_edge(self, a, b):
+        return b in self.neighbours(a)
+
+    def add_edge(self, a, b):
+        self._change(a, b, +1)
+        if self.core is not None:
+            self._core_insert(a, b)
+
+    def remove_edge(self, a, b):
+        self._change(a, b, -1)
+        if self.core is not None:
+            self._core_remove(a, b)
+
+    def _change(self, a, b, sign):
+        na, nb = self.neighbours(a), self.neighbours(b)
+        common = na & nb
+        self.touched.update(common)
+        self.touched.update((a, b))
+
+        tri = self.tri
+        if tri is not None:
+            tri[a] += sign * len(common)
+            tri[b] += sign * len(common)
+            for node in common:
+                tri[node] += sign
+
+        # Only pairs whose presence differs from the original graph are kept
+        pair = (a, b) if a < b else (b, a)
+        if pair in self.toggled:
+            del self.toggled[pair]
+        else:
+            self.toggled[pair] = sign > 0
+
+        if sign > 0:
+            na.add(b)
+            nb.add(a)
+        else:
+            na.discard(b)
+            nb.discard(a)
+
+    def _subcore(self, roots, k):
+        # Nodes of core k reachable from the roots through nodes of core k
+        core, seen, stack = self.core, set(roots), list(roots)
+        while stack:
+            for z in self.neighbours(stack.pop()):
+                if core[z] == k and z not in seen:
+                    seen.add(z)
+                    stack.append(z)
+        return seen
+
+    def _core_insert(self, a, b):
+        core = self.core
+        k = min(core[a], core[b])
+        candidates = self._subcore([n for n in (a, b) if core[n] == k], k)
+        # Candidates supported by more than k neighbours of core >= k rise to k + 1
+        support = {n: sum(core[z] >= k for z in self.neighbours(n)) for n in candidates}
+        evicted, queue = set(), [n for n in candidates if support[n] <= k]
+        while queue:
+            n = queue.pop()
+            if n in evicted:
+                continue
+            evicted.add(n)
+            for z in self.neighbours(n):
+                if z in candidates and z not in evicted:
+                    support[z] -= 1
+                    if support[z] <= k:
+                        queue.append(z)
+        for n in candidates - evicted:
+            core[n] = k + 1
+            self.touched.add(n)
+
+    def _core_remove(self, a, b):
+        core = self.core
+        k = min(core[a], core[b])
+        candidates = self._subcore([n for n in (a, b) if core[n] == k], k)
+        # Candidates left with fewer than k neighbours of core >= k drop to k - 1
+        support = {n: sum(core[z] >= k for z in self.neighbours(n)) for n in candidates}
+        queue = [n for n in candidates if support[n] < k]
+        while queue:
+            n = queue.pop()
+            if core[n] != k:
+                continue
+            core[n] = k - 1
+            self.touched.add(n)
+            for z in self.neighbours(n):
+                if z in candidates and core[z] == k:
+                    support[z] -= 1
+                    if support[z] < k:
+                        queue.append(z)
+
+
+def apply_edits(topology, edits):
+    """Apply ``sample_edits`` output in order; returns the number applied."""
+    applied = 0
+    for kind, a, b, c in edits.tolist():
+        if kind == REMOVE:
+            if not topology.has_edge(a, b):
+                continue
+            topology.remove_edge(a, b)
+        elif kind == REWIRE:
+            if c == a or not topology.has_edge(a, b) or topology.has_edge(a, c):
+                continue
+            topology.remove_edge(a, b)
+            topology.add_edge(a, c)
+        else:
+            if a == b or topology.has_edge(a, b):
+                continue
+            topology.add_edge(a, b)
+        applied += 1
+    return applied
+
+
+# ----------------------------
+# Packed dataset in, packed dataset out
+# ----------------------------
+def perturb_structure(edge_index, edge_attr, node_ptr, edge_ptr, graph_index, x, columns,
+                      edge_drop=0.0, edge_add=0.0, rewire=0.0, seed=0, adjacency=None):
+    """
+    Edge-perturb a packed dataset (local ``edge_index`` per graph).
+
+    ``columns`` maps the INCREMENTAL_FEATURES present in ``x`` to their
+    column. Returns ``(edge_index, edge_attr, edge_ptr, x, touched_graphs,
+    applied)``: kept edges stay in order, new ones follow their graph's
+    edges in both directions (zero ``edge_attr``), and only the touched
+    rows of ``x`` (copied if any) are rewritten. ``adjacency`` is the
+    ``undirected_adjacency`` of the input, when the caller keeps it.
+    """
+    num_graphs = node_ptr.numel() - 1
+    rowptr, col = adjacency or undirected_adjacency(edge_index, node_ptr, edge_ptr)
+    edits = sample_edits(rowptr, col, node_ptr, graph_index, edge_drop, edge_add, rewire, seed)
+
+    core = triangles = None
+    if "core" in columns:
+        core = x[:, columns["core"]].numpy().astype(np.int64).tolist()
+    if "clustering" in columns:
+        # Exact: the stored coefficients are 2t / (d (d - 1)) for integer t
+        d = np.diff(rowptr).astype(np.float64)
+        c = x[:, columns["clustering"]].double().numpy()
+        triangles = np.rint(c * d * (d - 1) / 2).astype(np.int64).tolist()
+    topology = IncrementalTopology(rowptr, col, core, triangles)
+    applied = apply_edits(topology, edits)
+
+    pairs = np.array(list(topology.toggled), dtype=np.int64).reshape(-1, 2)
+    present = np.fromiter(topology.toggled.values(), dtype=bool, count=len(topology.toggled))
+    removed, added = pairs[~present], pairs[present]
+
+    # Edges: drop removed pairs in both directions (searching only the
+    # graphs that lost edges), insert added ones after their graph's edges
+    node_ptr_np, edge_ptr_np = node_ptr.numpy(), edge_ptr.numpy()
+    num_nodes = int(node_ptr[-1])
+    keep = None
+    removed_counts = np.zeros(num_graphs, dtype=np.int64)
+    if removed.size:
+        graphs = np.unique(np.searchsorted(node_ptr_np, removed[:, 0], side="right") - 1)
+        positions = gather_ranges(edge_ptr, torch.from_numpy(graphs)).numpy()
+        graph_of = np.repeat(graphs, np.diff(edge_ptr_np)[graphs])
+        glob = edge_index[:, positions].numpy() + node_ptr_np[graph_of]
+        edge_key = glob.min(axis=0) * num_nodes + glob.max(axis=0)
+        removed_key = np.sort(removed[:, 0] * num_nodes + removed[:, 1])
+        hit = removed_key[np.searchsorted(removed_key, edge_key).clip(max=removed_key.size - 1)]
+        drop = positions[hit == edge_key]
+        removed_counts = np.bincount(graph_of[hit == edge_key], minlength=num_graphs)
+        keep = np.ones(edge_index.size(1), dtype=bool)
+        keep[drop] = False
+
+    new = np.concatenate([added, added[:, ::-1]])
+    new = new[np.lexsort((new[:, 1], new[:, 0]))]
+    new_graph = np.searchsorted(node_ptr_np, new[:, 0], side="right") - 1
+    new_counts = np.bincount(new_graph, minlength=num_graphs)
+
+    kept_ptr = edge_ptr_np - np.concatenate([[0], np.cumsum(removed_counts)])
+    new_edge_ptr = torch.from_numpy(kept_ptr + np.concatenate([[0], np.cumsum(new_counts)]))
+    at = kept_ptr[new_graph + 1]
+
+    out = edge_index.numpy() if keep is None else edge_index.numpy()[:, keep]
+    out = torch.from_numpy(np.insert(out, at, (new - node_ptr_np[new_graph, None]).T, axis=1))
+    if edge_attr is not None:
+        attr = edge_attr.numpy() if keep is None else edge_attr.numpy()[keep]
+        edge_attr = torch.from_numpy(np.insert(attr, at, 0, axis=0))
+
+    # Features: rewrite the touched rows only
+    touched = np.array(sorted(topology.touched), dtype=np.int64)
+    if x is not None and columns and touched.size:
+        x = x.clone()
+        rows = torch.from_numpy(touched)
+        nodes = touched.tolist()
+        degree = np.array([len(topology.neighbours(n)) for n in nodes], dtype=np.int64)
+        if "degree" in columns:
+            delta = degree - np.diff(rowptr)[touched]
+            x[rows, columns["degree"]] += torch.from_numpy(delta).to(x.dtype)
+        if "clustering" in columns:
+            pairs = degree * (degree - 1)
+            t = np.array([triangles[n] for n in nodes], dtype=np.float64)
+            values = np.where(pairs > 0, 2.0 * t / np.maximum(pairs, 1), 0.0)
+            x[rows, columns["clustering"]] = torch.from_numpy(values).to(x.dtype)
+        if "core" in columns:
+            x[rows, columns["core"]] = torch.tensor([core[n] for n in nodes], dtype=x.dtype)
+
+    touched_graphs = torch.searchsorted(node_ptr, torch.from_numpy(touched), right=True) - 1
+    return out, edge_attr, new_edge_ptr, x, touched_graphs.unique_consecutive(), applied
@@ -0,0 +1,283 @@
+import argparse
+import csv
+import itertools
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import torch
+from sklearn.metrics import f1_score
+from baseline import REPO_ROOT, TU_ROOT, load_splits, make_loader, predict, train_model
+from dataset import TopologicalDataset
+from ensemble import GINEnsemble, predict_ensemble, train_ensemble
+from model import GINModel
+from profiling import NULL_PROFILER, Profiler
+
+# ----------------------------
+# Topology ablation sweep
+#
+# Grid: topo_config x seed x (noise_std, feature_shift). Training does not
+# depend on the perturbation level, so each (topo_config, seed) pair is
+# trained once and evaluated at every noise level. Finished cells are
+# appended to the results CSV as they complete; rerunning the same command
+# skips them.
+#
+# With ensemble=True all seeds of a topo_config are trained together as one
+# GINEnsemble. Replicas then share a batch order (seeded by the first seed),
+# so numbers differ slightly from the default one-run-per-seed mode.
+# ----------------------------
+RESULTS_FILE = os.path.join(REPO_ROOT, "results", "sweep.csv")
+
+COLUMNS = [
+    "topo_config",
+    "seed",
+    "noise_std",
+    "feature_shift",
+    "f1_ideal",
+    "f1_perturbed",
+    "robustness_gap",
+    "train_seconds",
+]
+KEY = ["topo_config", "seed", "noise_std", "feature_shift"]
+
+# Ideal datasets per topo_config, built once in the parent. Forked workers
+# inherit them copy-on-write; spawned workers rebuild them from the on-disk
+# feature cache the parent has just filled.
+_DATASETS = {}
+
+
+def _dataset(topo_config, root=TU_ROOT):
+    if (root, topo_config) not in _DATASETS:
+        _DATASETS[root, topo_config] = TopologicalDataset("MUTAG", topo_config=topo_config,
+                                                          root=root)
+    return _DATASETS[root, topo_config]
+
+
+def _row(topo_config, seed, noise_std, feature_shift, f1_ideal, f1_perturbed, train_seconds):
+    return {
+        "topo_config": topo_config,
+        "seed": seed,
+        "noise_std": noise_std,
+        "feature_shift": feature_shift,
+        "f1_ideal": round(float(f1_ideal), 6),
+        "f1_perturbed": round(float(f1_perturbed), 6),
+        "robustness_gap": round(float(f1_ideal - f1_perturbed), 6),
+        "train_seconds": round(train_seconds, 3),
+    }
+
+
+def _profiler(profile_dir, topo_config, seed):
+    if not profile_dir:
+        return NULL_PROFILER
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, f"{topo_config}_seed{seed}.jsonl")
+    return Profiler(path, script="sweep", topo_config=topo_config, seed=seed)
+
+
+def run_cell_group(topo_config, seed, levels, epochs, lr, profile_dir=None, root=TU_ROOT):
+    """Train one model and score it at every (noise_std, feature_shift) in ``levels``."""
+    torch.set_num_threads(1)
+    torch.manual_seed(seed)
+    profiler = _profiler(profile_dir, topo_config, seed)
+
+    with profiler.phase("precompute", trace=True):
+        dataset = _dataset(topo_config, root)
+    with profiler.phase("indexing", trace=True):
+        train_df, test_df = load_splits("MUTAG", root)
+        train = dataset.index_select(train_df.graph_index.values)
+        test = dataset.index_select(test_df.graph_index.values)
+    y_true = test.y.tolist()
+
+    model = GINModel(input_dim=dataset.num_features, output_dim=dataset.num_classes)
+    start = time.perf_counter()
+    train_model(model, make_loader(train, shuffle=True), epochs=epochs, lr=lr, log_every=0,
+                profiler=profiler)
+    train_seconds = time.perf_counter() - start
+
+    f1_ideal = f1_score(y_true, predict(model, make_loader(test), profiler), average="macro")
+
+    rows = []
+    for noise_std, feature_shift in levels:
+        with profiler.phase("perturb", trace=True):
+            perturbed = test.with_perturbation(feature_shift, noise_std)
+        f1_perturbed = f1_score(
+            y_true, predict(model, make_loader(perturbed), profiler), average="macro"
+        )
+        rows.append(_row(topo_config, seed, noise_std, feature_shift,
+                         f1_ideal, f1_perturbed, train_seconds))
+
+    if profiler.enabled:
+        profiler.close()
+    return rows
+
+
+def run_ensemble_group(topo_config, seeds, levels_by_seed, epochs, lr, profile_dir=None,
+                       root=TU_ROOT):
+    """``run_cell_group`` for several seeds at once, trained as one GINEnsemble."""
+    torch.set_num_threads(1)
+    profiler = _profiler(profile_dir, topo_config, "s" + "-".join(map(str, seeds)))
+
+    with profiler.phase("precompute", trace=True):
+        dataset = _dataset(topo_config, root)
+    with profiler.phase("indexing", trace=True):
+        train_df, test_df = load_splits("MUTAG", root)
+        train = dataset.index_select(train_df.graph_index.values)
+        test = dataset.index_select(test_df.graph_index.values)
+    y_true = test.y.tolist()
+
+    ensemble = GINEnsemble(seeds, input_dim=dataset.num_features, output_dim=dataset.num_classes)
+    loader = make_loader(train, shuffle=True, generator=torch.Generator().manual_seed(seeds[0]))
+    start = time.perf_counter()
+    train_ensemble(ensemble, loader, epochs=epochs, lr=lr, log_every=0, profiler=profiler)
+    train_seconds = (time.perf_counter() - start) / len(seeds)
+
+    ideal = predict_ensemble(ensemble, make_loader(test), profiler)
+    levels = sorted({level for levels in levels_by_seed.values() for level in levels})
+    perturbed = {}
+    for noise_std, feature_shift in levels:
+        with profiler.phase("perturb", trace=True):
+            shifted = test.with_perturbation(feature_shift, noise_std)
+        perturbed[(noise_std, feature_shift)] = predict_ensemble(
+            ensemble, make_loader(shifted), profiler
+        )
+
+    rows = []
+    for i, seed in enumerate(seeds):
+        f1_ideal = f1_score(y_true, ideal[i].tolist(), average="macro")
+        for noise_std, feature_shift in levels_by_seed[seed]:
+            f1_perturbed = f1_score(
+                y_true, perturbed[(noise_std, feature_shift)][i].tolist(), average="macro"
+            )
+            rows.append(_row(topo_config, seed, noise_std, feature_shift,
+                             f1_ideal, f1_perturbed, train_seconds))
+
+    if profiler.enabled:
+        profiler.close()
+    return rows
+
+
+def completed_cells(path):
+    if not os.path.exists(path):
+        return set()
+    # A run killed mid-write can leave a truncated last line
+    done = load_results(path)
+    return {
+        (r.topo_config, int(r.seed), float(r.noise_std), float(r.feature_shift))
+        for r in done.itertuples(index=False)
+    }
+
+
+def run_sweep(topo_configs, seeds, noise_stds, feature_shifts,
+              epochs=50, lr=0.01, num_workers=1, output=RESULTS_FILE, ensemble=False,
+              profile_dir=None, root=TU_ROOT):
+    done = completed_cells(output)
+
+    tasks = []
+    for topo_config, seed in itertools.product(topo_configs, seeds):
+        levels = [
+            (float(n), float(s)) for n, s in itertools.product(noise_stds, feature_shifts)
+            if (topo_config, seed, float(n), float(s)) not in done
+        ]
+        if levels:
+            tasks.append((topo_config, seed, levels))
+
+    total = sum(len(levels) for _, _, levels in tasks)
+
+    if ensemble:
+        grouped = {}
+        for topo_config, seed, levels in tasks:
+            grouped.setdefault(topo_config, {})[seed] = levels
+        jobs = [
+            (run_ensemble_group,
+             (topo_config, sorted(by_seed), by_seed, epochs, lr, profile_dir, root))
+            for topo_config, by_seed in grouped.items()
+        ]
+    else:
+        jobs = [
+            (run_cell_group, (topo_config, seed, levels, epochs, lr, profile_dir, root))
+            for topo_config, seed, levels in tasks
+        ]
+
+    print(f"{len(done)} cells already done, {total} to run in {len(jobs)} training jobs")
+    if not jobs:
+        return load_results(output)
+
+    # Precompute features once per topo_config before any worker starts
+    for topo_config in sorted({t[0] for t in tasks}):
+        _dataset(topo_config, root)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    new_file = not os.path.exists(output)
+
+    with open(output, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if new_file:
+            writer.writeheader()
+
+        def record(rows):
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+            for r in rows:
+                print(f"{r['topo_config']:<14} seed={r['seed']} std={r['noise_std']} "
+                      f"shift={r['feature_shift']} → ideal={r['f1_ideal']:.4f} "
+                      f"perturbed={r['f1_perturbed']:.4f}")
+
+        if num_workers <= 1:
+            for fn, job_args in jobs:
+                record(fn(*job_args))
+        else:
+            methods = mp.get_all_start_methods()
+            context = mp.get_context("fork" if "fork" in methods else None)
+            with ProcessPoolExecutor(num_workers, mp_context=context) as pool:
+                futures = [pool.submit(fn, *job_args) for fn, job_args in jobs]
+                for future in as_completed(futures):
+                    record(future.result())
+
+    return load_results(output)
+
+
+def load_results(path):
+    results = pd.read_csv(path, on_bad_lines="skip").dropna(subset=COLUMNS)
+    return results.sort_values(KEY).reset_index(drop=True)
+
+
+def summarize(results):
+    """Mean and std over seeds for every (topo_config, noise level)."""
+    return results.groupby(["topo_config", "noise_std", "feature_shift"]).agg(
+        seeds=("seed", "nunique"),
+        f1_ideal=("f1_ideal", "mean"),
+        f1_perturbed=("f1_perturbed", "mean"),
+        f1_perturbed_std=("f1_perturbed", "std"),
+        robustness_gap=("robustness_gap", "mean"),
+    ).reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topo-configs", nargs="+",
+                        default=["none", "degree", "local", "global", "all"])
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0, 1, 2])
+    parser.add_argument("--noise-std", nargs="+", type=float, default=[0.05])
+    parser.add_argument("--feature-shift", nargs="+", type=float, default=[0.3])
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--lr", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--root", type=str, default=TU_ROOT)
+    parser.add_argument("--output", type=str, default=RESULTS_FILE)
+    parser.add_argument("--ensemble", action="store_true",
+                        help="train all seeds of a topo_config together as one GINEnsemble")
+    parser.add_argument("--profile-dir", type=str, default=None,
+                        help="write a JSONL phase/throughput trace per training job here")
+    args = parser.parse_args()
+
+    results = run_sweep(
+        args.topo_configs, args.seeds, args.noise_std, args.feature_shift,
+        epochs=args.epochs, lr=args.lr, num_workers=args.workers, output=args.output,
+        ensemble=args.ensemble, profile_dir=args.profile_dir, root=args.root,
+    )
+    print()
+    print(summarize(results).to_string(index=False))
+    print(f"\nResults table → {args.output}")
@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# ----------------------------
+# Synthetic TU-format datasets
+#
+# Writes molecule-like random graphs (a random spanning tree plus extra
+# edges) as TU raw files, block by block, so 1M-graph datasets are produced
+# with memory bounded by one block. Graph block b is drawn from its own
+# generator seeded by (seed, b): the output depends only on the parameters,
+# never on how it was written.
+#
+# Label signal: every graph gets a class c. With probability label_signal
+# its structure is drawn from class c's template, otherwise from a random
+# class. Template t adds density * (1 + t) extra edges per node on average,
+# so classes differ in cycles, degree and clustering (what the topological
+# features see); node labels carry no signal. label_signal=0 gives labels
+# independent of the graphs, 1 makes them a function of the template.
+#
+# Output under <root>/<name>/:
+#   raw/<name>_{A,graph_indicator,graph_labels,node_labels}.txt
+#       (+ _edge_labels.txt with num_edge_labels > 0)
+#   splits/train.csv, splits/test.csv    same layout as data/train.csv and
+#                                        data/test.csv (test labels blank)
+#   splits/test_labels.csv               test truth, for scoring_script.py
+#   synthetic.json                       generation parameters
+# ----------------------------
+BLOCK_GRAPHS = 4096
+SIZE_DISTS = ["uniform", "lognormal"]
+PARAMS_FILE = "synthetic.json"
+
+
+def _sizes(rng, count, size_dist, min_nodes, max_nodes, mean_nodes, size_sigma):
+    if size_dist == "uniform":
+        return rng.integers(min_nodes, max_nodes + 1, count)
+    if size_dist == "lognormal":
+        sizes = np.rint(mean_nodes * rng.lognormal(0.0, size_sigma, count))
+        return np.clip(sizes, min_nodes, max_nodes).astype(np.int64)
+    raise ValueError(f"Unknown size distribution: {size_dist}")
+
+
+def _ranges(counts):
+    """Owner of every position and its offset inside the owner's range."""
+    owner = np.repeat(np.arange(counts.size), counts)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return owner, np.arange(int(counts.sum())) - starts[owner]
+
+
+def generate_block(rng, count, params):
+    """
+    ``count`` graphs as block-local arrays: sizes, classes, node labels and
+    an undirected edge list (both directions, sorted by (src, dst)).
+    """
+    sizes = _sizes(rng, count, params["size_dist"], params["min_nodes"], params["max_nodes"],
+                   params["mean_nodes"], params["size_sigma"])
+    num_classes = params["num_classes"]
+    classes = rng.integers(0, num_classes, count)
+    template = np.where(rng.random(count) < params["label_signal"],
+                        classes, rng.integers(0, num_classes, count))
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    # Random recursive tree: node i > 0 attaches to a node below it
+    graph_of_child, child = _ranges(sizes - 1)
+    child = child + 1
+    parent = (rng.random(child.size) * child).astype(np.int64)
+
+    # Extra edges close rings
+    extra = rng.poisson(params["density"] * sizes * (1 + template))
+    graph_of_extra, _ = _ranges(extra)
+    n = sizes[graph_of_extra]
+    a = (rng.random(n.size) * n).astype(np.int64)
+    b = (rng.random(n.size) * n).astype(np.int64)
+
+    src = np.concatenate([child + offsets[graph_of_child], a + offsets[graph_of_extra]])
+    dst = np.concatenate([parent + offsets[graph_of_child], b + offsets[graph_of_extra]])
+    keep = src != dst
+    src, dst = src[keep], dst[keep]
+
+    num_nodes = int(sizes.sum())
+    key = np.unique(np.concatenate([src * num_nodes + dst, dst * num_nodes + src]))
+    edges = np.stack([key // num_nodes, key % num_nodes], axis=1)
+
+    node_labels = rng.integers(0, params["num_node_labels"], num_nodes)
+    edge_labels = None
+    if params["num_edge_labels"]:
+        # Same label in both directions
+        lo = np.minimum(edges[:, 0], edges[:, 1])
+        hi = np.maximum(edges[:, 0], edges[:, 1])
+        pair, inverse = np.unique(lo * num_nodes + hi, return_inverse=True)
+        edge_labels = rng.integers(0, params["num_edge_labels"], pair.size)[inverse]
+
+    return sizes, classes, node_labels, edges, edge_labels
+
+
+def _write_column(f, values):
+    if values.size:
+        f.write("\n".join(map(str, values.tolist())))
+        f.write("\n")
+
+
+def _write_pairs(f, pairs):
+    if pairs.size:
+        f.write("\n".join(f"{u}, {v}" for u, v in pairs.tolist()))
+        f.write("\n")
+
+
+def write_synthetic_tu(root, name, num_graphs, seed=0, size_dist="uniform",
+                       min_nodes=10, max_nodes=28, mean_nodes=18, size_sigma=0.5,
+                       density=0.15, num_classes=2, label_signal=0.8, num_node_labels=7,
+                       num_edge_labels=0, test_fraction=0.2, overwrite=False):
+    """
+    Write a synthetic TU dataset ``name`` under ``root`` (see above). An
+    existing dataset with the same parameters is kept; different
+    parameters need ``overwrite=True``, which also drops its processed
+    files and caches. Returns the dataset directory.
+    """
+    params = {
+        "num_graphs": num_graphs, "seed": seed, "size_dist": size_dist,
+        "min_nodes": min_nodes, "max_nodes": max_nodes, "mean_nodes": mean_nodes,
+        "size_sigma": size_sigma, "density": density, "num_classes": num_classes,
+        "label_signal": label_signal, "num_node_labels": num_node_labels,
+        "num_edge_labels": num_edge_labels, "test_fraction": test_fraction,
+    }
+    if min_nodes < 1 or max_nodes < min_nodes:
+        raise ValueError("Need 1 <= min_nodes <= max_nodes")
+
+    directory = os.path.join(root, name)
+    if os.path.exists(directory):
+        try:
+            with open(os.path.join(directory, PARAMS_FILE)) as f:
+                existing = json.load(f)
+        except (OSError, ValueError):
+            existing = None
+        if existing == params:
+            return directory
+        if not overwrite:
+            raise ValueError(f"{directory} exists with other contents; pass overwrite=True")
+        shutil.rmtree(directory)
+
+    tmp = f"{directory}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    raw = os.path.join(tmp, "raw")
+    os.makedirs(raw)
+
+    def path(suffix):
+        return os.path.join(raw, f"{name}_{suffix}.txt")
+
+    files = {k: open(path(k), "w") for k in ["A", "graph_indicator", "graph_labels", "node_labels"]}
+    if num_edge_labels:
+        files["edge_labels"] = open(path("edge_labels"), "w")
+
+    labels = np.empty(num_graphs, dtype=np.int64)
+    try:
+        first_graph = first_node = 0
+        for block, start in enumerate(range(0, num_graphs, BLOCK_GRAPHS)):
+            rng = np.random.default_rng([seed, 1, block])
+            count = min(BLOCK_GRAPHS, num_graphs - start)
+            sizes, classes, node_labels, edges, edge_labels = generate_block(rng, count, params)
+
+            # TU files are 1-based
+            _write_pairs(files["A"], edges + first_node + 1)
+            _write_column(files["graph_indicator"],
+                          np.repeat(np.arange(count) + first_graph + 1, sizes))
+            _write_column(files["graph_labels"], classes)
+            _write_column(files["node_labels"], node_labels)
+            if edge_labels is not None:
+                _write_column(files["edge_labels"], edge_labels)
+
+            labels[start:start + count] = classes
+            first_graph += count
+            first_node += int(sizes.sum())
+    finally:
+        for f in files.values():
+            f.close()
+
+    write_splits(os.path.join(tmp, "splits"), labels, test_fraction, seed)
+    with open(os.path.join(tmp, PARAMS_FILE), "w") as f:
+        json.dump(params, f, indent=2)
+
+    try:
+        os.rename(tmp, directory)
+    except OSError:
+        # Another process wrote the same dataset first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return directory
+
+
+def write_splits(directory, labels, test_fraction=0.2, seed=0):
+    """Shuffled train/test split files in the layout of data/train.csv and data/test.csv."""
+    os.makedirs(directory, exist_ok=True)
+    order = np.random.default_rng([seed, 0]).permutation(labels.size)
+    num_test = int(round(labels.size * test_fraction))
+    train, test = order[num_test:], order[:num_test]
+
+    pd.DataFrame({"graph_index": train, "label": labels[train]}).to_csv(
+        os.path.join(directory, "train.csv"), index=False)
+    pd.DataFrame({"graph_index": test, "label": ""}).to_csv(
+        os.path.join(directory, "test.csv"), index=False)
+    pd.DataFrame({"graph_index": test, "label": labels[test]}).to_csv(
+        os.path.join(directory, "test_labels.csv"), index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", type=str, required=True)
+    parser.add_argument("--root", type=str, default="../data/TUDataset")
+    parser.add_argument("--graphs", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size-dist", choices=SIZE_DISTS, default="uniform")
+    parser.add_argument("--min-nodes", type=int, default=10)
+    parser.add_argument("--max-nodes", type=int, default=28)
+    parser.add_argument("--mean-nodes", type=float, default=18,
+                        help="median graph size for --size-dist lognormal")
+    parser.add_argument("--size-sigma", type=float, default=0.5)
+    parser.add_argument("--density", type=float, default=0.15,
+                        help="extra (ring-closing) edges per node for class 0")
+    parser.add_argument("--classes", type=int, default=2)
+    parser.add_argument("--label-signal", type=float, default=0.8)
+    parser.add_argument("--node-labels", type=int, default=7)
+    parser.add_argument("--edge-labels", type=int, default=0)
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    directory = write_synthetic_tu(
+        args.root, args.name, args.graphs, seed=args.seed, size_dist=args.size_dist,
+        min_nodes=args.min_nodes, max_nodes=args.max_nodes, mean_nodes=args.mean_nodes,
+        size_sigma=args.size_sigma, density=args.density, num_classes=args.classes,
+        label_signal=args.label_signal, num_node_labels=args.node_labels,
+        num_edge_labels=args.edge_labels, test_fraction=args.test_fraction,
+        overwrite=args.overwrite,
+    )
+    print(f"Wrote {args.graphs} graphs → {directory}")
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import torch
+
+from topo_features import FEATURE_CODE_VERSION, FEATURE_ORDER, resolve_params
+
+# ----------------------------
+# Content-addressed cache of packed topological features
+#
+# Layout:  <root>/<name>/topo_cache/<features>[-p<params>]-<backend>-<key>.pt
+# Each entry holds one packed [num_nodes, num_features] tensor plus the
+# node offsets of every graph, so a warm start is a single mmap'd load.
+# The key covers the dataset name, feature list, approximation params,
+# backend, feature-code version and a fingerprint of the raw files; any
+# change produces a new key and the old entry for the same feature list,
+# params and backend is dropped on the next store.
+# ----------------------------
+FINGERPRINT_FILE = "raw_fingerprint.json"
+
+
+def cache_dir(root, name):
+    return os.path.join(root, name, "topo_cache")
+
+
+def raw_fingerprint(root, name):
+    """
+    SHA-256 over the raw dataset files. Per-file digests are memoised by
+    (size, mtime) so unchanged files are not re-read on every start.
+    """
+    raw_dir = os.path.join(root, name, "raw")
+    memo_path = os.path.join(cache_dir(root, name), FINGERPRINT_FILE)
+
+    try:
+        with open(memo_path, "r") as f:
+            memo = json.load(f)
+    except (OSError, ValueError):
+        memo = {}
+
+    digests = {}
+    for fname in sorted(os.listdir(raw_dir)) if os.path.isdir(raw_dir) else []:
+        path = os.path.join(raw_dir, fname)
+        if not os.path.isfile(path):
+            continue
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+
+        cached = memo.get(fname)
+        if cached and cached[:2] == stamp:
+            digests[fname] = cached
+            continue
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digests[fname] = stamp + [h.hexdigest()]
+
+    if digests != memo:
+        _atomic_write(memo_path, lambda f: f.write(json.dumps(digests).encode()))
+
+    h = hashlib.sha256()
+    for fname, (_, _, digest) in digests.items():
+        h.update(f"{fname}:{digest}\n".encode())
+    return h.hexdigest()
+
+
+def cache_key(name, features_list, fingerprint, params=None, backend="tensor"):
+    payload = json.dumps({
+        "backend": backend,
+        "dataset": name,
+        "features": _canonical(features_list),
+        "params": resolve_params(features_list, params),
+        "raw": fingerprint,
+        "version": FEATURE_CODE_VERSION,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def load(root, name, features_list, params=None, backend="tensor"):
+    """Return ``(features, node_ptr)`` from the cache, or ``None`` on a miss."""
+    key = cache_key(name, features_list, raw_fingerprint(root, name), params, backend)
+    path = _entry_path(root, name, features_list, params, backend, key)
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        entry = torch.load(path, mmap=True, weights_only=True)
+    except Exception as e:
+        print(f"Ignoring unreadable cache entry {path}: {e}")
+        return None
+
+    if entry.get("key") != key:
+        return None
+    return entry["features"], entry["node_ptr"]
+
+
+def store(root, name, features_list, features, node_ptr, params=None, backend="tensor"):
+    key = cache_key(name, features_list, raw_fingerprint(root, name), params, backend)
+    path = _entry_path(root, name, features_list, params, backend, key)
+
+    entry = {
+        "key": key,
+        "dataset": name,
+        "features_list": _canonical(features_list),
+        "params": resolve_params(features_list, params),
+        "backend": backend,
+        "version": FEATURE_CODE_VERSION,
+        "created": time.time(),
+        "features": features.contiguous(),
+        "node_ptr": node_ptr,
+    }
+    _atomic_write(path, lambda f: torch.save(entry, f))
+
+    # Invalidate older entries for the same feature list, params and backend
+    prefix = _slug(features_list, params, backend) + "-"
+    for fname in os.listdir(cache_dir(root, name)):
+        if (fname.startswith(prefix) and fname.endswith(".pt") and "-" not in fname[len(prefix):]
+                and fname != os.path.basename(path)):
+            os.remove(os.path.join(cache_dir(root, name), fname))
+
+    return path
+
+
+# ----------------------------
+# Per-shard entries for lazy datasets
+#
+# Layout:  <root>/<name>/topo_cache/shards/<features>[-p<params>]-<backend>-<key>/<first graph>.pt
+# Same key as the packed entry; each file holds the features of one block of
+# consecutive graphs, written the first time that block is computed.
+# ----------------------------
+def shard_dir(root, name, features_list, params=None, backend="tensor"):
+    """Directory for the current key; stale directories of the same features are removed."""
+    key = cache_key(name, features_list, raw_fingerprint(root, name), params, backend)
+    parent = os.path.join(cache_dir(root, name), "shards")
+    slug = _slug(features_list, params, backend)
+    directory = os.path.join(parent, f"{slug}-{key}")
+
+    if os.path.isdir(parent):
+        for fname in os.listdir(parent):
+            if fname.startswith(slug + "-") and fname != os.path.basename(directory):
+                # Only <slug>-<key> is stale; longer names belong to other params
+                if fname[len(slug) + 1:].count("-") == 0:
+                    shutil.rmtree(os.path.join(parent, fname), ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def load_shard(directory, start):
+    path = os.path.join(directory, f"{start:012d}.pt")
+    if not os.path.exists(path):
+        return None
+    try:
+        return torch.load(path, weights_only=True)
+    except Exception as e:
+        print(f"Ignoring unreadable cache shard {path}: {e}")
+        return None
+
+
+def store_shard(directory, start, features):
+    path = os.path.join(directory, f"{start:012d}.pt")
+    _atomic_write(path, lambda f: torch.save(features.contiguous(), f))
+    return path
+
+
+# ----------------------------
+# Inspection / maintenance
+# ----------------------------
+def cache_info(root, name):
+    """One dict per cache entry, with a ``stale`` flag for outdated keys."""
+    directory = cache_dir(root, name)
+    if not os.path.isdir(directory):
+        return []
+
+    fingerprint = raw_fingerprint(root, name)
+    info = []
+    for fname in sorted(os.listdir(directory)):
+        if not fname.endswith(".pt"):
+            continue
+        path = os.path.join(directory, fname)
+        try:
+            entry = torch.load(path, mmap=True, weights_only=True)
+        except Exception:
+            info.append({"file": fname, "bytes": os.path.getsize(path), "stale": True})
+            continue
+
+        info.append({
+            "file": fname,
+            "bytes": os.path.getsize(path),
+            "features_list": entry["features_list"],
+            "params": entry.get("params", {}),
+            "backend": entry.get("backend", "tensor"),
+            "version": entry["version"],
+            "created": entry["created"],
+            "shape": list(entry["features"].shape),
+            "stale": entry["key"] != cache_key(
+                name, entry["features_list"], fingerprint, entry.get("params"),
+                entry.get("backend", "tensor"),
+            ),
+        })
+    return info
+
+
+def clear_cache(root, name, stale_only=False):
+    """Delete cache entries; returns the number of files removed."""
+    removed = 0
+    for entry in cache_info(root, name):
+        if stale_only and not entry["stale"]:
+            continue
+        os.remove(os.path.join(cache_dir(root, name), entry["file"]))
+        removed += 1
+
+    shards = os.path.join(cache_dir(root, name), "shards")
+    if not stale_only and os.path.isdir(shards):
+        removed += len(os.listdir(shards))
+        shutil.rmtree(shards)
+    return removed
+
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def _canonical(features_list):
+    return [f for f in FEATURE_ORDER if f in features_list]
+
+
+def _slug(features_list, params=None, backend="tensor"):
+    slug = "_".join(_canonical(features_list))
+    used = resolve_params(features_list, params)
+    if used:
+        digest = hashlib.sha256(json.dumps(used, sort_keys=True).encode()).hexdigest()[:8]
+        slug += f"-p{digest}"
+    return f"{slug}-{backend}"
+
+
+def _entry_path(root, name, features_list, params, backend, key):
+    return os.path.join(cache_dir(root, name), f"{_slug(features_list, params, backend)}-{key}.pt")
+
+
+def _atomic_write(path, write):
+    # Concurrent sweep processes may race on the same entry; writing to a
+    # private temp file and renaming keeps readers from seeing partial files.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", type=str, default="MUTAG")
+    parser.add_argument("--root", type=str, default="../data/TUDataset")
+    parser.add_argument("--clear", action="store_true")
+    parser.add_argument("--stale-only", action="store_true")
+    args = parser.parse_args()
+
+    if args.clear:
+        n = clear_cache(args.root, args.name, stale_only=args.stale_only)
+        print(f"Removed {n} cache entries from {cache_dir(args.root, args.name)}")
+    else:
+        for entry in cache_info(args.root, args.name):
+            print(json.dumps(entry))
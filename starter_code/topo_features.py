@@ -0,0 +1,503 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import torch
+import networkx as nx
+from torch_geometric.data import Data
+
+# Canonical column order of the topological feature block. Columns are always
+# emitted in this order, whatever order the feature list is given in.
+FEATURE_ORDER = [
+    "degree",
+    "clustering",
+    "betweenness",
+    "betweenness_approx",
+    "pagerank",
+    "pagerank_fast",
+    "core",
+]
+
+# Bump whenever a change alters computed feature values; invalidates the
+# on-disk feature cache (see topo_cache.py).
+FEATURE_CODE_VERSION = 1
+
+# Features the tensor backend computes directly from ``edge_index``
+TENSOR_FEATURES = {"degree", "clustering", "pagerank", "pagerank_fast", "core"}
+
+# Cost/accuracy knobs of the approximate features, overridable per dataset.
+#   betweenness_approx: k-pivot sampling with a fixed seed
+#   pagerank_fast:      power iteration with a looser tolerance and an
+#                       iteration cap; returns the last iterate at the cap
+DEFAULT_FEATURE_PARAMS = {
+    "betweenness_k": 16,
+    "betweenness_seed": 0,
+    "pagerank_tol": 1e-4,
+    "pagerank_max_iter": 20,
+}
+
+# Exact feature each approximation is measured against
+APPROXIMATIONS = {
+    "betweenness_approx": "betweenness",
+    "pagerank_fast": "pagerank",
+}
+
+_PARAMS_USED_BY = {
+    "betweenness_approx": ["betweenness_k", "betweenness_seed"],
+    "pagerank_fast": ["pagerank_tol", "pagerank_max_iter"],
+}
+
+
+def resolve_params(features_list, params=None):
+    """Defaults merged with ``params``, restricted to what ``features_list`` uses."""
+    merged = {**DEFAULT_FEATURE_PARAMS, **(params or {})}
+    unknown = set(merged) - set(DEFAULT_FEATURE_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown feature params: {sorted(unknown)}")
+    return {
+        key: merged[key]
+        for feature in FEATURE_ORDER if feature in features_list
+        for key in _PARAMS_USED_BY.get(feature, [])
+    }
+
+
+# ----------------------------
+# Reference implementation (NetworkX, one graph at a time)
+# ----------------------------
+def compute_topological_features(data, features_list, params=None):
+    edge_index = data.edge_index.cpu().numpy()
+    G = nx.Graph()
+    G.add_edges_from(edge_index.T)
+
+    # Ensure isolated nodes are included
+    for i in range(data.num_nodes):
+        if i not in G:
+            G.add_node(i)
+
+    features = []
+    nodes = sorted(G.nodes())
+    params = {**DEFAULT_FEATURE_PARAMS, **(params or {})}
+
+    if 'degree' in features_list:
+        features.append(
+            torch.tensor([G.degree(n) for n in nodes], dtype=torch.float).unsqueeze(1)
+        )
+
+    if 'clustering' in features_list:
+        c = nx.clustering(G)
+        features.append(
+            torch.tensor([c[n] for n in nodes], dtype=torch.float).unsqueeze(1)
+        )
+
+    if 'betweenness' in features_list:
+        b = nx.betweenness_centrality(G)
+        features.append(
+            torch.tensor([b[n] for n in nodes], dtype=torch.float).unsqueeze(1)
+        )
+
+    if 'betweenness_approx' in features_list:
+        b = nx.betweenness_centrality(
+            G, k=min(params["betweenness_k"], len(nodes)), seed=params["betweenness_seed"]
+        )
+        features.append(
+            torch.tensor([b[n] for n in nodes], dtype=torch.float).unsqueeze(1)
+        )
+
+    if 'pagerank' in features_list:
+        p = nx.pagerank(G)
+        features.append(
+            torch.tensor([p[n] for n in nodes], dtype=torch.float).unsqueeze(1)
+        )
+
+    if 'pagerank_fast' in features_list:
+        p = _nx_pagerank_capped(G, nodes, params["pagerank_tol"], params["pagerank_max_iter"])
+        features.append(
+            torch.tensor([p[n] for n in nodes], dtype=torch.float).unsqueeze(1)
+        )
+
+    if 'core' in features_list:
+        core = nx.core_number(G)
+        features.append(
+            torch.tensor([core[n] for n in nodes], dtype=torch.float).unsqueeze(1)
+        )
+
+    return torch.cat(features, dim=1) if features else None
+
+
+def _nx_pagerank_capped(G, nodes, tol, max_iter, alpha=0.85):
+    # nx.pagerank raises at max_iter instead of returning its estimate; the
+    # estimate it would return is the uniform start times max_iter steps of
+    # its own Google matrix
+    try:
+        return nx.pagerank(G, alpha=alpha, tol=tol, max_iter=max_iter)
+    except nx.PowerIterationFailedConvergence:
+        M = nx.google_matrix(G, alpha=alpha, nodelist=nodes)
+        x = np.full(len(nodes), 1.0 / len(nodes))
+        for _ in range(max_iter):
+            x = x @ M
+        return dict(zip(nodes, np.asarray(x).ravel()))
+
+
+# ----------------------------
+# Block-diagonal packing
+# ----------------------------
+def pack_graphs(dataset):
+    """
+    Stack every graph of ``dataset`` into one block-diagonal graph.
+
+    Returns ``(edge_index, node_ptr, edge_ptr)`` where ``edge_index`` uses
+    global node ids and graph ``i`` owns nodes ``node_ptr[i]:node_ptr[i + 1]``
+    and edges ``edge_ptr[i]:edge_ptr[i + 1]``.
+    """
+    slices = getattr(dataset, "slices", None)
+
+    if slices is not None and "x" in slices and getattr(dataset, "_indices", None) is None:
+        # InMemoryDataset: read the collated storage directly
+        node_ptr = slices["x"].long()
+        edge_ptr = slices["edge_index"].long()
+        edge_index = dataset._data.edge_index
+    else:
+        num_nodes, num_edges, edges = [], [], []
+        for data in dataset:
+            num_nodes.append(data.num_nodes)
+            num_edges.append(data.edge_index.size(1))
+            edges.append(data.edge_index)
+        node_ptr = counts_to_ptr(torch.tensor(num_nodes, dtype=torch.long))
+        edge_ptr = counts_to_ptr(torch.tensor(num_edges, dtype=torch.long))
+        edge_index = torch.cat(edges, dim=1) if edges else torch.empty((2, 0), dtype=torch.long)
+
+    graph_of_edge = torch.repeat_interleave(
+        torch.arange(node_ptr.numel() - 1), edge_ptr.diff()
+    )
+    return edge_index + node_ptr[graph_of_edge], node_ptr, edge_ptr
+
+
+def counts_to_ptr(counts):
+    ptr = torch.zeros(counts.numel() + 1, dtype=torch.long)
+    torch.cumsum(counts, dim=0, out=ptr[1:])
+    return ptr
+
+
+# ----------------------------
+# Tensor backend
+# ----------------------------
+def compute_topological_features_batched(edge_index, node_ptr, features_list, params=None):
+    """
+    Tensor-native counterpart of ``compute_topological_features``.
+
+    Works on a whole block-diagonal graph at once (see ``pack_graphs``) and
+    returns a ``[num_nodes, num_features]`` float tensor, or ``None`` when
+    ``features_list`` is empty. Only ``TENSOR_FEATURES`` are supported.
+    """
+    unsupported = set(features_list) - TENSOR_FEATURES
+    if unsupported:
+        raise ValueError(f"Tensor backend does not support: {sorted(unsupported)}")
+
+    num_nodes = int(node_ptr[-1])
+    row, col = _undirected(edge_index, num_nodes)
+    loop = row == col
+    params = {**DEFAULT_FEATURE_PARAMS, **(params or {})}
+
+    columns = {}
+
+    if "degree" in features_list:
+        # NetworkX counts a self-loop twice towards the degree
+        degree = torch.bincount(row, minlength=num_nodes) + torch.bincount(
+            row[loop], minlength=num_nodes
+        )
+        columns["degree"] = degree.double()
+
+    if "clustering" in features_list:
+        columns["clustering"] = _clustering(row[~loop], col[~loop], num_nodes)
+
+    if "pagerank" in features_list:
+        columns["pagerank"] = _pagerank(row, col, node_ptr, 0.85, 1e-6, 100)
+
+    if "pagerank_fast" in features_list:
+        columns["pagerank_fast"] = _pagerank(
+            row, col, node_ptr, 0.85,
+            params["pagerank_tol"], params["pagerank_max_iter"], strict=False
+        )
+
+    if "core" in features_list:
+        if loop.any():
+            raise ValueError("Core number is not defined for graphs with self-loops")
+        columns["core"] = _core_number(row, col, num_nodes).double()
+
+    features = [columns[name].float().unsqueeze(1) for name in FEATURE_ORDER if name in columns]
+    return torch.cat(features, dim=1) if features else None
+
+
+def _undirected(edge_index, num_nodes):
+    """Symmetrise and deduplicate ``edge_index``; returns row-sorted (row, col)."""
+    edge_index = torch.cat([edge_index, edge_index.flip(0)], dim=1)
+    key = torch.unique(edge_index[0] * num_nodes + edge_index[1])
+    return key // num_nodes, key % num_nodes
+
+
+def _clustering(row, col, num_nodes):
+    # Entry (u, v) of A @ A counts the common neighbours of u and v, so summing
+    # it over the edges of u counts every triangle through u twice.
+    adj = torch.sparse_coo_tensor(
+        torch.stack([row, col]),
+        torch.ones(row.numel(), dtype=torch.float64),
+        (num_nodes, num_nodes),
+    ).coalesce()
+    paths = torch.sparse.mm(adj, adj).coalesce()
+
+    path_key = paths.indices()[0] * num_nodes + paths.indices()[1]
+    edge_key = row * num_nodes + col
+    if path_key.numel():
+        pos = torch.searchsorted(path_key, edge_key).clamp(max=path_key.numel() - 1)
+        common = torch.where(path_key[pos] == edge_key, paths.values()[pos], 0.0)
+    else:
+        common = torch.zeros(edge_key.numel(), dtype=torch.float64)
+
+    twice_triangles = torch.zeros(num_nodes, dtype=torch.float64).index_add_(0, row, common)
+    deg = torch.bincount(row, minlength=num_nodes).double()
+    pairs = deg * (deg - 1)
+    return torch.where(pairs > 0, twice_triangles / pairs.clamp(min=1), 0.0)
+
+
+def _pagerank(row, col, node_ptr, alpha, tol, max_iter, strict=True):
+    # Batched power iteration mirroring ``nx.pagerank``: each graph has its own
+    # uniform teleport/dangling distribution and stops once its own l1 error
+    # drops below ``n * tol``; converged graphs are frozen.
+    num_nodes = int(node_ptr[-1])
+    sizes = node_ptr.diff()
+    batch = torch.repeat_interleave(torch.arange(sizes.numel()), sizes)
+    n = sizes.double()[batch]
+
+    out_degree = torch.bincount(row, minlength=num_nodes).double()
+    dangling = out_degree == 0
+    inv_out = torch.where(dangling, 0.0, 1.0 / out_degree.clamp(min=1))
+
+    x = 1.0 / n
+    # Empty graphs have nothing to converge (nx.pagerank returns {})
+    active = sizes > 0
+    if not active.any():
+        return x
+
+    for _ in range(max_iter):
+        spread = torch.zeros(num_nodes, dtype=torch.float64).index_add_(0, col, (x * inv_out)[row])
+        dangling_mass = torch.zeros(sizes.numel(), dtype=torch.float64).index_add_(
+            0, batch[dangling], x[dangling]
+        )
+        x_new = alpha * (spread + dangling_mass[batch] / n) + (1 - alpha) / n
+
+        err = torch.zeros(sizes.numel(), dtype=torch.float64).index_add_(0, batch, (x_new - x).abs())
+        x = torch.where(active[batch], x_new, x)
+        active &= ~(err < sizes.double() * tol)
+
+        if not active.any():
+            return x
+
+    if strict:
+        raise RuntimeError(f"PageRank failed to converge in {max_iter} iterations")
+    return x
+
+
+def _core_number(row, col, num_nodes):
+    # Batched peeling. The k-core decomposition of a disjoint union is the union
+    # of the per-graph decompositions, so a single global ``k`` is exact.
+    rowptr = counts_to_ptr(torch.bincount(row, minlength=num_nodes))
+    deg = rowptr.diff().clone()
+    core = torch.zeros(num_nodes, dtype=torch.long)
+    alive = torch.ones(num_nodes, dtype=torch.bool)
+
+    k = 0
+    while alive.any():
+        k = max(k, int(deg[alive].min()))
+        frontier = torch.nonzero(alive & (deg <= k)).flatten()
+
+        while frontier.numel():
+            core[frontier] = k
+            alive[frontier] = False
+
+            nbrs = col[gather_ranges(rowptr, frontier)]
+            nbrs = nbrs[alive[nbrs]]
+            deg -= torch.bincount(nbrs, minlength=num_nodes)
+
+            nbrs = nbrs.unique()
+            frontier = nbrs[deg[nbrs] <= k]
+
+    return core
+
+
+def gather_ranges(ptr, index):
+    """
+    Concatenation of ``arange(ptr[i], ptr[i + 1])`` for every ``i`` in
+    ``index`` (e.g. CSR positions of the edges leaving a set of nodes, or the
+    node rows of a set of graphs).
+    """
+    starts = ptr[index]
+    counts = ptr[index + 1] - starts
+    offsets = torch.repeat_interleave(starts - counts_to_ptr(counts)[:-1], counts)
+    return offsets + torch.arange(int(counts.sum()))
+
+
+# ----------------------------
+# NetworkX features over a packed dataset (optionally multi-process)
+# ----------------------------
+def compute_topological_features_packed(edge_index, node_ptr, edge_ptr, features_list,
+                                        num_workers=0, params=None):
+    """
+    Run ``compute_topological_features`` for every graph of a packed dataset
+    and return one ``[num_nodes, num_features]`` tensor in dataset order.
+
+    With ``num_workers > 1`` graphs are split into cost-balanced chunks over a
+    process pool. Inputs and the output buffer live in shared memory: workers
+    write their rows in place, so nothing per-graph is pickled back and the
+    result does not depend on scheduling order.
+    """
+    num_nodes = int(node_ptr[-1])
+    num_features = sum(f in features_list for f in FEATURE_ORDER)
+    arrays = {
+        "edge_index": edge_index.numpy(),
+        "node_ptr": node_ptr.numpy(),
+        "edge_ptr": edge_ptr.numpy(),
+        "out": np.zeros((num_nodes, num_features), dtype=np.float32),
+    }
+
+    num_graphs = node_ptr.numel() - 1
+    if num_workers <= 1 or num_graphs < 2:
+        _compute_chunk((0, num_graphs), arrays, features_list, params)
+        return torch.from_numpy(arrays["out"])
+
+    shms, specs = [], {}
+    try:
+        for key, array in arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shms.append(shm)
+            np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+            specs[key] = (shm.name, array.shape, array.dtype.str)
+
+        chunks = _balanced_chunks(node_ptr, edge_ptr, num_workers * 4)
+        with ProcessPoolExecutor(
+            num_workers, initializer=_init_worker, initargs=(specs, features_list, params)
+        ) as pool:
+            list(pool.map(_compute_chunk_in_worker, chunks))
+
+        out = np.ndarray((num_nodes, num_features), np.float32, buffer=shms[-1].buf).copy()
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    return torch.from_numpy(out)
+
+
+def _balanced_chunks(node_ptr, edge_ptr, num_chunks):
+    # Betweenness is O(n * m) per graph; split on cumulative estimated cost
+    cost = node_ptr.diff().double() * (edge_ptr.diff().double() + 1)
+    bounds = torch.searchsorted(
+        cost.cumsum(0), torch.linspace(0, float(cost.sum()), num_chunks + 1)[1:-1]
+    )
+    bounds = [0] + sorted(set(int(b) + 1 for b in bounds)) + [cost.numel()]
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if a < b]
+
+
+def _compute_chunk(bounds, arrays, features_list, params):
+    edge_index, node_ptr, edge_ptr, out = (
+        arrays["edge_index"], arrays["node_ptr"], arrays["edge_ptr"], arrays["out"]
+    )
+    for g in range(*bounds):
+        n0, n1 = int(node_ptr[g]), int(node_ptr[g + 1])
+        e0, e1 = int(edge_ptr[g]), int(edge_ptr[g + 1])
+        data = Data(edge_index=torch.from_numpy(edge_index[:, e0:e1] - n0), num_nodes=n1 - n0)
+        features = compute_topological_features(data, features_list, params)
+        if features is not None:
+            out[n0:n1] = features.numpy()
+
+
+_worker_state = {}
+
+
+def _init_worker(specs, features_list, params):
+    torch.set_num_threads(1)
+    _worker_state["shms"] = []
+    arrays = {}
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _worker_state["shms"].append(shm)
+        arrays[key] = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+    _worker_state["arrays"] = arrays
+    _worker_state["features_list"] = features_list
+    _worker_state["params"] = params
+
+
+def _compute_chunk_in_worker(bounds):
+    _compute_chunk(
+        bounds, _worker_state["arrays"], _worker_state["features_list"], _worker_state["params"]
+    )
+
+
+# ----------------------------
+# Consistency check against the reference
+# ----------------------------
+def check_against_reference(dataset, features_list):
+    """
+    Max absolute difference per feature between the tensor backend and
+    ``compute_topological_features`` over every graph of ``dataset``.
+    pagerank_fast is checked against ``nx.pagerank`` run with the same
+    tol/max_iter (its last iterate where NetworkX gives up at the cap).
+    """
+    features_list = [f for f in FEATURE_ORDER if f in features_list]
+    edge_index, node_ptr, _ = pack_graphs(dataset)
+    fast = compute_topological_features_batched(edge_index, node_ptr, features_list)
+    if fast is None:
+        return {}
+
+    reference = torch.cat(
+        [compute_topological_features(data, features_list) for data in dataset], dim=0
+    )
+    diff = (fast - reference).abs().max(dim=0).values
+    return {name: float(d) for name, d in zip(features_list, diff)}
+
+
+def approximation_error(dataset, params=None, sample_size=32, seed=0):
+    """
+    Compare each approximate feature with its exact counterpart on a random
+    sample of graphs. Returns ``{feature: {"max_abs", "mean_abs", "graphs"}}``.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    order = torch.randperm(len(dataset), generator=generator)[:sample_size]
+    sample = [dataset[int(i)] for i in order]
+
+    report = {}
+    for approx, exact in APPROXIMATIONS.items():
+        diff = torch.cat([
+            (compute_topological_features(data, [approx], params)
+             - compute_topological_features(data, [exact])).abs().flatten()
+            for data in sample
+        ])
+        report[approx] = {
+            "max_abs": float(diff.max()) if diff.numel() else 0.0,
+            "mean_abs": float(diff.mean()) if diff.numel() else 0.0,
+            "graphs": len(sample),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from torch_geometric.datasets import TUDataset
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", type=str, default="MUTAG")
+    parser.add_argument("--root", type=str, default="../data/TUDataset")
+    parser.add_argument("--atol", type=float, default=1e-5)
+    parser.add_argument("--approx", action="store_true",
+                        help="report approximation error instead of backend parity")
+    args = parser.parse_args()
+
+    dataset = TUDataset(root=args.root, name=args.name)
+
+    if args.approx:
+        for name, stats in approximation_error(dataset).items():
+            print(f"{name:<20} max={stats['max_abs']:.3e} mean={stats['mean_abs']:.3e} "
+                  f"(n={stats['graphs']} graphs)")
+    else:
+        for name, err in check_against_reference(dataset, sorted(TENSOR_FEATURES)).items():
+            status = "OK" if err <= args.atol else "MISMATCH"
+            print(f"{name:<12} max |tensor - networkx| = {err:.3e}  {status}")